@@ -0,0 +1,283 @@
+"""
+Aggregate Cube
+==============
+
+Precomputed aggregates of the cleaned dataset that the dashboard callbacks answer from.
+
+The callbacks only ever need counts, sums and rating quantiles grouped by a few
+low-cardinality columns. `AggregateCube` scans the raw rows once and keeps one cell
+per combination of its dimensions and the `Rating` value:
+
+- `apps`: number of apps in the cell,
+- `rating_count` / `rating_sum`: apps with a rating and the sum of their ratings,
+- `price_sum`: sum of prices of all apps,
+- `paid_apps` / `paid_price_sum`: apps with a non-zero price and the sum of their prices.
+
+`average_paid_price()` computes the same paid-price means straight from rows.
+
+The cells are built from the rows in memory, or by SQLite out of core when
+`QUERY_BACKEND` is `"sqlite"` (see `playstore.sqlstore`).
+
+Every filter on the dimensions and every grouping of them is then a small group-by
+over the cells, whose number does not depend on the number of rows. Results are
+memoized per query, so repeated requests are dictionary lookups. The filter values
+come from the clients, so only the `MEMO_SIZE` most recently used results are kept.
+
+Because the Play Store reports ratings with one decimal, keeping `Rating` in the cell
+key costs at most a few dozen cells per group, but it makes exact rating quantiles
+(for box plots) available for any filter without going back to the raw rows.
+
+New filter dimensions are added by listing them in `DIMENSIONS`.
+
+Modules and Dependencies
+------------------------
+- `collections`: The least recently used memoized results.
+- `numpy`: Numerical operations and array manipulations.
+- `pandas`: Data manipulation and analysis.
+- `playstore.config`: Configuration for the application.
+- `playstore.data`: Shared cleaned dataset and its snapshots.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from playstore.config import QUERY_BACKEND
+from playstore.data import current_snapshot, read_rows
+
+# Columns the cube can be filtered and grouped by
+DIMENSIONS = ("Category", "Type", "Content_Rating", "Genres", "Updated_Year")
+RATING = "Rating"
+MEASURES = ["apps", "rating_count", "rating_sum", "price_sum", "paid_apps", "paid_price_sum"]
+# Memoized query results kept per cube, the least recently used are dropped first
+MEMO_SIZE = 256
+
+
+def _weighted_quantile(values, counts, q):
+    """
+    Linearly interpolated `q` quantile of sorted `values` repeated `counts` times.
+
+    Gives the same result as `numpy.quantile` of the expanded values.
+    """
+    position = q * (counts.sum() - 1)
+    cumulative = np.cumsum(counts)
+    lower = values[np.searchsorted(cumulative, np.floor(position), side="right")]
+    upper = values[np.searchsorted(cumulative, np.ceil(position), side="right")]
+    return lower + (upper - lower) * (position - np.floor(position))
+
+
+def _box_stats(values, counts):
+    """
+    Box plot statistics of sorted rating `values` occurring `counts` times.
+
+    The whiskers reach the most extreme values within 1.5 IQR of the quartiles,
+    values outside of them are returned as outliers.
+    """
+    q1 = _weighted_quantile(values, counts, 0.25)
+    q3 = _weighted_quantile(values, counts, 0.75)
+    iqr = q3 - q1
+    inside = (values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)
+    return {
+        "q1": q1,
+        "median": _weighted_quantile(values, counts, 0.5),
+        "q3": q3,
+        "lowerfence": values[inside].min(),
+        "upperfence": values[inside].max(),
+        "outliers": values[~inside].tolist(),
+    }
+
+
+def average_paid_price(df, by="Category"):
+    """
+    Mean price of the paid apps in each `by` group of `df`, without modifying `df`.
+
+    Paid apps are rows with a non-zero price. The mean is the grouped sum of the
+    paid prices over the grouped count of the paid apps, the `paid_price_sum` and
+    `paid_apps` measures of the cube. Groups that only contain free apps get an
+    explicit 0.
+
+    Parameters:
+    -----------
+    - `df`: Rows with the `Price` column and the `by` column.
+    - `by`: Column to group by.
+
+    Returns:
+    --------
+    A Series of average prices indexed by the groups present in `df`, in sorted order.
+    """
+    price = df["Price"].astype("float64")
+    paid = price.where(price != 0)
+    groups = paid.groupby(df[by], observed=True, sort=True)
+    averages = groups.sum() / groups.count().replace(0, np.nan)
+    return averages.fillna(0.0).rename("Price").rename_axis(by)
+
+
+class AggregateCube:
+    """
+    Additive measures of the dataset per combination of `dimensions` and rating.
+
+    Build it with `AggregateCube.from_frame()` or use the shared one from `get_cube()`.
+    Filters are passed as keyword arguments, e.g. `cube.rollup(["Category"], Type="Free")`;
+    a filter value can be a single value or a list of accepted values.
+    """
+
+    def __init__(self, cells, dimensions=DIMENSIONS):
+        self.cells = cells
+        self.dimensions = tuple(dimensions)
+        self._memo = OrderedDict()
+
+    @classmethod
+    def from_frame(cls, df, dimensions=DIMENSIONS):
+        """
+        Scans the rows of `df` once and aggregates them into cube cells.
+        """
+        price = df["Price"]
+        paid = price > 0
+        rows = pd.DataFrame({name: df[name] for name in (*dimensions, RATING)}, copy=False).assign(
+            apps=1,
+            rating_count=df[RATING].notna().astype("int64"),
+            rating_sum=df[RATING].fillna(0.0),
+            price_sum=price,
+            paid_apps=paid.astype("int64"),
+            paid_price_sum=price.where(paid, 0.0),
+        )
+        cells = rows.groupby([*dimensions, RATING], observed=True, dropna=False)[MEASURES].sum()
+        return cls(cells.reset_index(), dimensions)
+
+    def _select(self, where):
+        cells = self.cells
+        for name, value in where:
+            if isinstance(value, tuple):
+                cells = cells[cells[name].isin(value)]
+            else:
+                cells = cells[cells[name] == value]
+        return cells
+
+    def _memoized(self, kind, by, where, compute):
+        where = tuple(sorted(
+            (name, tuple(value) if isinstance(value, (list, tuple, set)) else value)
+            for name, value in where.items()
+        ))
+        for name, _ in where:
+            if name not in self.dimensions:
+                raise KeyError(f"'{name}' is not a dimension of the cube")
+        key = (kind, tuple(by), where)
+        result = self._memo.get(key)
+        if result is None:
+            result = self._memo[key] = compute(self._select(where))
+            # without a lock, so another thread may have dropped the entries already
+            while len(self._memo) > MEMO_SIZE:
+                try:
+                    self._memo.popitem(last=False)
+                except KeyError:
+                    break
+        else:
+            try:
+                self._memo.move_to_end(key)
+            except KeyError:
+                pass
+        return result if isinstance(result, AggregateCube) else result.copy(deep=False)
+
+    def slice(self, **where):
+        """
+        Returns the sub-cube of the cells matching `where`.
+
+        Slices are memoized, so all queries of one filter selection share a single
+        filtered view and its memoized rollups.
+        """
+        return self._memoized("slice", (), where, lambda cells: AggregateCube(cells, self.dimensions))
+
+    def rollup(self, by=(), **where):
+        """
+        Sums the measures of the cells matching `where`, grouped by the `by` dimensions.
+
+        Parameters:
+        -----------
+        - `by`: Dimensions to group by, an empty sequence gives a single total row.
+        - `where`: Filters on dimensions, `name=value` or `name=[values]`.
+
+        Returns:
+        --------
+        A DataFrame indexed by `by` with the summed `MEASURES` and the derived
+        `avg_rating` and `avg_paid_price` columns. `avg_paid_price` is 0 for groups
+        without paid apps, `avg_rating` is NaN for groups without ratings.
+        """
+        def compute(cells):
+            if by:
+                table = cells.groupby(list(by), observed=True)[MEASURES].sum()
+            else:
+                table = cells[MEASURES].sum().to_frame().T
+            return table.assign(
+                avg_rating=table["rating_sum"] / table["rating_count"].replace(0, np.nan),
+                avg_paid_price=(table["paid_price_sum"] / table["paid_apps"].replace(0, np.nan)).fillna(0.0),
+            )
+        return self._memoized("rollup", by, where, compute)
+
+    def totals(self, **where):
+        """
+        Returns the `rollup()` of all cells matching `where` as a single Series.
+        """
+        return self.rollup((), **where).iloc[0]
+
+    def rating_quantiles(self, by, **where):
+        """
+        Computes box plot statistics of the ratings of each `by` group.
+
+        Parameters:
+        -----------
+        - `by`: Dimension to group by.
+        - `where`: Filters on dimensions, `name=value` or `name=[values]`.
+
+        Returns:
+        --------
+        A DataFrame indexed by `by` with the `q1`, `median`, `q3`, `lowerfence`
+        and `upperfence` columns and the list of distinct `outliers`.
+        """
+        def compute(cells):
+            ratings = cells[cells[RATING].notna()].groupby([by, RATING], observed=True)["apps"].sum()
+            stats = {
+                group: _box_stats(counts.index.get_level_values(RATING).to_numpy(), counts.to_numpy())
+                for group, counts in ratings.groupby(level=by, observed=True)
+            }
+            return pd.DataFrame.from_dict(stats, orient="index").rename_axis(by)
+        return self._memoized("quantiles", (by,), where, compute)
+
+
+def _build_cube(snapshot):
+    if QUERY_BACKEND == "sqlite":
+        from playstore.sqlstore import cube_cells
+
+        return AggregateCube(cube_cells(snapshot))
+    return AggregateCube.from_frame(snapshot.frame)
+
+
+def cube_for(snapshot):
+    """
+    Returns the `AggregateCube` of the dataset `snapshot`, building it on first use.
+    """
+    return snapshot.derived("cube", _build_cube)
+
+
+def get_cube():
+    """
+    Returns the `AggregateCube` of the shared dataset, building it on first use.
+    """
+    return cube_for(current_snapshot())
+
+
+def paid_price_by_category(**where):
+    """
+    Mean price of the paid apps per category of the shared dataset, 0 for categories without any.
+
+    With the pandas backend the means are computed from the rows matching `where`
+    by `average_paid_price()`. With the sqlite backend they come from the sums of
+    the cube, so no rows are read.
+
+    Parameters:
+    -----------
+    - `where`: Filters on `Category` and `Type`, `name=value` or `name=[values]`.
+    """
+    if QUERY_BACKEND == "sqlite":
+        return get_cube().rollup(["Category"], **where)["avg_paid_price"].rename("Price")
+    return average_paid_price(read_rows(["Category", "Price"], **where))
@@ -0,0 +1,345 @@
+"""
+Benchmark Suite
+===============
+
+Times the dashboard end to end at several dataset sizes and compares runs.
+
+For every size, a synthetic dataset with that many rows is generated from the cleaned
+one (seeded, see `playstore.synthetic`) into `CACHE_DIR/benchmark` on first use, and
+the suite times:
+
+- `load.csv` and `load.cache`: parsing the CSV into the schema and mapping the
+  columnar cache, see `playstore.data.read_dataset()`,
+- `build.*`: the aggregate cube, the rating histograms, the filter index and the
+  search index built from the loaded frame,
+- `callback.*.compute` and `callback.*.serialize`: every callback of the pages,
+  called for a few typical inputs on the copy (see `playstore.data.pinned()`),
+  bypassing the figure cache, and the JSON serialization of its results as Dash
+  sends them.
+
+Once per run it also times the model: `model.load`, `model.single` (one app) and
+`model.batch` (one chunk of `playstore.predict.CHUNK_SIZE` apps). The
+`model.crossover.forest` and `model.crossover.sklearn` pair times the compiled and
+the pickled forest on `FOREST_MAX_ROWS` apps, the largest batch the compiled one
+scores. If the compiled forest is the slower one there, the cutoff is past the
+crossover; the command then fails with status 1, as for the regressions below.
+
+Every benchmark runs up to `repeat` times, fewer when it takes longer than `budget`
+seconds in total, and records its best and median time. The results are written as
+JSON with the environment of the run. Against a `--baseline` run, a benchmark whose
+best time grew by more than `--threshold` and by more than `--min-delta` seconds,
+which keeps the noise of sub-millisecond benchmarks out, is flagged as a regression
+and the command exits with status 1:
+
+```bash
+python -m playstore.benchmark --output baseline.json
+python -m playstore.benchmark --sizes 10k,1m --baseline baseline.json --output current.json
+```
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `sys`: The registered page modules and the exit status.
+- `json`: Reading and writing the results.
+- `time`: Timing the benchmarks.
+- `inspect`: Unwrapping the cached callbacks.
+- `argparse`: Command line interface.
+- `platform`: Describing the machine of a run.
+- `statistics`: Median times.
+- `subprocess`: The commit of a run.
+- `datetime`: Time of a run.
+- `pandas`: Sampling the apps of the model benchmarks.
+- `playstore.aggregates`: The aggregate cube.
+- `playstore.cache`: The columnar cache.
+- `playstore.config`: Configuration for the application.
+- `playstore.data`: Loading the dataset and pinning its snapshots.
+- `playstore.histograms`: The rating histograms.
+- `playstore.indexes`: The filter index.
+- `playstore.main`: The app with its pages.
+- `playstore.predict`: The prediction model.
+- `playstore.search`: The search index.
+- `playstore.synthetic`: Generating the scaled datasets.
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from playstore import cache
+from playstore.aggregates import AggregateCube
+from playstore.config import CACHE_DIR, FOREST_MAX_ROWS, PROJECT_ROOT, QUERY_BACKEND
+from playstore.data import CLEAN_DATA_FILE, pinned, read_csv_dataset, take_snapshot
+from playstore.histograms import RatingHistograms
+from playstore.indexes import FilterIndex
+from playstore.search import SearchIndex
+from playstore.synthetic import write_dataset
+
+BENCHMARK_DIR = os.path.join(CACHE_DIR, "benchmark")
+SIZES = ("10k", "1m", "10m")
+SEED = 42
+UNITS = {"k": 10 ** 3, "m": 10 ** 6}
+
+# Callbacks of the pages and the inputs they are called with
+CALLBACKS = {
+    "category_analysis": ("pages.category-analysis", "update_category_analysis", [("all",), ("Free",), ("Paid",)]),
+    "distribution_stats": ("pages.average-distribution", "update_stats", [(None, "all"), ("GAME", "Paid")]),
+    "rating_distribution": (
+        "pages.average-distribution", "update_user_ratings_distribution", [(None, "all"), ("GAME", "Paid")],
+    ),
+    "app_search": ("pages.app-search", "update_search_results", [("facebook",), ("photo edtor",)]),
+    "prediction": ("pages.prediction", "make_prediction", [(1, 1500, 50000, 17)]),
+}
+
+
+def parse_size(size):
+    """
+    Converts a size like `10k` or `1m` into a number of rows.
+    """
+    size = size.strip().lower()
+    if size[-1:] in UNITS:
+        return int(float(size[:-1]) * UNITS[size[-1]])
+    return int(size)
+
+
+def scaled_dataset(rows, source=CLEAN_DATA_FILE, seed=SEED, directory=BENCHMARK_DIR):
+    """
+    Returns a CSV file of `rows` synthetic rows learned from the cleaned CSV `source`, writing it on first use.
+
+    The rows are generated by `playstore.synthetic` from `seed`, so the same
+    arguments always give the same file and memory stays bounded.
+    """
+    path = os.path.join(directory, f"{os.path.splitext(os.path.basename(source))[0]}.synthetic.{rows}.{seed}.csv")
+    if not os.path.exists(path):
+        write_dataset(path, rows, source, seed)
+    return path
+
+
+def measure(func, repeat=5, budget=2.0):
+    """
+    Calls `func` up to `repeat` times, stopping early once the calls took `budget` seconds.
+
+    Returns:
+    --------
+    A dict with the `best` and `median` seconds and the number of `runs`.
+    """
+    seconds = []
+    while len(seconds) < repeat and (not seconds or sum(seconds) < budget):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return {"best": min(seconds), "median": statistics.median(seconds), "runs": len(seconds)}
+
+
+def benchmark_size(rows, repeat=5, budget=2.0):
+    """
+    Times loading, building and the page callbacks on a dataset of `rows` rows.
+
+    Returns:
+    --------
+    A dict of the results of `measure()` by benchmark name.
+    """
+    from plotly.io.json import to_json_plotly
+
+    import playstore.main  # noqa: F401, registers the pages
+
+    path = scaled_dataset(rows)
+    signature = cache.source_signature(path)
+    parsed = []
+
+    def parse():
+        parsed.clear()
+        parsed.append(read_csv_dataset(path))
+
+    results = {"load.csv": measure(parse, repeat, budget)}
+    if cache.load_cache(path) is None:
+        cache.write_cache(parsed[0], path, signature=signature)
+    parsed.clear()
+    results["load.cache"] = measure(lambda: cache.load_cache(path), repeat, budget)
+
+    snapshot = take_snapshot(path)
+    frame = snapshot.frame
+    cube = AggregateCube.from_frame(frame)
+    results["build.cube"] = measure(lambda: AggregateCube.from_frame(frame), repeat, budget)
+    results["build.histograms"] = measure(lambda: RatingHistograms.from_cube(cube), repeat, budget)
+    results["build.filters"] = measure(lambda: FilterIndex(frame), repeat, budget)
+    results["build.search"] = measure(lambda: SearchIndex.from_frame(frame), repeat, budget)
+
+    with pinned(snapshot):
+        for name, (module, function, inputs) in CALLBACKS.items():
+            # the undecorated function, so the figure cache is not involved
+            func = inspect.unwrap(getattr(sys.modules[module], function))
+            outputs = [func(*args) for args in inputs]
+            results[f"callback.{name}.compute"] = measure(lambda: [func(*args) for args in inputs], repeat, budget)
+            results[f"callback.{name}.serialize"] = measure(lambda: [to_json_plotly(output) for output in outputs], repeat, budget)
+    return results
+
+
+def benchmark_model(repeat=5, budget=2.0):
+    """
+    Times loading the model, predicting one app and one chunk of apps, and both forests at the crossover.
+
+    Returns:
+    --------
+    A dict of the results of `measure()` by benchmark name, empty if the model is not available.
+    """
+    from playstore.predict import (
+        CATEGORY_MAPPING, CHUNK_SIZE, FEATURES, estimator_manager, load_model, model_manager, predict_batch,
+        validate_batch,
+    )
+
+    try:
+        results = {"model.load": measure(load_model, repeat, budget)}
+        model_manager.get()
+    except OSError as e:
+        print(f"Skipping the model benchmarks: {e}", file=sys.stderr)
+        return {}
+    try:
+        # loaded ahead, so `model.batch` does not time its load
+        estimator = estimator_manager.get()
+    except OSError as e:
+        print(f"Skipping the crossover benchmarks: {e}", file=sys.stderr)
+        estimator = None
+
+    sample = pd.read_csv(CLEAN_DATA_FILE, usecols=["Reviews", "Installs", "Category"]).sample(
+        n=CHUNK_SIZE, replace=True, random_state=SEED,
+    )
+    # the model only accepts positive counts
+    sample[["Reviews", "Installs"]] = sample[["Reviews", "Installs"]].clip(lower=1)
+    sample = sample[sample["Category"].isin(list(CATEGORY_MAPPING))]
+    results["model.single"] = measure(lambda: predict_batch([1500], [50000], ["GAME"]), repeat, budget)
+    results["model.batch"] = measure(
+        lambda: predict_batch(sample["Reviews"], sample["Installs"], sample["Category"]), repeat, budget,
+    )
+    if estimator is None:
+        return results
+
+    crossover = sample.iloc[:FOREST_MAX_ROWS]
+    inputs = pd.DataFrame(
+        dict(zip(FEATURES, validate_batch(crossover["Reviews"], crossover["Installs"], crossover["Category"])))
+    )
+    forest = model_manager.get()
+    features = inputs[forest.feature_names_in_].to_numpy(dtype="float32")
+    results["model.crossover.forest"] = measure(lambda: forest.predict(features), repeat, budget)
+    results["model.crossover.sklearn"] = measure(
+        lambda: estimator.predict(inputs[estimator.feature_names_in_]), repeat, budget,
+    )
+    return results
+
+
+def _commit():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run(sizes=SIZES, repeat=5, budget=2.0):
+    """
+    Runs the suite for every dataset size of `sizes` and the model benchmarks.
+
+    Returns:
+    --------
+    A dict with the `environment` of the run and its `results`, the results of
+    `measure()` by `<size>/<benchmark>` (`model/<benchmark>` for the model).
+    """
+    results = {}
+    for size in sizes:
+        for name, result in benchmark_size(parse_size(size), repeat, budget).items():
+            results[f"{size}/{name}"] = result
+    for name, result in benchmark_model(repeat, budget).items():
+        results[f"model/{name.removeprefix('model.')}"] = result
+    return {
+        "environment": {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "query_backend": QUERY_BACKEND,
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=0.25, min_delta=0.0005):
+    """
+    Compares the best times of the `results` of `run()` with those of a `baseline` run.
+
+    Returns:
+    --------
+    A dict by benchmark name, for the benchmarks of both runs, with the `ratio` of
+    the best times and whether it is a `regression`, slower by more than the share
+    `threshold` and by more than `min_delta` seconds.
+    """
+    comparison = {}
+    for name, result in results["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["best"] / before["best"] if before["best"] else float("inf")
+        slower = result["best"] - before["best"]
+        comparison[name] = {"ratio": ratio, "regression": ratio > 1 + threshold and slower > min_delta}
+    return comparison
+
+
+def main(argv=None):
+    """
+    Command line entry point that runs the benchmark suite.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark loading, aggregation, rendering and inference.")
+    parser.add_argument("--sizes", default=",".join(SIZES), help="comma separated dataset sizes, e.g. 10k,1m,10m")
+    parser.add_argument("--repeat", type=int, default=5, help="maximum runs of every benchmark")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds after which a benchmark is not repeated")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="slowdown flagged as a regression, 0.25 for 25%%")
+    parser.add_argument("--min-delta", type=float, default=0.0005, help="smallest slowdown in seconds flagged as a regression")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = run([size.strip() for size in args.sizes.split(",") if size.strip()], args.repeat, args.budget)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    comparison = compare(results, baseline, args.threshold, args.min_delta) if baseline else {}
+    for name, result in results["results"].items():
+        line = f"{name:<45} best {result['best'] * 1000:10.2f} ms  median {result['median'] * 1000:10.2f} ms"
+        if name in comparison:
+            line += f"  {comparison[name]['ratio']:6.2f}x"
+            if comparison[name]["regression"]:
+                line += "  REGRESSION"
+        print(line)
+
+    failed = False
+    regressions = [name for name, change in comparison.items() if change["regression"]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+        failed = True
+    forest, sklearn = (results["results"].get(f"model.crossover.{name}") for name in ("forest", "sklearn"))
+    if forest and sklearn and forest["best"] > sklearn["best"]:
+        print(f"The compiled forest is slower than sklearn on {FOREST_MAX_ROWS} apps, lower FOREST_MAX_ROWS", file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
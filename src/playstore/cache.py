@@ -0,0 +1,278 @@
+"""
+Columnar Dataset Cache
+======================
+
+Binary, column-per-file cache of the cleaned dataset that loads with memory mapping.
+
+Parsing the cleaned CSV as text dominates the cold start and every worker process
+ends up holding its own parsed copy. The cache stores each column as a plain `.npy`
+file instead:
+
+- numeric and date columns as fixed-width arrays,
+- text columns dictionary encoded, as an integer codes array plus a JSON list of values.
+
+Loading maps the arrays read-only with `numpy.load(mmap_mode="r")`, so no parsing
+happens and forked Dash workers share the same physical pages through the OS page
+cache. Columns typed as `category` are rebuilt from the mapped codes without copying,
+other text columns are decoded into strings.
+
+The cache lives in `CACHE_DIR`, next to `CLEAN_DATA_DIR`, one directory per source
+file. Its `manifest.json` records the size and modification time of the source CSV;
+a cache whose manifest does not match the current source is treated as missing,
+so it is rebuilt automatically after the CSV changes. The signature is taken
+before the CSV is parsed and checked again before the manifest is written, so a
+CSV replaced during the parse is never cached under its new signature.
+
+Build it ahead of deployment with:
+
+```bash
+python -m playstore.cache
+```
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `json`: Reading and writing the manifest and the dictionaries.
+- `argparse`: Command line interface of the build step.
+- `numpy`: Fixed-width column arrays and memory mapping.
+- `pandas`: Data manipulation and analysis.
+- `playstore.config`: Configuration for the application.
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from playstore.config import CACHE_DIR
+
+FORMAT_VERSION = 3
+MANIFEST_FILE = "manifest.json"
+
+
+def cache_dir_for(source):
+    """
+    Returns the cache directory used for the CSV file `source`.
+    """
+    return os.path.join(CACHE_DIR, os.path.splitext(os.path.basename(source))[0])
+
+
+def source_signature(source):
+    """
+    Returns the size and modification time of `source`, used to detect changes.
+    """
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _code_dtype(size):
+    """
+    Returns the narrowest signed integer type for codes of `size` values, -1 marks missing.
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if size <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _replace_file(path, write):
+    """
+    Writes a file through `write(tmp_path)` and atomically moves it to `path`.
+
+    Workers that already mapped the previous file keep reading the old inode.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def save_array(path, array):
+    """
+    Atomically writes `array` as an `.npy` file to `path`.
+    """
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+    _replace_file(path, write)
+
+
+def save_json(path, obj):
+    """
+    Atomically writes `obj` as a JSON file to `path`.
+    """
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+    _replace_file(path, write)
+
+
+def write_columns(df, directory):
+    """
+    Writes every column of `df` into `directory` in the cache format.
+
+    Returns:
+    --------
+    The list of column descriptions to record in a manifest, for `read_columns()`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            values = series.cat.categories.tolist()
+            kind = "category"
+        elif pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+            save_array(os.path.join(directory, f"{name}.npy"), series.to_numpy())
+            columns.append({"name": name, "kind": "numeric"})
+            continue
+        else:
+            codes, uniques = pd.factorize(series, sort=True)
+            codes = codes.astype(_code_dtype(len(uniques)))
+            values = uniques.tolist()
+            kind = "str"
+
+        save_array(os.path.join(directory, f"{name}.codes.npy"), codes)
+        save_json(os.path.join(directory, f"{name}.values.json"), values)
+        columns.append({"name": name, "kind": kind})
+    return columns
+
+
+def read_columns(directory, columns, names=None):
+    """
+    Loads the columns written by `write_columns()` as a DataFrame backed by memory-mapped arrays.
+
+    Parameters:
+    -----------
+    - `directory`: Directory the columns were written to.
+    - `columns`: Column descriptions returned by `write_columns()`.
+    - `names`: Names of the columns to load, all of them by default.
+    """
+    def load(file_name):
+        # plain ndarray view of the mapping, so the memmap subclass does not leak into pandas
+        return np.load(os.path.join(directory, file_name), mmap_mode="r").view(np.ndarray)
+
+    data = {}
+    for column in columns:
+        name = column["name"]
+        if names is not None and name not in names:
+            continue
+        if column["kind"] == "numeric":
+            data[name] = load(f"{name}.npy")
+            continue
+
+        codes = load(f"{name}.codes.npy")
+        with open(os.path.join(directory, f"{name}.values.json"), encoding="utf-8") as f:
+            values = pd.Index(json.load(f), dtype="str")
+        if column["kind"] == "category":
+            data[name] = pd.Categorical.from_codes(codes, categories=values)
+        else:
+            data[name] = values.take(codes, allow_fill=True, fill_value=np.nan)
+    return pd.DataFrame(data, copy=False)
+
+
+def write_cache(df, source, cache_dir=None, signature=None):
+    """
+    Writes `df` as a columnar cache for the CSV file `source`.
+
+    The cache is only written if `source` still has the `signature` it had before
+    `df` was read from it. A source replaced while it was being parsed (e.g. by
+    `playstore.ingest`) would otherwise leave the old rows cached under the new
+    file's signature, and the stale cache would never be rebuilt.
+
+    Parameters:
+    -----------
+    - `df`: Typed DataFrame read from `source`.
+    - `source`: Path to the CSV file the frame was read from.
+    - `cache_dir`: Target directory, defaults to `cache_dir_for(source)`.
+    - `signature`: `source_signature()` of `source` taken before reading `df`,
+      defaults to the current one.
+
+    Returns:
+    --------
+    The cache directory, or `None` if `source` changed since `df` was read.
+    """
+    cache_dir = cache_dir or cache_dir_for(source)
+    signature = signature or source_signature(source)
+    if source_signature(source) != signature:
+        return None
+    columns = write_columns(df, cache_dir)
+
+    # the manifest is written last, so a half written cache is never considered fresh
+    if source_signature(source) != signature:
+        return None
+    save_json(os.path.join(cache_dir, MANIFEST_FILE), {
+        "format": FORMAT_VERSION,
+        "source": os.path.abspath(source),
+        "signature": signature,
+        "rows": len(df),
+        "columns": columns,
+    })
+    return cache_dir
+
+
+def read_manifest(source, cache_dir=None):
+    """
+    Returns the manifest of a fresh cache for `source`, or `None` if the cache is
+    missing, written by another format version or older than the source file.
+    """
+    path = os.path.join(cache_dir or cache_dir_for(source), MANIFEST_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("format") != FORMAT_VERSION:
+        return None
+    if manifest.get("signature") != source_signature(source):
+        return None
+    return manifest
+
+
+def load_cache(source, cache_dir=None):
+    """
+    Loads the cached columns of `source` as a DataFrame backed by memory-mapped arrays.
+
+    Parameters:
+    -----------
+    - `source`: Path to the CSV file the cache was built from.
+    - `cache_dir`: Cache directory, defaults to `cache_dir_for(source)`.
+
+    Returns:
+    --------
+    The DataFrame, or `None` if there is no fresh cache for `source`.
+    """
+    cache_dir = cache_dir or cache_dir_for(source)
+    manifest = read_manifest(source, cache_dir)
+    if manifest is None:
+        return None
+    return read_columns(cache_dir, manifest["columns"])
+
+
+def main(argv=None):
+    """
+    Command line entry point that (re)builds the cache of the cleaned dataset.
+    """
+    from playstore.data import CLEAN_DATA_FILE, read_csv_dataset
+
+    parser = argparse.ArgumentParser(description="Build the columnar cache of the cleaned dataset.")
+    parser.add_argument("--source", default=CLEAN_DATA_FILE, help="cleaned CSV file")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the cache is fresh")
+    args = parser.parse_args(argv)
+
+    if not args.force and read_manifest(args.source) is not None:
+        print(f"Cache for {args.source} is up to date.")
+        return
+    signature = source_signature(args.source)
+    cache_dir = write_cache(read_csv_dataset(args.source), args.source, signature=signature)
+    if cache_dir is None:
+        print(f"{args.source} changed while it was read, run the build again.")
+        return
+    print(f"Cache written to: {cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,28 @@ import os.path
 PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
 RAW_DATA_DIR = os.path.join(PROJECT_ROOT, "data", "raw")
 CLEAN_DATA_DIR = os.path.join(PROJECT_ROOT, "data", "cleaned")
-MODEL_DIR = os.path.join(PROJECT_ROOT, "data", "model")
\ No newline at end of file
+MODEL_DIR = os.path.join(PROJECT_ROOT, "data", "model")
+CACHE_DIR = os.path.join(PROJECT_ROOT, "data", "cache")
+FIGURE_CACHE_FILE = os.path.join(CACHE_DIR, "figures.sqlite")
+FIGURE_CACHE_SIZE = 512
+# Seconds a worker batches the LRU touches and hit counts of the figure cache before writing them
+FIGURE_CACHE_FLUSH_INTERVAL = 5
+# Start loading the prediction model on a background thread when the app starts
+MODEL_WARM_UP = True
+# Largest batch scored by the NumPy forest, larger ones by the pickled sklearn forest,
+# which is faster from about a thousand rows on (see `model.crossover.*` of playstore.benchmark)
+FOREST_MAX_ROWS = 1000
+# Seconds between checks of the cleaned dataset for a new version, 0 disables the reload
+DATA_RELOAD_INTERVAL = 5
+# Engine the dashboard aggregations run on: "pandas" keeps the rows in memory,
+# "sqlite" aggregates them out of core in an indexed SQLite copy of the dataset
+QUERY_BACKEND = "pandas"
+# Request, callback, cache, data load and model metrics served on /metrics
+METRICS_ENABLED = True
+# Directory where every process shares its metrics, written every METRICS_INTERVAL seconds
+METRICS_DIR = os.path.join(CACHE_DIR, "metrics")
+METRICS_INTERVAL = 5
+# Allow switching the sampling profiler of all workers on and off with POST /profile/start and /profile/stop
+PROFILER_TOGGLE = False
+# Seconds between two stack samples of the running profiler
+PROFILER_INTERVAL = 0.01
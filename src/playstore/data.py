@@ -0,0 +1,456 @@
+"""
+Shared Dataset
+==============
+
+Loads the cleaned Google Play Store dataset exactly once per process and hands
+every Dash page the same typed DataFrame.
+
+Pages must not call `pd.read_csv` themselves. They call `get_dataset()`, which
+parses the CSV on first use and afterwards returns a cheap read-only view of the
+already loaded frame. With pandas Copy-on-Write enabled, any modification made
+through such a view stays local to the caller and never leaks into the shared copy.
+
+The frame is loaded from the memory-mapped columnar cache (see `playstore.cache`)
+whenever a fresh one exists. Otherwise the CSV is parsed and the cache is written
+for the next process.
+
+The time and memory spent on the load are kept in `LoadStats` and logged, so the
+saving per worker process can be checked when running many workers. `LoadStats`
+also carries a version hash of the loaded source, which caches of derived results
+use in their keys (see `dataset_version()`).
+
+A version of the CSV, its frame (read on first access), its `LoadStats` and
+everything derived from it (the aggregate cube, the rating histograms) form one
+immutable `Snapshot`. `reloader` polls the version of the cleaned CSV on a
+background thread and, once a new version has settled, loads it into a new
+snapshot, builds the same derived results for it and then swaps it in with a
+single assignment. The running app picks up new data without a restart, and
+callbacks that pinned the previous snapshot (see `pinned()`) finish on it. The
+locks of the module and of the current snapshot are replaced in forked workers,
+so a worker forked while the reloader of its parent held them does not deadlock.
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `sys`: Platform of the peak memory units.
+- `json`: Serializing the source signature for the version hash.
+- `hashlib`: Hashing the dataset version.
+- `time`: Measuring the load time.
+- `logging`: Reporting load statistics.
+- `resource`: Peak memory of the process around a reload.
+- `threading`: Guarding the one-time load and running the reload thread.
+- `contextlib`: The snapshot pinning context manager.
+- `pandas`: Data manipulation and analysis.
+- `playstore.cache`: Memory-mapped columnar cache of the dataset.
+- `playstore.config`: Configuration for the application.
+- `playstore.indexes`: Filter index of the loaded frame.
+- `playstore.metrics`: Load time metrics of the frame and the derived results.
+- `playstore.schema`: Declared column types of the loaded frame.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import time
+import logging
+import resource
+import threading
+import contextlib
+from dataclasses import dataclass
+
+import pandas as pd
+
+from playstore import cache
+from playstore.config import CLEAN_DATA_DIR, DATA_RELOAD_INTERVAL
+from playstore.indexes import filter_index_for
+from playstore.metrics import DATA_LOAD_SECONDS
+from playstore.schema import CSV_DTYPES, apply_schema
+
+logger = logging.getLogger(__name__)
+
+if int(pd.__version__.split(".")[0]) < 3:
+    # pandas >= 3 always uses Copy-on-Write, older versions need to opt in
+    pd.set_option("mode.copy_on_write", True)
+
+CLEAN_DATA_FILE = os.path.join(CLEAN_DATA_DIR, "cleaned_googleplaystore.csv")
+
+
+@dataclass(frozen=True)
+class LoadStats:
+    """
+    Statistics collected while loading the dataset.
+
+    Attributes:
+    -----------
+    - `source`: Path of the loaded CSV file or cache directory.
+    - `rows`: Number of loaded rows.
+    - `seconds`: Wall time spent loading and typing the data.
+    - `memory_bytes`: Deep memory usage of the loaded DataFrame.
+    - `version`: Hash of the size and modification time of the source CSV and of its
+      ingestion version (see `playstore.ingest`).
+    """
+    source: str
+    rows: int
+    seconds: float
+    memory_bytes: int
+    version: str
+
+
+def read_csv_dataset(path=CLEAN_DATA_FILE):
+    """
+    Parses the cleaned CSV file at `path` into the declared schema, see `playstore.schema`.
+    """
+    return apply_schema(pd.read_csv(path, dtype=CSV_DTYPES))
+
+
+def read_dataset(path=CLEAN_DATA_FILE):
+    """
+    Reads the cleaned dataset, preferring the memory-mapped columnar cache.
+
+    A missing or stale cache is rebuilt from the CSV. If the cache directory is not
+    writable the parsed frame is returned as is.
+
+    Parameters:
+    -----------
+    - `path`: Path to the cleaned CSV file.
+
+    Returns:
+    --------
+    A tuple of the typed DataFrame and the path it was loaded from.
+    Use `get_dataset()` to get the shared copy instead.
+    """
+    df = cache.load_cache(path)
+    if df is not None:
+        return df, cache.cache_dir_for(path)
+
+    signature = cache.source_signature(path)
+    df = read_csv_dataset(path)
+    try:
+        cache.write_cache(df, path, signature=signature)
+    except OSError as e:
+        logger.warning("Could not write the dataset cache: %s", e)
+    return df, path
+
+
+def source_version(path):
+    """
+    Hash of the signature of the cleaned CSV at `path` and of its ingestion version.
+    """
+    from playstore.ingest import store_version
+
+    signature = {"source": cache.source_signature(path), "ingest": store_version(path)}
+    return hashlib.sha1(json.dumps(signature, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class Snapshot:
+    """
+    One version of the dataset together with the results derived from it.
+
+    The frame is read on first access, so a snapshot whose results all come from
+    another backend (see `playstore.sqlstore`) never holds the rows in memory.
+
+    Attributes:
+    -----------
+    - `path`: The cleaned CSV file.
+    - `signature`: Size and modification time of the CSV when the snapshot was taken.
+    - `version`: Version hash of the CSV, see `dataset_version()`.
+    - `stats`: `LoadStats` of the frame, `None` until it is read.
+    """
+
+    def __init__(self, path, signature, version):
+        self.path = path
+        self.signature = signature
+        self.version = version
+        self.stats = None
+        self._frame = None
+        self._derived = {}
+        self._builders = {}
+        # reentrant, builders may ask for the frame or other derived results of the same snapshot
+        self._lock = threading.RLock()
+
+    @property
+    def frame(self):
+        """
+        The typed DataFrame, read on first access and never modified.
+        """
+        if self._frame is None:
+            with self._lock:
+                if self._frame is None:
+                    self._frame, self.stats = _read_frame(self.path, self.version)
+        return self._frame
+
+    def derived(self, name, build):
+        """
+        Returns the result `name` derived from this snapshot, building it with `build(snapshot)` on first use.
+        """
+        if name not in self._derived:
+            with self._lock:
+                if name not in self._derived:
+                    with DATA_LOAD_SECONDS.time(name):
+                        self._derived[name] = build(self)
+                    self._builders[name] = build
+        return self._derived[name]
+
+    def derive_like(self, other):
+        """
+        Reads the frame if `other` has read it and builds every derived result `other` has built so far.
+        """
+        if other._frame is not None:
+            self.frame
+        for name, build in list(other._builders.items()):
+            self.derived(name, build)
+
+
+def _read_frame(path, version):
+    """
+    Reads the cleaned dataset at `path`, returning the frame and its `LoadStats`.
+    """
+    start = time.perf_counter()
+    df, source = read_dataset(path)
+    seconds = time.perf_counter() - start
+    DATA_LOAD_SECONDS.observe(seconds, "frame")
+    stats = LoadStats(
+        source=source,
+        rows=len(df),
+        seconds=seconds,
+        memory_bytes=int(df.memory_usage(deep=True).sum()),
+        version=version,
+    )
+    logger.info(
+        "Loaded %s rows from %s in %.3f s (%.1f MiB)",
+        stats.rows, stats.source, stats.seconds, stats.memory_bytes / 2 ** 20
+    )
+    return df, stats
+
+
+def take_snapshot(path=CLEAN_DATA_FILE):
+    """
+    Returns a new `Snapshot` of the current version of the cleaned CSV at `path`.
+    """
+    return Snapshot(path, cache.source_signature(path), source_version(path))
+
+
+_lock = threading.Lock()
+_snapshot = None
+_pinned = threading.local()
+
+
+def _after_fork():
+    # the reloader of the parent may hold the locks while it forks, the child gets them released
+    global _lock
+
+    _lock = threading.Lock()
+    if _snapshot is not None:
+        _snapshot._lock = threading.RLock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def current_snapshot():
+    """
+    Returns the snapshot pinned by the calling thread, or else the latest one, loading it on first use.
+    """
+    global _snapshot
+
+    snapshot = getattr(_pinned, "snapshot", None)
+    if snapshot is not None:
+        return snapshot
+    if _snapshot is None:
+        with _lock:
+            if _snapshot is None:
+                _snapshot = take_snapshot()
+    return _snapshot
+
+
+@contextlib.contextmanager
+def pinned(snapshot=None):
+    """
+    Context manager making every dataset access of the calling thread use the same snapshot.
+
+    A reload during the block does not affect it, so a callback that reads the data,
+    the cube and the version several times sees a single consistent version.
+
+    Parameters:
+    -----------
+    - `snapshot`: The snapshot to use, by default the current one. Another snapshot,
+      e.g. of a scaled copy of the dataset, runs the pages on it without a reload.
+    """
+    previous = getattr(_pinned, "snapshot", None)
+    _pinned.snapshot = snapshot or current_snapshot()
+    try:
+        yield _pinned.snapshot
+    finally:
+        _pinned.snapshot = previous
+
+
+def get_dataset():
+    """
+    Returns a read-only view of the shared cleaned dataset, loading it on first use.
+
+    The view is a shallow copy: it shares all column data with the loaded frame,
+    but writes to it are copied on write and stay invisible to other callers.
+    """
+    return current_snapshot().frame.copy(deep=False)
+
+
+def read_rows(columns=None, **where):
+    """
+    Returns the rows of the shared dataset matching equality or range filters on indexed columns.
+
+    Equality filters on `Category` and `Type` only are answered from the partitioned
+    copy of the snapshot's version when it exists (see `playstore.partitions`); its
+    rows come partition by partition, in sorted (Category, Type) order, and keep the
+    order of the dataset within every partition. Any other combination is resolved
+    with the filter index of the loaded frame (see `playstore.indexes`), at a cost
+    that grows with the matching rows, and keeps the order of the dataset.
+
+    Parameters:
+    -----------
+    - `columns`: Names of the columns to return, all of them by default.
+    - `where`: Filters on the columns of `playstore.indexes.INDEXED_COLUMNS`,
+      `name=value`, `name=[values]` or `name=slice(low, high)` for a range.
+    """
+    from playstore.partitions import PARTITION_COLUMNS, read_partitions
+
+    snapshot = current_snapshot()
+    ranges = any(isinstance(value, slice) for value in where.values())
+    if set(where) <= set(PARTITION_COLUMNS) and not ranges:
+        rows = read_partitions(snapshot.path, columns, signature=snapshot.signature, version=snapshot.version, **where)
+        if rows is not None:
+            return rows
+    return filter_index_for(snapshot).select(snapshot.frame, columns, **where)
+
+
+def load_stats():
+    """
+    Returns the `LoadStats` of the shared dataset, or `None` if it is not loaded yet.
+    """
+    snapshot = getattr(_pinned, "snapshot", None) or _snapshot
+    return snapshot.stats if snapshot is not None else None
+
+
+def dataset_version():
+    """
+    Returns the version hash of the shared dataset.
+
+    The hash changes whenever the cleaned CSV changes, so it can be part of the
+    keys of anything derived from the data.
+    """
+    return current_snapshot().version
+
+
+def _peak_rss_bytes():
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reload_dataset(path=CLEAN_DATA_FILE):
+    """
+    Loads the current version of the cleaned CSV at `path` and swaps it in as the latest snapshot.
+
+    The frame, if the previous snapshot had read it, and the derived results the
+    previous snapshot had built are built for the new one before the swap, so no
+    request has to wait for them afterwards. Callbacks holding the previous
+    snapshot keep it until they return.
+
+    Returns:
+    --------
+    The new `Snapshot`, or `None` if the loaded one is already current.
+    """
+    global _snapshot
+
+    with _lock:
+        previous = _snapshot
+        if previous is not None and previous.version == source_version(path):
+            return None
+        start = time.perf_counter()
+        peak_before = _peak_rss_bytes()
+        snapshot = take_snapshot(path)
+        if previous is not None:
+            snapshot.derive_like(previous)
+        _snapshot = snapshot
+    logger.info(
+        "Reloaded dataset version %s -> %s in %.2f s, peak RSS %.1f MiB -> %.1f MiB",
+        previous.version if previous else None, snapshot.version,
+        time.perf_counter() - start, peak_before / 2 ** 20, _peak_rss_bytes() / 2 ** 20
+    )
+    return snapshot
+
+
+class DatasetReloader:
+    """
+    Polls the version of the cleaned CSV on a daemon thread and reloads it when it changed.
+
+    A new version is only loaded once two consecutive polls agree on it, so a file
+    that is still being written (e.g. the CSV replaced before the ingestion state is
+    saved) is not loaded half way.
+
+    Parameters:
+    -----------
+    - `path`: The cleaned CSV file to watch.
+    """
+
+    def __init__(self, path=CLEAN_DATA_FILE):
+        self.path = path
+        self.interval = None
+        self._seen = None
+        self._stop = threading.Event()
+        self._thread = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # the polling thread of the parent does not exist in the child, start a new one
+        self._thread = None
+        self._stop = threading.Event()
+        if self.interval:
+            self.start(self.interval)
+
+    def start(self, interval=DATA_RELOAD_INTERVAL):
+        """
+        Starts polling every `interval` seconds, unless it is already running.
+        """
+        self.interval = interval
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="dataset-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops polling after the current check.
+        """
+        self.interval = None
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Reloading the dataset failed, keeping version %s", dataset_version())
+
+    def poll(self):
+        """
+        Checks the version of the CSV once and reloads it if it changed and has settled.
+
+        Returns:
+        --------
+        The new `Snapshot`, or `None` if nothing was reloaded.
+        """
+        if _snapshot is None:
+            # nothing is loaded yet, the first use will load the current version
+            return None
+        try:
+            version = source_version(self.path)
+        except OSError:
+            return None
+        settled, self._seen = version == self._seen, version
+        if version == _snapshot.version or not settled:
+            return None
+        return reload_dataset(self.path)
+
+
+reloader = DatasetReloader()
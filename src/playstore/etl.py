@@ -0,0 +1,559 @@
+"""
+Cleaning Pipeline
+=================
+
+Streams raw Google Play Store dumps into the cleaned dataset used by the dashboard.
+
+The source is a single raw CSV file or many of them (e.g. daily scrapes), given as a
+directory or a glob pattern. The files are cleaned in parallel, one per worker of a
+process pool, and merged in sorted file order, so the output is the same as if the
+files had been concatenated and cleaned on one core.
+
+Every file is read in chunks of `CHUNK_ROWS` rows, so memory use does not grow
+with the size of the scrape. Every chunk is cleaned with vectorized column
+operations. Low-cardinality text columns
+(sizes, installs, prices, genres, dates) are parsed once per distinct value and
+mapped back to the rows. The rules are those of notebook `001_exploratory_analysis.ipynb`:
+
+- column names use underscores instead of spaces,
+- rows of the broken `'1.9'` category are dropped, a missing `Type` means `Free`,
+- rows with any other missing value and exact duplicates of earlier rows are dropped,
+- `Size` is converted to bytes (`19M` -> `19000000.0`, `266k` -> `266000.0`) and
+  `Varies with device` is replaced by the median size of all kept rows,
+- `Installs` (`10,000+` -> `10000`) and `Price` (`$4.99` -> `4.99`) become numbers,
+- `Genres` keeps its first genre only,
+- `Last Updated` is split into `Updated_Day`, `Updated_Month` and `Updated_Year`,
+- `Android Ver` is parsed into the packed `Android_Ver_Min` and `Android_Ver_Max`
+  and `Current Ver` into the packed `Current_Ver_Num` (see `pack_version()`), each
+  with a flag column telling parsed, `Varies with device` and unparseable versions
+  apart, so version ranges are integer comparisons.
+
+Rows whose values cannot be parsed are counted as rejected instead of failing the run.
+The command line run finally writes the app search index of the output (see `playstore.search`)
+and its Category/Type partitioned copy (see `playstore.partitions`).
+
+The median size and the duplicates across files are only known after the last
+chunk. The workers therefore spool their cleaned chunks to a temporary directory
+next to the output, together with a 64-bit hash of every row. The parent process
+walks the hashes in file order to drop duplicates and counts the sizes of the kept
+rows; the workers then format the kept rows as CSV, one part per file, and the
+parts are concatenated. Only one chunk per worker is in memory at a time, and the
+sorted hashes of the kept rows are the only state that grows with the input
+(8 bytes per row).
+
+Run it with:
+
+```bash
+python -m playstore.etl --source data/raw/googleplaystore.csv
+python -m playstore.etl --source "data/raw/daily/*.csv" --workers 8
+```
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `glob`: Expanding directories and patterns of raw files.
+- `time`: Measuring the run time.
+- `shutil`: Concatenating the output parts.
+- `argparse`: Command line interface.
+- `tempfile`: Spool directory of the cleaned chunks.
+- `collections`: Counting dropped rows.
+- `concurrent.futures`: The worker process pool.
+- `dataclasses`: The run statistics.
+- `itertools`: Arguments shared by all pool tasks.
+- `numpy`: Hash bookkeeping and the median.
+- `pandas`: Chunked CSV reading and vectorized cleaning.
+- `playstore.config`: Configuration for the application.
+- `playstore.data`: Path of the cleaned dataset.
+- `playstore.partitions`: Category/Type partitioned copy of the output.
+- `playstore.search`: Search index of the app names.
+"""
+
+import os
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from playstore.config import RAW_DATA_DIR
+from playstore.data import CLEAN_DATA_FILE
+from playstore.search import search_dir_for, write_search_index
+
+RAW_DATA_FILE = os.path.join(RAW_DATA_DIR, "googleplaystore.csv")
+CHUNK_ROWS = 100_000
+
+# Columns of the cleaned dataset, in output order
+COLUMNS = [
+    "App", "Category", "Rating", "Reviews", "Size", "Installs", "Type", "Price", "Content_Rating",
+    "Genres", "Current_Ver", "Android_Ver", "Updated_Day", "Updated_Month", "Updated_Year",
+    "Android_Ver_Min", "Android_Ver_Max", "Android_Ver_Flag", "Current_Ver_Num", "Current_Ver_Flag",
+]
+# Numeric types are fixed, so no chunk writes e.g. `0` instead of `0.0` for its prices
+COLUMN_TYPES = {
+    "Rating": "float64", "Reviews": "int64", "Size": "float64", "Installs": "int64", "Price": "float64",
+    "Updated_Day": "int64", "Updated_Month": "int64", "Updated_Year": "int64",
+    "Android_Ver_Min": "int64", "Android_Ver_Max": "int64", "Current_Ver_Num": "int64",
+}
+SIZE_EXPONENTS = {"M": "e6", "k": "e3", "K": "e3"}
+VARIES = "Varies with device"
+DATE_FORMAT = "%B %d, %Y"
+# Versions are packed into 16 bits per component, of up to `VERSION_PARTS` components
+VERSION_PARTS = 4
+VERSION_BITS = 16
+VERSION_MAX = 2 ** (VERSION_PARTS * VERSION_BITS - 1) - 1
+PARSED, UNPARSEABLE = "parsed", "unparseable"
+VERSION = r"(\d+(?:\.\d+){0,3})"
+# "4.0.3 and up", "4.4W and up" (Wear OS) or "4.1 - 7.1.1"
+ANDROID_VERSION = rf"^{VERSION}W?(?: and up| - {VERSION})$"
+# leading version of free-form app versions, e.g. "1.2.3 (Build 45)", "v8[1.0.10]", "Version:6.97"
+APP_VERSION = rf"^(?:[vV](?:ersion)?[: ]?)?{VERSION}"
+
+
+@dataclass(frozen=True)
+class CleanStats:
+    """
+    Statistics of one pipeline run.
+
+    Attributes:
+    -----------
+    - `source`: Raw CSV file, directory or glob pattern that was cleaned.
+    - `output`: Cleaned CSV file that was written.
+    - `rows_read`: Rows in the raw file.
+    - `rows_written`: Rows in the cleaned file.
+    - `dropped`: Rows dropped for the `'1.9'` category or missing values.
+    - `duplicates`: Rows dropped as duplicates of earlier rows.
+    - `rejected`: Rows dropped because a value could not be parsed.
+    - `seconds`: Wall time of the whole run.
+    - `files`: `FileStats` of every raw file, in merge order.
+    """
+    source: str
+    output: str
+    rows_read: int
+    rows_written: int
+    dropped: int
+    duplicates: int
+    rejected: int
+    seconds: float
+    files: tuple = ()
+
+
+@dataclass(frozen=True)
+class FileStats:
+    """
+    Statistics of one raw file of a pipeline run.
+
+    Attributes:
+    -----------
+    - `source`: Raw CSV file.
+    - `rows_read`: Rows in the file.
+    - `rows_written`: Rows of the file in the cleaned output.
+    - `seconds`: Time its worker spent cleaning and writing it.
+    """
+    source: str
+    rows_read: int
+    rows_written: int
+    seconds: float
+
+
+class _SeenRows:
+    """
+    Sorted hashes of the rows kept so far, used to drop later duplicates.
+    """
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def first_seen(self, hashes):
+        """
+        Mask of the row `hashes` that did not occur before them or in earlier calls.
+        """
+        new = ~pd.Series(hashes).duplicated().to_numpy()
+        if len(self.hashes):
+            positions = np.searchsorted(self.hashes, hashes)
+            new &= self.hashes.take(positions, mode="clip") != hashes
+        # both runs are sorted, so the stable sort only merges them
+        self.hashes = np.concatenate([self.hashes, np.sort(hashes[new])])
+        self.hashes.sort(kind="stable")
+        return new
+
+
+def row_hashes(chunk):
+    """
+    64-bit hash of every row of `chunk`, equal for equal rows.
+    """
+    return pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+
+
+def _parse_distinct(values, parse):
+    """
+    Applies the vectorized `parse` to the distinct `values` only and maps the results back to the rows.
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = pd.Series(parse(pd.Series(uniques, dtype=values.dtype)))
+    return pd.Series(parsed.to_numpy()[codes], index=values.index, dtype=parsed.dtype)
+
+
+def parse_size(size):
+    """
+    Converts sizes like `19M` or `266k` into bytes, `Varies with device` and invalid sizes into NaN.
+    """
+    exponent = size.str[-1].map(SIZE_EXPONENTS)
+    # "19M" -> "19e6" is parsed exactly like the notebook's string replacement
+    text = size.where(exponent.isna(), size.str[:-1] + exponent)
+    return pd.to_numeric(text.where(size != VARIES), errors="coerce")
+
+
+def pack_version(version):
+    """
+    Packs version strings like `4.0.3` into integers that sort like the versions.
+
+    Every component takes `VERSION_BITS` bits, missing components count as 0, so
+    `4.0` and `4.0.0` are equal and `4.0.3 < 4.1`.
+
+    Parameters:
+    -----------
+    - `version`: A version string or a Series of them.
+
+    Returns:
+    --------
+    The packed version, or an `Int64` Series of packed versions, missing for versions that
+    are missing, have more than `VERSION_PARTS` components or a component too large.
+    """
+    if isinstance(version, str):
+        packed = pack_version(pd.Series([version]))[0]
+        if pd.isna(packed):
+            raise ValueError(f"Cannot pack version '{version}'.")
+        return int(packed)
+
+    text = version.str.split(".", expand=True).reindex(columns=range(VERSION_PARTS))
+    parts = text.apply(pd.to_numeric, errors="coerce")
+    too_many = version.str.count(r"\.").fillna(0) >= VERSION_PARTS
+    limits = [2 ** (VERSION_BITS - 1)] + [2 ** VERSION_BITS] * (VERSION_PARTS - 1)
+    valid = text[0].notna() & ~(text.notna() & parts.isna()).any(axis=1) & ~too_many
+    parts = parts.fillna(0)
+    valid &= (parts >= 0).all(axis=1) & (parts < limits).all(axis=1)
+    shifts = VERSION_BITS * np.arange(VERSION_PARTS - 1, -1, -1)
+    packed = (parts.where(valid, 0).to_numpy(dtype="int64") << shifts).sum(axis=1)
+    # nullable integers, floats would round versions above 2 ** 53
+    return pd.Series(packed, index=version.index, dtype="Int64").where(valid)
+
+
+def parse_android_version(android_ver):
+    """
+    Parses minimum Android versions like `4.0.3 and up` or ranges like `4.1 - 7.1.1`.
+
+    Returns:
+    --------
+    A DataFrame with the packed `Android_Ver_Min` and `Android_Ver_Max`, `VERSION_MAX`
+    for open ranges, and `Android_Ver_Flag`: `parsed`, `Varies with device` or
+    `unparseable`. Versions that are not parsed are packed as 0.
+    """
+    text = android_ver.str.extract(ANDROID_VERSION)
+    low, high = pack_version(text[0]), pack_version(text[1])
+    parsed = low.notna() & (high.notna() | text[1].isna())
+    flag = pd.Series(UNPARSEABLE, index=android_ver.index).mask(android_ver == VARIES, VARIES).mask(parsed, PARSED)
+    return pd.DataFrame({
+        "Android_Ver_Min": low.where(parsed, 0).astype("int64"),
+        "Android_Ver_Max": high.fillna(VERSION_MAX).where(parsed, 0).astype("int64"),
+        "Android_Ver_Flag": flag,
+    })
+
+
+def parse_app_version(current_ver):
+    """
+    Parses the leading version of free-form app versions like `1.2.3 (Build 45)`.
+
+    Returns:
+    --------
+    A DataFrame with the packed `Current_Ver_Num`, 0 if it is not parsed, and
+    `Current_Ver_Flag`: `parsed`, `Varies with device` or `unparseable`.
+    """
+    number = pack_version(current_ver.str.extract(APP_VERSION)[0])
+    parsed = number.notna()
+    flag = pd.Series(UNPARSEABLE, index=current_ver.index).mask(current_ver == VARIES, VARIES).mask(parsed, PARSED)
+    return pd.DataFrame({"Current_Ver_Num": number.fillna(0).astype("int64"), "Current_Ver_Flag": flag})
+
+
+def _parse_distinct_frame(values, parse):
+    """
+    Like `_parse_distinct()`, for a `parse` returning a DataFrame of columns per value.
+    """
+    codes, uniques = pd.factorize(values)
+    parsed = parse(pd.Series(uniques, dtype=values.dtype))
+    return pd.DataFrame({name: parsed[name].to_numpy()[codes] for name in parsed.columns}, index=values.index)
+
+
+def complete_rows(chunk):
+    """
+    Renames the columns of a raw `chunk`, drops its `'1.9'` rows, fills `Type` and drops incomplete rows.
+
+    Returns:
+    --------
+    A tuple of the complete rows and the number of rows dropped.
+    """
+    chunk.columns = chunk.columns.str.replace(" ", "_")
+    complete = chunk[chunk["Category"] != "1.9"].fillna({"Type": "Free"}).dropna()
+    return complete, len(chunk) - len(complete)
+
+
+def clean_chunk(chunk):
+    """
+    Applies the cleaning rules to one chunk of raw rows, except the median size.
+
+    Parameters:
+    -----------
+    - `chunk`: Raw rows read as strings, with the original column names.
+
+    Returns:
+    --------
+    A tuple of the cleaned rows, with NaN sizes for `Varies with device`, and a
+    boolean array marking the rows of `chunk` rejected because a value could not be parsed.
+    """
+    size = _parse_distinct(chunk["Size"], parse_size)
+    bad_size = size.isna() & (chunk["Size"] != VARIES)
+    updated = _parse_distinct(
+        chunk["Last_Updated"], lambda dates: pd.to_datetime(dates, format=DATE_FORMAT, errors="coerce")
+    )
+    cleaned = pd.DataFrame({
+        "App": chunk["App"],
+        "Category": chunk["Category"],
+        "Rating": pd.to_numeric(chunk["Rating"], errors="coerce"),
+        "Reviews": pd.to_numeric(chunk["Reviews"], errors="coerce"),
+        "Size": size,
+        "Installs": _parse_distinct(
+            chunk["Installs"], lambda installs: pd.to_numeric(installs.str.replace(r"[+,]", "", regex=True), errors="coerce")
+        ),
+        "Type": chunk["Type"],
+        "Price": _parse_distinct(
+            chunk["Price"], lambda prices: pd.to_numeric(prices.str.removeprefix("$"), errors="coerce")
+        ),
+        "Content_Rating": chunk["Content_Rating"],
+        "Genres": _parse_distinct(chunk["Genres"], lambda genres: genres.str.split(";", n=1).str[0]),
+        "Current_Ver": chunk["Current_Ver"],
+        "Android_Ver": chunk["Android_Ver"],
+        "Updated_Day": updated.dt.day,
+        "Updated_Month": updated.dt.month,
+        "Updated_Year": updated.dt.year,
+        **_parse_distinct_frame(chunk["Android_Ver"], parse_android_version),
+        **_parse_distinct_frame(chunk["Current_Ver"], parse_app_version),
+    }, columns=COLUMNS)
+
+    bad = bad_size | cleaned.drop(columns="Size").isna().any(axis=1)
+    cleaned = cleaned[~bad]
+    return cleaned.astype(COLUMN_TYPES), bad.to_numpy()
+
+
+def _median(counts):
+    """
+    Median of the values in the index of `counts`, each occurring `counts` times.
+
+    Matches `Series.median()` of the expanded values.
+    """
+    counts = counts.sort_index()
+    cumulative = np.cumsum(counts.to_numpy())
+    total = cumulative[-1]
+    values = counts.index.to_numpy()
+    lower = values[np.searchsorted(cumulative, (total - 1) // 2, side="right")]
+    upper = values[np.searchsorted(cumulative, total // 2, side="right")]
+    return (lower + upper) / 2
+
+
+def expand_sources(source):
+    """
+    Returns the raw CSV files of `source` in sorted order.
+
+    `source` is a single file, a directory whose `*.csv` files are used, or a glob pattern.
+    Raises `FileNotFoundError` if nothing matches.
+    """
+    if os.path.isfile(source):
+        return [source]
+    pattern = os.path.join(source, "*.csv") if os.path.isdir(source) else source
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise FileNotFoundError(f"No raw CSV files match: {source}")
+    return paths
+
+
+def _clean_file(index, source, spool, chunk_rows):
+    """
+    Cleans the raw file `source` in chunks and spools them to `spool`; runs in a worker.
+
+    Rows repeated within the file are dropped here, duplicates of rows of other files
+    are left to the merge. Each chunk is spooled as a pickle of its cleaned rows and an
+    `.npz` with the hashes of its rows, the rejected mask and the cleaned sizes.
+
+    Returns:
+    --------
+    A dict with the spooled chunk paths (without extension), the row counts and the seconds spent.
+    """
+    start = time.perf_counter()
+    counts = Counter()
+    chunks = []
+    seen = _SeenRows()
+    for chunk in pd.read_csv(source, dtype=str, chunksize=chunk_rows):
+        counts["rows_read"] += len(chunk)
+        complete, dropped = complete_rows(chunk)
+        counts["dropped"] += dropped
+
+        hashes = row_hashes(complete)
+        new = seen.first_seen(hashes)
+        counts["duplicates"] += int((~new).sum())
+        cleaned, rejected = clean_chunk(complete[new])
+
+        path = os.path.join(spool, f"{index:05d}-{len(chunks):06d}")
+        cleaned.to_pickle(f"{path}.pkl")
+        np.savez(f"{path}.npz", hashes=hashes[new], rejected=rejected, size=cleaned["Size"].to_numpy())
+        chunks.append(path)
+
+    return {"source": source, "chunks": chunks, "counts": counts, "seconds": time.perf_counter() - start}
+
+
+def _write_part(chunks, median, part):
+    """
+    Writes the kept rows of the spooled `chunks` as headerless CSV to `part`; runs in a worker.
+
+    Returns:
+    --------
+    A tuple of the number of rows written and the seconds spent.
+    """
+    start = time.perf_counter()
+    rows = 0
+    with open(part, "w", encoding="utf-8", newline="") as f:
+        for path in chunks:
+            cleaned = pd.read_pickle(f"{path}.pkl")[np.load(f"{path}.keep.npy")]
+            cleaned.fillna({"Size": median}).to_csv(f, header=False, index=False)
+            rows += len(cleaned)
+            os.remove(f"{path}.pkl")
+    return rows, time.perf_counter() - start
+
+
+def _merge(files, counts):
+    """
+    Drops rows already seen in earlier files, in file order, and returns the median size.
+
+    The mask of the kept rows of every chunk is saved next to it for `_write_part()`.
+    """
+    seen = _SeenRows()
+    sizes = pd.Series(dtype="int64")
+    for file in files:
+        counts.update(file["counts"])
+        for path in file["chunks"]:
+            with np.load(f"{path}.npz") as spooled:
+                hashes, rejected, size = spooled["hashes"], spooled["rejected"], spooled["size"]
+            new = seen.first_seen(hashes)
+            counts["duplicates"] += int((~new).sum())
+            counts["rejected"] += int((new & rejected).sum())
+            keep = new[~rejected]
+            np.save(f"{path}.keep.npy", keep)
+            sizes = sizes.add(pd.Series(size[keep]).value_counts(), fill_value=0)
+    return _median(sizes) if len(sizes) else np.nan
+
+
+def clean_dataset(source=RAW_DATA_FILE, output=CLEAN_DATA_FILE, chunk_rows=CHUNK_ROWS, workers=None):
+    """
+    Cleans the raw CSV files of `source` in a process pool and writes the result to `output`.
+
+    Every file is read and cleaned chunk by chunk by one worker. The merge then keeps
+    the first occurrence of every row in the sorted file order, so the output does
+    not depend on the number of workers or on which worker finishes first. The kept
+    rows are formatted as CSV by the workers again, one part per file, and the parts
+    are concatenated into a temporary file next to `output`, which is moved into place
+    at the end so readers never see a half-written dataset.
+
+    Parameters:
+    -----------
+    - `source`: Raw Play Store CSV file, directory of CSV files or glob pattern.
+    - `output`: Target path of the cleaned CSV file.
+    - `chunk_rows`: Number of raw rows processed at a time by each worker.
+    - `workers`: Number of worker processes, by default one per CPU up to the number of files.
+
+    Returns:
+    --------
+    The `CleanStats` of the run.
+    """
+    start = time.perf_counter()
+    sources = expand_sources(source)
+    workers = workers or min(len(sources), os.cpu_count() or 1)
+    output_dir = os.path.dirname(os.path.abspath(output))
+    os.makedirs(output_dir, exist_ok=True)
+    counts = Counter()
+    partial = f"{output}.tmp"
+
+    try:
+        with tempfile.TemporaryDirectory(prefix=".etl-", dir=output_dir) as spool, \
+                ProcessPoolExecutor(max_workers=workers) as pool:
+            files = list(pool.map(
+                _clean_file, range(len(sources)), sources, repeat(spool), repeat(chunk_rows)
+            ))
+            median = _merge(files, counts)
+
+            parts = [os.path.join(spool, f"{index:05d}.csv") for index in range(len(files))]
+            written = list(pool.map(_write_part, [file["chunks"] for file in files], repeat(median), parts))
+
+            with open(partial, "wb") as f:
+                f.write(pd.DataFrame(columns=COLUMNS).to_csv(index=False).encode("utf-8"))
+                for part in parts:
+                    with open(part, "rb") as part_file:
+                        shutil.copyfileobj(part_file, f, 1 << 20)
+                    os.remove(part)
+        os.replace(partial, output)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+    return CleanStats(
+        source=source,
+        output=output,
+        rows_read=counts["rows_read"],
+        rows_written=sum(rows for rows, _ in written),
+        dropped=counts["dropped"],
+        duplicates=counts["duplicates"],
+        rejected=counts["rejected"],
+        seconds=time.perf_counter() - start,
+        files=tuple(
+            FileStats(file["source"], file["counts"]["rows_read"], rows, file["seconds"] + seconds)
+            for file, (rows, seconds) in zip(files, written)
+        ),
+    )
+
+
+def main(argv=None):
+    """
+    Command line entry point that cleans raw dumps into the dashboard's dataset.
+    """
+    parser = argparse.ArgumentParser(description="Clean raw Google Play Store CSV dumps.")
+    parser.add_argument("--source", default=RAW_DATA_FILE, help="raw CSV file, directory of CSV files or glob")
+    parser.add_argument("--output", default=CLEAN_DATA_FILE, help="cleaned CSV file")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="raw rows processed at a time")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per CPU by default")
+    args = parser.parse_args(argv)
+
+    stats = clean_dataset(args.source, args.output, args.chunk_rows, args.workers)
+    for file in stats.files:
+        print(
+            f"{file.source}: {file.rows_read} rows -> {file.rows_written} in {file.seconds:.2f} s "
+            f"({file.rows_read / max(file.seconds, 1e-9):,.0f} rows/s)"
+        )
+    print(
+        f"Cleaned {stats.rows_read} rows into {stats.rows_written} in {stats.seconds:.2f} s "
+        f"({stats.dropped} incomplete or '1.9', {stats.duplicates} duplicates, {stats.rejected} unparseable)"
+    )
+    print(f"Cleaned data saved to: {stats.output}")
+    index = write_search_index(stats.output)
+    print(f"Search index of {len(index)} apps saved to: {search_dir_for(stats.output)}")
+    # imported here, the partitioned copy reads the CSV in chunks of this module
+    from playstore.partitions import partition_dir_for, write_partitions
+
+    manifest = write_partitions(stats.output)
+    print(f"{len(manifest['partitions'])} Category/Type partitions saved to: {partition_dir_for(stats.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Figure Cache
+============
+
+Memoization of Dash callback results, shared by all worker processes.
+
+The dashboard callbacks are pure functions of a few discrete inputs and the data,
+yet every page view rebuilds the Plotly figures. `FigureCache.memoize` wraps a
+callback and stores its serialized JSON result in an SQLite file, keyed on the
+callback name, its arguments, the dataset version (`playstore.data.dataset_version`)
+and the code version (`code_version()`: the package and Plotly versions, the
+`QUERY_BACKEND` and a hash of the callback's module). Neither a new dataset nor a
+new deployment ever serves figures of the old one. The callback runs with
+the dataset snapshot pinned (`playstore.data.pinned`), so a reload while it runs
+cannot store a result of the new data under the key of the old version.
+
+The store keeps at most `max_entries` results and evicts the least recently used ones.
+SQLite in WAL mode lets all workers of a deployment read and fill the same file.
+Hit and miss counters per callback are kept in the same file, so `stats()` returns
+the totals of all workers. A hit only reads: its LRU touch and its counter are kept
+in the worker and written in one transaction with the next stored result, or at
+most every `FIGURE_CACHE_FLUSH_INTERVAL` seconds, so hits of different workers do
+not queue for the write lock. Every lookup is also counted in the
+`playstore_figure_cache_requests_total` metric (see `playstore.metrics`).
+
+Decorate a callback below its `@callback` decorator:
+
+```python
+@callback(Output('graph', 'figure'), Input('filter', 'value'))
+@cached_figure
+def update_graph(value):
+    ...
+```
+
+Errors of the store are logged and the callback is computed as if nothing was cached.
+Plotly and the dataset module are only imported by the first call, so decorating the
+callbacks of a page adds nothing to the startup of the dashboard.
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `sys`: Modules of the decorated callbacks.
+- `json`: Serialization of cache keys and cached results.
+- `time`: Timestamps for the LRU eviction.
+- `logging`: Reporting store errors.
+- `sqlite3`: The shared on-disk store.
+- `threading`: Per-thread connections.
+- `hashlib`: Hashing the source of the callback modules.
+- `functools`: Wrapping the decorated callbacks.
+- `collections`: Pending hit and miss counts.
+- `importlib.metadata`: Version of the installed package.
+- `plotly.io.json`: Serialization of figures and Dash components.
+- `playstore.config`: Configuration for the application.
+- `playstore.data`: Dataset version used in the keys and snapshot pinning.
+- `playstore.metrics`: Hit and miss metrics.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+import functools
+from collections import Counter
+from importlib import metadata
+
+from playstore.config import FIGURE_CACHE_FILE, FIGURE_CACHE_FLUSH_INTERVAL, FIGURE_CACHE_SIZE, QUERY_BACKEND
+from playstore.metrics import FIGURE_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def code_version(module):
+    """
+    Version of the code producing the results of the callbacks of `module`.
+
+    Combines the versions of the `playstore` package and of Plotly, the
+    `QUERY_BACKEND` and a hash of the source file of `module`, so results
+    stored by another release or configuration are not served.
+    """
+    import plotly
+
+    try:
+        package = metadata.version("playstore")
+    except metadata.PackageNotFoundError:
+        package = None
+    path = getattr(sys.modules.get(module), "__file__", None)
+    try:
+        with open(path, "rb") as f:
+            source = hashlib.sha1(f.read()).hexdigest()[:12]
+    except (OSError, TypeError):
+        source = None
+    return f"{package}/{plotly.__version__}/{QUERY_BACKEND}/{source}"
+
+
+class FigureCache:
+    """
+    Bounded, least recently used store of serialized callback results in SQLite.
+
+    Parameters:
+    -----------
+    - `path`: SQLite file, created on first use.
+    - `max_entries`: Number of results kept before the least recently used ones are evicted.
+    - `flush_interval`: Seconds the LRU touches and counters of hits are kept in the
+      process before they are written.
+    """
+
+    def __init__(self, path=FIGURE_CACHE_FILE, max_entries=FIGURE_CACHE_SIZE, flush_interval=FIGURE_CACHE_FLUSH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._used = {}
+        self._counts = Counter()
+        self._flushed = time.monotonic()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # the pending touches and counts are the parent's to write, nor is its lock ours
+        self._lock = threading.Lock()
+        self._used = {}
+        self._counts = Counter()
+        self._flushed = time.monotonic()
+
+    def _connection(self):
+        # connections must not cross threads or forked processes
+        if getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS figures (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, key):
+        """
+        Returns the stored JSON for `key` and marks it as recently used, or `None`.
+
+        The lookup only reads the store; the mark is written by a later `flush()`.
+        """
+        row = self._connection().execute("SELECT value FROM figures WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._used[key] = time.time()
+        self._flush_due()
+        return row[0]
+
+    def put(self, key, value):
+        """
+        Stores the JSON `value` under `key`, writes the pending marks and counts and
+        evicts entries over `max_entries`, all in one transaction.
+        """
+        self._write([(key, value)])
+
+    def count(self, name, hit):
+        """
+        Adds one hit or miss to the counters of the callback `name`, written by a later `flush()`.
+        """
+        with self._lock:
+            self._counts[name, bool(hit)] += 1
+
+    def flush(self):
+        """
+        Writes the pending LRU marks and counters of this process in one transaction.
+        """
+        self._write([])
+
+    def _flush_due(self):
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def _write(self, entries):
+        with self._lock:
+            used, self._used = self._used, {}
+            counts, self._counts = self._counts, Counter()
+            self._flushed = time.monotonic()
+        if not (entries or used or counts):
+            return
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany("UPDATE figures SET used = MAX(used, ?) WHERE key = ?", [
+                    (when, key) for key, when in used.items()
+                ])
+                conn.executemany(
+                    "INSERT INTO counters VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                    [(name, number if hit else 0, 0 if hit else number) for (name, hit), number in counts.items()]
+                )
+                if entries:
+                    now = time.time()
+                    conn.executemany("INSERT OR REPLACE INTO figures VALUES (?, ?, ?)", [
+                        (key, value, now) for key, value in entries
+                    ])
+                    conn.execute(
+                        "DELETE FROM figures WHERE key NOT IN (SELECT key FROM figures ORDER BY used DESC LIMIT ?)",
+                        (self.max_entries,)
+                    )
+        except sqlite3.Error:
+            # keep the counts for the next write, the marks are only a hint
+            with self._lock:
+                self._counts.update(counts)
+            raise
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of all workers per callback, and the number of stored entries.
+
+        The counts of other workers that are not flushed yet are not included.
+        """
+        self.flush()
+        conn = self._connection()
+        return {
+            "entries": conn.execute("SELECT COUNT(*) FROM figures").fetchone()[0],
+            "max_entries": self.max_entries,
+            "callbacks": {
+                name: {"hits": hits, "misses": misses}
+                for name, hits, misses in conn.execute("SELECT name, hits, misses FROM counters ORDER BY name")
+            },
+        }
+
+    def clear(self):
+        """
+        Removes all stored results and resets the counters.
+        """
+        with self._lock:
+            self._used, self._counts = {}, Counter()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM figures")
+            conn.execute("DELETE FROM counters")
+
+    def memoize(self, func):
+        """
+        Decorator caching the JSON serialized results of the callback `func`.
+
+        On a hit the stored JSON is decoded and returned; Dash accepts the decoded
+        figures and components in place of the original objects.
+        """
+        name = f"{func.__module__}.{func.__qualname__}"
+        version = []
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            from plotly.io.json import to_json_plotly
+            from playstore.data import dataset_version, pinned
+
+            if not version:
+                version.append(code_version(func.__module__))
+            with pinned():
+                try:
+                    key = json.dumps([name, version[0], dataset_version(), args])
+                    value = self.get(key)
+                    self.count(name, value is not None)
+                    FIGURE_CACHE_REQUESTS.inc(name, "miss" if value is None else "hit")
+                except (sqlite3.Error, OSError) as e:
+                    logger.warning("Figure cache unavailable: %s", e)
+                    return func(*args)
+
+                if value is not None:
+                    return json.loads(value)
+
+                result = func(*args)
+                try:
+                    self.put(key, to_json_plotly(result))
+                except (sqlite3.Error, OSError) as e:
+                    logger.warning("Could not store %s in the figure cache: %s", name, e)
+                return result
+
+        return wrapper
+
+
+figure_cache = FigureCache()
+cached_figure = figure_cache.memoize
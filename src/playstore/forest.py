@@ -0,0 +1,250 @@
+"""
+Compiled Random Forest
+======================
+
+Export of the trained RandomForestClassifier into flat node arrays and a pure NumPy
+evaluator for them.
+
+`export_forest()` concatenates all trees of the forest into contiguous arrays
+(split feature, threshold, the two children side by side, class probabilities of
+each node) and writes them as `.npy` files into `FOREST_DIR`. `CompiledForest`
+evaluates a whole batch by walking all trees level by level: at every level each
+(sample, tree) pair moves one node down with a few vectorized gathers. Leaves point
+to themselves, so no branch is needed once a path ends.
+
+The evaluator repeats sklearn's arithmetic step by step (inputs cast to float32,
+per-tree probabilities summed in tree order, divided by the number of trees, argmax),
+so `CompiledForest.predict` gives bit-identical results to `model.predict` of a
+forest evaluated in a single job. Thresholds are stored as the largest float32 not
+above the original one, which keeps every float32 comparison unchanged.
+
+Serving from the exported arrays needs only NumPy; sklearn is imported by the
+export step alone.
+
+The export records the size and modification time of the pickled model and is
+considered stale once the model file changes. Build it with:
+
+```bash
+python -m playstore.forest
+```
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `json`: Reading and writing the manifest.
+- `argparse`: Command line interface of the export step.
+- `numpy`: Node arrays and the vectorized evaluation.
+- `playstore.cache`: Atomic file writes and source signatures.
+- `playstore.config`: Configuration for the application.
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+
+from playstore.cache import save_array, save_json, source_signature
+from playstore.config import CLEAN_DATA_DIR
+
+MODEL_FILE = os.path.join(CLEAN_DATA_DIR, "rf_model_category.pkl")
+FOREST_DIR = os.path.join(CLEAN_DATA_DIR, "rf_model_category.forest")
+FORMAT_VERSION = 1
+ARRAYS = ("feature", "threshold", "children", "value", "roots")
+# (sample, tree) pairs walked at once, small enough for the work arrays to stay in cache
+PAIRS_PER_CHUNK = 1 << 16
+
+
+def _leaf_probabilities(estimator):
+    """
+    Class probabilities of every node of `estimator`, as its `predict_proba` returns them.
+    """
+    import sklearn
+
+    value = estimator.tree_.value[:, 0, :estimator.n_classes_]
+    if tuple(int(part) for part in sklearn.__version__.split(".")[:2]) < (1, 4):
+        # older versions store weighted counts and normalize them on prediction
+        value = value.copy()
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        value /= normalizer
+    return value
+
+
+def _float32_floor(values):
+    """
+    Largest float32 not above each of the float64 `values`.
+    """
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+def export_forest(model, forest_dir=FOREST_DIR, source=MODEL_FILE):
+    """
+    Flattens the trees of the fitted `model` into node arrays stored in `forest_dir`.
+
+    Parameters:
+    -----------
+    - `model`: Fitted single-output RandomForestClassifier.
+    - `forest_dir`: Target directory of the arrays.
+    - `source`: Pickled model the forest was loaded from, recorded for invalidation.
+
+    Returns:
+    --------
+    The exported `CompiledForest`.
+    """
+    if model.n_outputs_ != 1:
+        raise ValueError("Only single-output forests can be exported.")
+
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        # leaves point to themselves, so walking further keeps them in place
+        children.append(np.column_stack([
+            np.where(leaf, nodes, tree.children_left),
+            np.where(leaf, nodes, tree.children_right),
+        ]) + offset)
+        values.append(_leaf_probabilities(estimator))
+        roots.append(offset)
+        offset += tree.node_count
+
+    arrays = {
+        "feature": np.concatenate(features).astype(np.int32),
+        "threshold": _float32_floor(np.concatenate(thresholds)),
+        "children": np.concatenate(children).astype(np.int32).ravel(),
+        "value": np.concatenate(values).astype(np.float64),
+        "roots": np.array(roots, dtype=np.int32),
+    }
+    meta = {
+        "format": FORMAT_VERSION,
+        "signature": source_signature(source) if source and os.path.exists(source) else None,
+        "classes": model.classes_.tolist(),
+        "feature_names": [str(name) for name in getattr(model, "feature_names_in_", range(model.n_features_in_))],
+        "max_depth": int(max(estimator.tree_.max_depth for estimator in model.estimators_)),
+    }
+
+    os.makedirs(forest_dir, exist_ok=True)
+    for name, array in arrays.items():
+        save_array(os.path.join(forest_dir, f"{name}.npy"), array)
+    save_json(os.path.join(forest_dir, "manifest.json"), meta)
+    return CompiledForest(arrays, meta)
+
+
+def load_forest(forest_dir=FOREST_DIR, source=MODEL_FILE, mmap_mode=None):
+    """
+    Loads an exported forest, or returns `None` if it is missing or older than `source`.
+
+    Parameters:
+    -----------
+    - `forest_dir`: Directory written by `export_forest()`.
+    - `source`: Pickled model the export must match, `None` skips the check.
+    - `mmap_mode`: Passed to `numpy.load`, `"r"` maps the arrays read-only.
+    """
+    try:
+        with open(os.path.join(forest_dir, "manifest.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("format") != FORMAT_VERSION:
+        return None
+    if source and os.path.exists(source) and meta.get("signature") != source_signature(source):
+        return None
+
+    arrays = {
+        # plain ndarray views of the maps, so results of the evaluation are not memmaps
+        name: np.load(os.path.join(forest_dir, f"{name}.npy"), mmap_mode=mmap_mode).view(np.ndarray)
+        for name in ARRAYS
+    }
+    return CompiledForest(arrays, meta)
+
+
+class CompiledForest:
+    """
+    Random forest classifier evaluated from flat node arrays with NumPy only.
+
+    Attributes:
+    -----------
+    - `classes_`: Class labels, as in the exported model.
+    - `feature_names_in_`: Feature names the model was fitted with.
+    - `n_estimators`: Number of trees.
+    """
+
+    def __init__(self, arrays, meta):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.children = arrays["children"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.classes_ = np.array(meta["classes"])
+        self.feature_names_in_ = np.array(meta["feature_names"], dtype=object)
+        self.max_depth = meta["max_depth"]
+        self.n_estimators = len(self.roots)
+
+    def apply(self, X):
+        """
+        Returns the leaf reached in every tree, shape `(n_samples, n_estimators)`.
+
+        `X` must already be a float32 array with the columns in `feature_names_in_` order.
+        """
+        n_samples = X.shape[0]
+        columns = np.ascontiguousarray(X.T).ravel()
+        nodes = np.broadcast_to(self.roots, (n_samples, self.n_estimators)).copy()
+        offsets = np.arange(n_samples, dtype=np.int64)[:, np.newaxis]
+        for _ in range(self.max_depth):
+            goes_right = columns[self.feature[nodes] * n_samples + offsets] > self.threshold[nodes]
+            # the right child is stored right after the left one
+            nodes = self.children[2 * nodes + goes_right]
+        return nodes
+
+    def predict_proba(self, X):
+        """
+        Class probabilities of the samples in `X`, averaged over all trees.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names_in_):
+            raise ValueError(f"Expected {len(self.feature_names_in_)} features per sample.")
+        if not np.isfinite(X).all():
+            raise ValueError("Input contains NaN or infinity.")
+
+        proba = np.zeros((X.shape[0], self.value.shape[1]), dtype=np.float64)
+        chunk = max(1, PAIRS_PER_CHUNK // self.n_estimators)
+        for start in range(0, X.shape[0], chunk):
+            leaves = self.apply(X[start:start + chunk])
+            out = proba[start:start + chunk]
+            # summed tree by tree in order, exactly like sklearn accumulates them
+            for tree in range(self.n_estimators):
+                out += self.value[leaves[:, tree]]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        """
+        Predicted class of every sample in `X`.
+        """
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def main(argv=None):
+    """
+    Command line entry point that exports the pickled model into flat node arrays.
+    """
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Export the random forest into NumPy node arrays.")
+    parser.add_argument("--model", default=MODEL_FILE, help="pickled RandomForestClassifier")
+    parser.add_argument("--output", default=FOREST_DIR, help="target directory")
+    args = parser.parse_args(argv)
+
+    forest = export_forest(joblib.load(args.model), args.output, args.model)
+    print(f"Exported {forest.n_estimators} trees ({len(forest.feature)} nodes) to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
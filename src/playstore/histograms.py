@@ -0,0 +1,111 @@
+"""
+Rating Histograms
+=================
+
+Server-side binning of app ratings for the rating distribution page.
+
+Instead of sending every `Rating` row to the browser and letting Plotly bin them,
+`RatingHistograms` precomputes, for every (Category, Type) pair, the number of apps
+in each of a fixed set of rating bins and a Gaussian kernel density curve evaluated
+on a fixed grid. Both are sums over apps, so the histogram of any combination of
+categories and app types is the sum of the precomputed arrays. A figure therefore
+always carries `len(RATING_EDGES) - 1` bars and `len(DENSITY_GRID)` points, no
+matter how many rows the dataset has.
+
+The per-pair rating counts come from the aggregate cube, so building the
+histograms does not scan the raw rows again.
+
+Modules and Dependencies
+------------------------
+- `numpy`: Numerical operations and array manipulations.
+- `playstore.aggregates`: Precomputed aggregate cube with per-rating counts.
+- `playstore.data`: Snapshots of the shared dataset.
+"""
+
+import numpy as np
+
+from playstore.aggregates import cube_for
+from playstore.data import current_snapshot
+
+# Ratings have one decimal, bin edges sit halfway between them so no value falls on an edge
+RATING_EDGES = np.round(np.arange(0.95, 5.15 + 1e-9, 0.2), 2)
+DENSITY_GRID = np.linspace(1.0, 5.0, 81)
+# Fixed kernel width, which keeps the density curves additive across groups
+BANDWIDTH = 0.1
+
+
+class RatingHistograms:
+    """
+    Rating histograms and density curves per (Category, Type) pair.
+
+    Attributes:
+    -----------
+    - `categories`: Categories of the first axis of `counts` and `densities`.
+    - `types`: App types of the second axis.
+    - `counts`: Apps per rating bin, shape `(categories, types, bins)`.
+    - `densities`: Kernel density scaled to apps per bin width, shape `(categories, types, grid)`.
+    """
+
+    def __init__(self, categories, types, counts, densities):
+        self.categories = list(categories)
+        self.types = list(types)
+        self.counts = counts
+        self.densities = densities
+        self.bin_centers = (RATING_EDGES[:-1] + RATING_EDGES[1:]) / 2
+        self.bin_width = np.diff(RATING_EDGES)
+
+    @classmethod
+    def from_cube(cls, cube):
+        """
+        Builds the histograms from the per-rating app counts of the aggregate `cube`.
+        """
+        ratings = cube.rollup(["Category", "Type", "Rating"])["apps"]
+        ratings = ratings[ratings.index.get_level_values("Rating").notna()]
+        categories = ratings.index.get_level_values("Category").unique().sort_values()
+        types = ratings.index.get_level_values("Type").unique().sort_values()
+
+        counts = np.zeros((len(categories), len(types), len(RATING_EDGES) - 1))
+        densities = np.zeros((len(categories), len(types), len(DENSITY_GRID)))
+        kernel_scale = (RATING_EDGES[1] - RATING_EDGES[0]) / (BANDWIDTH * np.sqrt(2 * np.pi))
+
+        for (category, app_type), group in ratings.groupby(level=["Category", "Type"], observed=True):
+            values = group.index.get_level_values("Rating").to_numpy(dtype="float64")
+            weights = group.to_numpy(dtype="float64")
+            i, j = categories.get_loc(category), types.get_loc(app_type)
+            counts[i, j] = np.histogram(values, bins=RATING_EDGES, weights=weights)[0]
+            kernel = np.exp(-0.5 * ((DENSITY_GRID[:, None] - values[None, :]) / BANDWIDTH) ** 2)
+            densities[i, j] = kernel_scale * kernel @ weights
+
+        return cls(categories, types, counts, densities)
+
+    def _axis(self, values, selected):
+        if selected is None:
+            return slice(None)
+        return [values.index(selected)] if selected in values else []
+
+    def select(self, category=None, app_type=None):
+        """
+        Returns the histogram of one category and app type, `None` meaning all of them.
+
+        Returns:
+        --------
+        A tuple of the app counts per bin (aligned with `bin_centers`) and
+        the density curve (aligned with `DENSITY_GRID`).
+        """
+        i = self._axis(self.categories, category)
+        j = self._axis(self.types, app_type)
+        return self.counts[i][:, j].sum(axis=(0, 1)), self.densities[i][:, j].sum(axis=(0, 1))
+
+
+def histograms_for(snapshot):
+    """
+    Returns the `RatingHistograms` of the dataset `snapshot`, building them on first use.
+    """
+    return snapshot.derived("histograms", lambda snapshot: RatingHistograms.from_cube(cube_for(snapshot)))
+
+
+def get_histograms():
+    """
+    Returns the `RatingHistograms` of the shared dataset, building them on first use.
+    """
+    return histograms_for(current_snapshot())
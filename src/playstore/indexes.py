@@ -0,0 +1,255 @@
+"""
+Filter Indexes
+==============
+
+Prebuilt inverted indexes of the low-cardinality columns for cross-filtering rows.
+
+A filter on a column of the frame is a boolean mask over all rows, so every added
+filter is another scan of the whole table. `FilterIndex` instead keeps, for every
+column of `INDEXED_COLUMNS`:
+
+- the integer code of the value of every row (the category codes, shared with the
+  loaded frame, or the codes of `pandas.factorize`), and
+- the row positions of every value, sorted, stored as one array ordered by code
+  with the offset of every code (a sorted posting list per value).
+
+The values of every column are sorted, so a range filter, given as a `slice` of the
+lowest and highest accepted value, is the consecutive run of codes between them, e.g.
+`Android_Ver_Min=slice(None, pack_version("5.0"))` (see `playstore.etl.pack_version()`).
+
+A combination of filters is resolved by taking the posting lists of the most
+selective filter, which are already sorted row positions, and checking the codes of
+the other filtered columns at those positions only. The cost therefore grows with
+the number of rows of the most selective filter, not with the size of the table,
+and the resulting rows keep the order of the frame.
+
+The index of the shared dataset is built once per snapshot, see `filter_index_for()`.
+Compare it with boolean masks on a dataset with:
+
+```bash
+python -m playstore.indexes --benchmark
+```
+
+Modules and Dependencies
+------------------------
+- `time`: Timing the benchmark.
+- `argparse`: Command line interface.
+- `numpy`: Codes, posting lists and their intersection.
+- `pandas`: Factorizing columns and taking rows.
+"""
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+INDEXED_COLUMNS = (
+    "Category", "Type", "Content_Rating", "Genres", "Android_Ver", "Updated_Year", "Android_Ver_Min", "Android_Ver_Flag",
+)
+
+
+class ColumnIndex:
+    """
+    Codes and sorted row positions of every value of one column.
+
+    Parameters:
+    -----------
+    - `values`: Distinct values of the column, as an `Index`.
+    - `codes`: Position in `values` of the value of every row, -1 for missing values.
+    """
+
+    def __init__(self, values, codes):
+        self.values = values
+        self.codes = codes
+        present = codes >= 0
+        counts = np.bincount(codes[present], minlength=len(values))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        # stable, so the positions of every value stay sorted
+        self.positions = np.flatnonzero(present)[np.argsort(codes[present], kind="stable")]
+
+    @classmethod
+    def from_series(cls, series):
+        """
+        Indexes the values of `series`, reusing its codes if it is categorical.
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return cls(series.cat.categories, series.cat.codes.to_numpy())
+        codes, values = pd.factorize(series, sort=True)
+        return cls(values, codes)
+
+    def codes_for(self, value):
+        """
+        Returns the codes of a value, a list of values or a `slice` of values, ignoring values that do not occur.
+
+        A slice includes both bounds, a bound of `None` leaves that side open.
+        """
+        if isinstance(value, slice):
+            start, stop = self.values.slice_locs(value.start, value.stop)
+            return np.arange(start, stop)
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        codes = self.values.get_indexer(values)
+        return np.unique(codes[codes >= 0])
+
+    def count(self, codes):
+        """
+        Returns the number of rows holding any of the `codes`.
+        """
+        return int((self.offsets[codes + 1] - self.offsets[codes]).sum())
+
+    def rows(self, codes):
+        """
+        Returns the sorted positions of the rows holding any of the `codes`.
+        """
+        lists = [self.positions[self.offsets[code]:self.offsets[code + 1]] for code in codes]
+        if len(lists) == 1:
+            return lists[0]
+        return np.sort(np.concatenate(lists)) if lists else np.empty(0, dtype=self.positions.dtype)
+
+    def contains(self, codes, rows):
+        """
+        Returns whether each of the `rows` holds any of the `codes`.
+        """
+        # one extra entry, so code -1 of missing values looks up False
+        accepted = np.zeros(len(self.values) + 1, dtype=bool)
+        accepted[codes] = True
+        return accepted[self.codes[rows]]
+
+
+class FilterIndex:
+    """
+    Column indexes of a frame, resolving any combination of equality filters on them.
+
+    Parameters:
+    -----------
+    - `frame`: The indexed DataFrame.
+    - `columns`: Columns to index.
+    """
+
+    def __init__(self, frame, columns=INDEXED_COLUMNS):
+        self.rows = len(frame)
+        self.columns = {name: ColumnIndex.from_series(frame[name]) for name in columns}
+
+    def positions(self, **where):
+        """
+        Returns the sorted positions of the rows matching all filters `where`.
+
+        Parameters:
+        -----------
+        - `where`: Filters on indexed columns, `name=value`, `name=[values]` or `name=slice(low, high)`.
+        Raises `KeyError` for a filter on a column that is not indexed.
+        """
+        if not where:
+            return np.arange(self.rows)
+        selections = []
+        for name, value in where.items():
+            if name not in self.columns:
+                raise KeyError(f"'{name}' is not an indexed column")
+            index = self.columns[name]
+            codes = index.codes_for(value)
+            selections.append((index.count(codes), name, index, codes))
+        selections.sort(key=lambda selection: selection[:2])
+
+        _, _, index, codes = selections[0]
+        rows = index.rows(codes)
+        for _, _, index, codes in selections[1:]:
+            rows = rows[index.contains(codes, rows)]
+        return rows
+
+    def select(self, frame, columns=None, **where):
+        """
+        Returns the rows of the indexed `frame` matching `where`, optionally only some `columns`.
+        """
+        if columns is not None:
+            frame = frame[list(columns)]
+        return frame.take(self.positions(**where))
+
+
+def filter_index_for(snapshot):
+    """
+    Returns the `FilterIndex` of the frame of the dataset `snapshot`, building it on first use.
+    """
+    return snapshot.derived("filters", lambda snapshot: FilterIndex(snapshot.frame))
+
+
+def _mask_rows(frame, where):
+    mask = np.ones(len(frame), dtype=bool)
+    for name, value in where.items():
+        column = frame[name]
+        if isinstance(value, slice):
+            if value.start is not None:
+                mask &= (column >= value.start).to_numpy()
+            if value.stop is not None:
+                mask &= (column <= value.stop).to_numpy()
+            continue
+        mask &= (column.isin(value) if isinstance(value, (list, tuple, set)) else column == value).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def benchmark(frame, queries, repeat=5):
+    """
+    Times boolean masks against the `FilterIndex` of `frame` for every filter of `queries`.
+
+    Returns:
+    --------
+    A list of dicts with the filters, the matching rows and the best time of both methods.
+    """
+    start = time.perf_counter()
+    index = FilterIndex(frame)
+    build = time.perf_counter() - start
+
+    results = []
+    for where in queries:
+        timings = {}
+        for name, method in (("mask", lambda: _mask_rows(frame, where)), ("index", lambda: index.positions(**where))):
+            seconds = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                rows = method()
+                seconds.append(time.perf_counter() - start)
+            timings[name] = (min(seconds), rows)
+        if not np.array_equal(timings["mask"][1], timings["index"][1]):
+            raise AssertionError(f"Index result differs from the mask for {where}")
+        results.append({
+            "where": where,
+            "rows": len(timings["index"][1]),
+            "mask_seconds": timings["mask"][0],
+            "index_seconds": timings["index"][0],
+        })
+    return build, results
+
+
+def main(argv=None):
+    """
+    Command line entry point that compares boolean masks and the filter index.
+    """
+    from playstore.data import CLEAN_DATA_FILE, read_dataset
+    from playstore.etl import PARSED, pack_version
+
+    parser = argparse.ArgumentParser(description="Benchmark boolean masks against the filter index.")
+    parser.add_argument("--source", default=CLEAN_DATA_FILE, help="cleaned CSV file")
+    parser.add_argument("--benchmark", action="store_true", help="run the benchmark")
+    args = parser.parse_args(argv)
+    if not args.benchmark:
+        parser.error("nothing to do, the index is built in memory on first use; pass --benchmark")
+
+    frame, _ = read_dataset(args.source)
+    queries = [
+        {"Category": "GAME"},
+        {"Category": "GAME", "Type": "Paid"},
+        {"Type": "Free", "Content_Rating": "Teen", "Updated_Year": 2018},
+        {"Genres": ["Action", "Arcade"], "Content_Rating": "Everyone", "Android_Ver": "4.1 and up"},
+        {"Category": "EVENTS", "Type": "Free", "Content_Rating": "Everyone", "Updated_Year": [2017, 2018]},
+        {"Android_Ver_Flag": PARSED, "Android_Ver_Min": slice(None, pack_version("5.0"))},
+    ]
+    build, results = benchmark(frame, queries)
+    print(f"Indexed {len(frame)} rows in {build:.2f} s")
+    for result in results:
+        print(
+            f"{result['rows']:>9} rows  mask {result['mask_seconds'] * 1000:8.2f} ms  "
+            f"index {result['index_seconds'] * 1000:8.2f} ms  {result['where']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""
+Incremental Ingestion
+=====================
+
+Keeps the cleaned dataset up to date with new raw dumps without rebuilding it.
+
+`playstore.etl.clean_dataset()` rebuilds the whole cleaned CSV from all raw files.
+`ingest()` instead treats the cleaned CSV as a store and only processes what changed:
+
+- Raw files are skipped when their size and modification time match an ingested
+  file, or when their content hash does.
+- The cleaned rows of the remaining files are keyed by `App` and `Current_Ver`.
+  A row with a new key is appended, a row whose key is stored with other values
+  replaces the stored row, and an identical row is skipped.
+
+Unlike the full rebuild, which only drops exact duplicates as the notebook did, the
+store keeps a single row per key: of the repeated App entries of the Kaggle data
+(and of daily snapshots of the same app version) the last one in file order wins.
+
+Next to the CSV, a state directory keeps, for every stored row, the hashes of its
+key and of its values, its size and the byte offsets of its line. Updating the
+store therefore never parses the CSV: the lines of unchanged rows are copied byte
+for byte and only new and replaced rows are formatted. The `Varies with device`
+rows carry the median size of the store, so their lines are rewritten as well when
+the median moves. The CSV is written to a temporary file and moved into place.
+
+Every ingestion that changes the store bumps the `version` in the state manifest.
+`playstore.data.dataset_version()` includes it, so caches of derived results are
+keyed on it. If the CSV has no state yet or was changed by anything else (e.g. a
+full rebuild), the state is indexed from the CSV itself, in chunks, before the raw
+files are applied, so no key of it is lost; of rows repeating a key only the last
+is kept, as by the ingestion. All given raw files are then applied again. Its
+`Varies with device` rows carry the median size, so a cleaned row without a size
+matches its stored row when it does with that median, and the row is then kept
+as a `Varies with device` row. A CSV that cannot be indexed (other columns, line
+breaks inside values) is left untouched and the run fails, unless `--rebuild`
+replaces it with the rows of the given raw files only.
+
+The command line run also rewrites the app search index (see `playstore.search`)
+and the Category/Type partitioned copy (see `playstore.partitions`) of the store
+when they no longer match it. Run it with:
+
+```bash
+python -m playstore.ingest --source data/raw/daily
+python -m playstore.ingest --source data/raw/daily --rebuild
+```
+
+Modules and Dependencies
+------------------------
+- `io`: Formatting rewritten lines.
+- `os`: File system operations.
+- `csv`: Rewriting the size of stored lines.
+- `time`: Measuring the run time.
+- `json`: Reading the state manifest.
+- `hashlib`: Content hashes of raw files.
+- `logging`: Reporting rebuilds of the store.
+- `argparse`: Command line interface.
+- `dataclasses`: The run statistics.
+- `numpy`: Per-row state arrays.
+- `pandas`: Reading and formatting rows.
+- `playstore.cache`: Atomic writes and file signatures.
+- `playstore.data`: Path of the cleaned dataset.
+- `playstore.etl`: The cleaning rules.
+- `playstore.partitions`: Category/Type partitioned copy of the store.
+- `playstore.search`: Search index of the app names.
+"""
+
+import io
+import os
+import csv
+import time
+import json
+import hashlib
+import logging
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from playstore.cache import save_array, save_json, source_signature
+from playstore.data import CLEAN_DATA_FILE
+from playstore.etl import CHUNK_ROWS, COLUMNS, COLUMN_TYPES, RAW_DATA_FILE, clean_chunk, complete_rows, expand_sources
+from playstore.partitions import partition_dir_for, read_manifest, write_partitions
+from playstore.search import read_search_index, search_dir_for, write_search_index
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+KEY = ["App", "Current_Ver"]
+STATE_ARRAYS = ("keys", "hashes", "sizes", "offsets")
+# Rows of new files collected before they are applied to the store in one rewrite
+BATCH_ROWS = 250_000
+SIZE_FIELD = COLUMNS.index("Size")
+TEXT_COLUMNS = ["App", "Category", "Type", "Content_Rating", "Genres", "Current_Ver", "Android_Ver"]
+# Types of the columns as `clean_chunk()` returns them, so stored and cleaned rows hash alike
+CSV_TYPES = {column: COLUMN_TYPES.get(column, "str") for column in COLUMNS}
+
+
+@dataclass(frozen=True)
+class IngestStats:
+    """
+    Statistics of one ingestion run.
+
+    Attributes:
+    -----------
+    - `files_seen`: Raw files matched by the source.
+    - `files_ingested`: Raw files that were new or changed.
+    - `rows_added`: Rows with keys that were not stored yet.
+    - `rows_updated`: Stored rows replaced by changed values.
+    - `rows_unchanged`: Rows of ingested files that were already stored as they are.
+    - `rows`: Rows in the store after the run.
+    - `version`: Version of the store after the run.
+    - `seconds`: Wall time of the run.
+    """
+    files_seen: int
+    files_ingested: int
+    rows_added: int
+    rows_updated: int
+    rows_unchanged: int
+    rows: int
+    version: int
+    seconds: float
+
+
+def state_dir_for(output):
+    """
+    Returns the directory holding the ingestion state of the cleaned CSV `output`.
+    """
+    return f"{os.path.splitext(output)[0]}.ingest"
+
+
+def read_state(output=CLEAN_DATA_FILE):
+    """
+    Returns the state manifest of `output`, or `None` if there is none or it does not match the CSV.
+    """
+    try:
+        with open(os.path.join(state_dir_for(output), "manifest.json"), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") == FORMAT_VERSION and manifest.get("signature") == source_signature(output):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def store_version(output=CLEAN_DATA_FILE):
+    """
+    Returns the ingestion version of `output`, or `None` if it was not written by `ingest()`.
+    """
+    manifest = read_state(output)
+    return manifest["version"] if manifest else None
+
+
+def file_digest(path):
+    """
+    SHA-1 of the content of the file at `path`.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cleaned_rows(source, chunk_rows):
+    """
+    Yields the valid cleaned rows of the raw file `source`, chunk by chunk.
+
+    Line breaks inside text values are replaced by spaces, so every row is one line of the CSV.
+    """
+    for chunk in pd.read_csv(source, dtype=str, chunksize=chunk_rows):
+        complete, _ = complete_rows(chunk)
+        cleaned, _ = clean_chunk(complete)
+        for column in TEXT_COLUMNS:
+            cleaned[column] = cleaned[column].str.replace(r"[\r\n]+", " ", regex=True)
+        yield cleaned
+
+
+def _lines(frame, median):
+    """
+    Formats the rows of `frame` as CSV lines, with `median` for missing sizes.
+    """
+    text = frame.fillna({"Size": median}).to_csv(header=False, index=False).encode("utf-8")
+    return [line + b"\n" for line in text.split(b"\n")[:-1]]
+
+
+def _format_size(median):
+    return pd.Series([median], dtype="float64").to_csv(header=False, index=False).strip()
+
+
+def _with_size(line, size):
+    """
+    Returns the stored CSV `line` with its size field replaced by the text `size`.
+    """
+    fields = next(csv.reader([line.decode("utf-8")]))
+    fields[SIZE_FIELD] = size
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerow(fields)
+    return out.getvalue().encode("utf-8")
+
+
+def _blocks(f, start):
+    """
+    Yields the position and the content of the blocks of the open file `f` from `start` on.
+    """
+    f.seek(start)
+    position = start
+    for block in iter(lambda: f.read(1 << 20), b""):
+        yield position, block
+        position += len(block)
+
+
+def _copy_range(src, dst, start, end):
+    src.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = src.read(min(remaining, 1 << 20))
+        dst.write(block)
+        remaining -= len(block)
+
+
+class _Store:
+    """
+    Per-row state of the cleaned CSV: key and value hashes, sizes and line offsets.
+    """
+
+    def __init__(self, output, manifest, rebuild=False):
+        self.output = output
+        self.state_dir = state_dir_for(output)
+        self.manifest = manifest
+        # size the `Varies with device` rows of an indexed CSV were filled with
+        self.filled_size = np.nan
+        if manifest is None:
+            self.manifest = {"format": FORMAT_VERSION, "version": 0, "sources": {}}
+            header = (",".join(COLUMNS) + "\n").encode("utf-8")
+            self.keys = np.empty(0, dtype=np.uint64)
+            self.hashes = np.empty(0, dtype=np.uint64)
+            self.sizes = np.empty(0, dtype=np.float64)
+            self.offsets = np.array([len(header)], dtype=np.int64)
+            self.header = header
+            if os.path.exists(output) and not rebuild:
+                self._index(CHUNK_ROWS)
+        else:
+            for name in STATE_ARRAYS:
+                setattr(self, name, np.load(os.path.join(self.state_dir, f"{name}.npy")))
+            with open(output, "rb") as f:
+                self.header = f.read(int(self.offsets[0]))
+
+    def _index(self, chunk_rows):
+        """
+        Builds the state of the existing cleaned CSV from its rows and line offsets.
+
+        Rows repeating the key of a later row are dropped from the CSV, so every
+        key is stored once. Raises `ValueError` if the CSV does not have the cleaned
+        columns or not one line per row.
+        """
+        with open(self.output, "rb") as f:
+            header = f.readline()
+            ends = [np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n")) + position
+                    for position, block in _blocks(f, len(header))]
+        if header != self.header:
+            raise ValueError(f"{self.output} does not have the columns of the cleaned dataset")
+
+        keys, hashes, sizes = [], [], []
+        for chunk in pd.read_csv(self.output, dtype=CSV_TYPES, keep_default_na=False, na_values={"Size": [""]},
+                                 chunksize=chunk_rows):
+            keys.append(pd.util.hash_pandas_object(chunk[KEY], index=False).to_numpy())
+            hashes.append(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+            sizes.append(chunk["Size"].to_numpy(dtype="float64"))
+        self.keys = np.concatenate([self.keys, *keys])
+        self.hashes = np.concatenate([self.hashes, *hashes])
+        self.sizes = np.concatenate([self.sizes, *sizes])
+
+        ends = np.concatenate([np.empty(0, dtype=np.int64), *ends])
+        if len(ends) != len(self.keys):
+            raise ValueError(f"{self.output} has line breaks inside values and cannot be indexed")
+        self.offsets = np.concatenate([[len(header)], ends + 1]).astype(np.int64)
+        # the ETL fills them with the median of its rows, which the filled rows do not move
+        self.filled_size = self.median()
+
+        dropped = np.flatnonzero(pd.Series(self.keys).duplicated(keep="last").to_numpy())
+        if len(dropped):
+            logger.warning("Dropping %d rows of %s repeating a key", len(dropped), self.output)
+            self._rewrite({}, [], dropped)
+            self.keys, self.hashes, self.sizes = (np.delete(getattr(self, name), dropped)
+                                                  for name in ("keys", "hashes", "sizes"))
+
+    def median(self):
+        return np.nanmedian(self.sizes) if np.isfinite(self.sizes).any() else np.nan
+
+    def upsert(self, batch):
+        """
+        Applies the cleaned rows of `batch`, the last row of every key winning.
+
+        Returns:
+        --------
+        A tuple of the numbers of added, updated and unchanged rows.
+        """
+        keys = pd.util.hash_pandas_object(batch[KEY], index=False).to_numpy()
+        last = ~pd.Series(keys).duplicated(keep="last").to_numpy()
+        batch, keys = batch[last], keys[last]
+        hashes = pd.util.hash_pandas_object(batch, index=False).to_numpy()
+        # how the row hashes if it was stored by indexing a CSV with filled sizes
+        filled = pd.util.hash_pandas_object(batch.fillna({"Size": self.filled_size}), index=False).to_numpy()
+        old_median = self.median()
+
+        order = np.argsort(self.keys, kind="stable")
+        found = np.zeros(len(keys), dtype=bool)
+        changed = np.zeros(len(keys), dtype=bool)
+        rows = np.zeros(len(keys), dtype=np.int64)
+        converted = np.empty(0, dtype=np.int64)
+        if len(order):
+            at = np.minimum(np.searchsorted(self.keys[order], keys), len(order) - 1)
+            rows = order[at]
+            found = self.keys[rows] == keys
+            varies = found & (self.hashes[rows] != hashes) & (self.hashes[rows] == filled)
+            converted = rows[varies]
+            self.sizes[converted] = np.nan
+            self.hashes[converted] = hashes[varies]
+            changed = found & (self.hashes[rows] != hashes)
+        added = ~found
+
+        n_stored = len(self.keys)
+        updated_rows = rows[changed]
+        sizes = batch["Size"].to_numpy(dtype="float64")
+        self.sizes = np.concatenate([self.sizes, sizes[added]])
+        self.sizes[updated_rows] = sizes[changed]
+        median = self.median()
+
+        # converted lines carry the filled size, the other `Varies with device` lines the previous median
+        varies = np.flatnonzero(np.isnan(self.sizes[:n_stored]))
+        varies = varies[~np.isin(varies, updated_rows)]
+        carried = np.where(np.isin(varies, converted), self.filled_size, old_median)
+        stale = varies[(carried != median) & ~(np.isnan(carried) & np.isnan(median))]
+        if not (changed.any() or added.any() or len(stale)):
+            return 0, 0, int(found.sum())
+
+        replaced = dict(zip(updated_rows.tolist(), _lines(batch[changed], median)))
+        appended = _lines(batch[added], median)
+        if len(stale):
+            self._refill(stale, _format_size(median), replaced)
+
+        self._rewrite(replaced, appended)
+        self.keys = np.concatenate([self.keys, keys[added]])
+        self.hashes = np.concatenate([self.hashes, hashes[added]])
+        self.hashes[updated_rows] = hashes[changed]
+        return int(added.sum()), int(changed.sum()), int((found & ~changed).sum())
+
+    def _refill(self, rows, size, replaced):
+        """
+        Adds the stored `rows` with their size set to `size` to the `replaced` lines.
+        """
+        with open(self.output, "rb") as f:
+            for row in rows.tolist():
+                f.seek(int(self.offsets[row]))
+                replaced[row] = _with_size(f.read(int(self.offsets[row + 1] - self.offsets[row])), size)
+
+    def _rewrite(self, replaced, appended, dropped=()):
+        """
+        Writes the CSV with the `replaced` lines (by row), without the `dropped` rows and
+        with the `appended` lines, copying the others.
+        """
+        partial = f"{self.output}.tmp"
+        lengths = np.diff(self.offsets)
+        try:
+            with open(partial, "wb") as dst:
+                dst.write(self.header)
+                if len(lengths):
+                    with open(self.output, "rb") as src:
+                        position = int(self.offsets[0])
+                        for row in sorted({*replaced, *dropped}):
+                            _copy_range(src, dst, position, int(self.offsets[row]))
+                            if row in replaced:
+                                dst.write(replaced[row])
+                            position = int(self.offsets[row + 1])
+                        _copy_range(src, dst, position, int(self.offsets[-1]))
+                dst.writelines(appended)
+            os.replace(partial, self.output)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+        if replaced:
+            lengths[list(replaced)] = [len(line) for line in replaced.values()]
+        lengths = np.delete(lengths, list(dropped))
+        lengths = np.concatenate([lengths, np.array([len(line) for line in appended], dtype=np.int64)])
+        self.offsets = np.concatenate([[len(self.header)], len(self.header) + np.cumsum(lengths)]).astype(np.int64)
+
+    def save(self, bump):
+        """
+        Writes the state arrays and the manifest, increasing the version if `bump` is set.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        for name in STATE_ARRAYS:
+            save_array(os.path.join(self.state_dir, f"{name}.npy"), getattr(self, name))
+        if bump:
+            self.manifest["version"] += 1
+        self.manifest["signature"] = source_signature(self.output)
+        self.manifest["rows"] = len(self.keys)
+        save_json(os.path.join(self.state_dir, "manifest.json"), self.manifest)
+
+
+def ingest(source=RAW_DATA_FILE, output=CLEAN_DATA_FILE, chunk_rows=CHUNK_ROWS, rebuild=False):
+    """
+    Applies the new and changed raw files of `source` to the cleaned store at `output`.
+
+    Parameters:
+    -----------
+    - `source`: Raw Play Store CSV file, directory of CSV files or glob pattern.
+    - `output`: The cleaned CSV file kept up to date.
+    - `chunk_rows`: Number of raw rows read at a time.
+    - `rebuild`: Replace the rows of `output` by those of the raw files of `source`,
+      instead of indexing a CSV without ingestion state.
+
+    Returns:
+    --------
+    The `IngestStats` of the run.
+    Raises `ValueError`, before anything is written, if `output` has no ingestion
+    state and cannot be indexed; `rebuild` then replaces it.
+    """
+    start = time.perf_counter()
+    sources = expand_sources(source)
+    manifest = None if rebuild else read_state(output)
+    if manifest is None and os.path.exists(output):
+        if rebuild:
+            logger.warning("Rebuilding %s from %s", output, source)
+        else:
+            logger.warning("%s has no ingestion state, indexing its rows", output)
+    # a rebuilt store keeps none of the old lines, and a new store gets its header
+    fresh = rebuild or not os.path.exists(output)
+    store = _Store(output, manifest, rebuild)
+    known = store.manifest["sources"]
+    digests = {entry["sha1"] for entry in known.values()}
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    ingested = added = updated = unchanged = 0
+    batch = []
+
+    def flush():
+        nonlocal added, updated, unchanged
+        if batch:
+            counts = store.upsert(pd.concat(batch, ignore_index=True))
+            added, updated, unchanged = added + counts[0], updated + counts[1], unchanged + counts[2]
+            batch.clear()
+
+    for path in sources:
+        name = os.path.abspath(path)
+        signature = source_signature(path)
+        if name in known and known[name]["signature"] == signature:
+            continue
+        digest = file_digest(path)
+        if digest not in digests:
+            for cleaned in _cleaned_rows(path, chunk_rows):
+                batch.append(cleaned)
+                if sum(len(frame) for frame in batch) >= BATCH_ROWS:
+                    flush()
+            ingested += 1
+            digests.add(digest)
+        known[name] = {"signature": signature, "sha1": digest}
+    flush()
+    if fresh and not (added or updated):
+        store._rewrite({}, [])
+
+    store.save(bump=bool(added or updated) or fresh)
+    return IngestStats(
+        files_seen=len(sources),
+        files_ingested=ingested,
+        rows_added=added,
+        rows_updated=updated,
+        rows_unchanged=unchanged,
+        rows=len(store.keys),
+        version=store.manifest["version"],
+        seconds=time.perf_counter() - start,
+    )
+
+
+def main(argv=None):
+    """
+    Command line entry point that ingests new raw dumps into the cleaned dataset.
+    """
+    parser = argparse.ArgumentParser(description="Incrementally ingest raw Google Play Store CSV dumps.")
+    parser.add_argument("--source", default=RAW_DATA_FILE, help="raw CSV file, directory of CSV files or glob")
+    parser.add_argument("--output", default=CLEAN_DATA_FILE, help="cleaned CSV file")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="raw rows read at a time")
+    parser.add_argument("--rebuild", action="store_true", help="replace the cleaned CSV by the rows of the raw files")
+    args = parser.parse_args(argv)
+
+    try:
+        stats = ingest(args.source, args.output, args.chunk_rows, args.rebuild)
+    except ValueError as e:
+        parser.exit(1, f"{e}; nothing was written. Run again with --rebuild to replace it by the rows of {args.source}.\n")
+    print(
+        f"Ingested {stats.files_ingested} of {stats.files_seen} files in {stats.seconds:.2f} s: "
+        f"{stats.rows_added} added, {stats.rows_updated} updated, {stats.rows_unchanged} unchanged"
+    )
+    print(f"Store {args.output} has {stats.rows} rows, version {stats.version}")
+    if read_search_index(args.output) is None:
+        index = write_search_index(args.output)
+        print(f"Search index of {len(index)} apps saved to: {search_dir_for(args.output)}")
+    if read_manifest(args.output) is None:
+        manifest = write_partitions(args.output)
+        print(f"{len(manifest['partitions'])} Category/Type partitions saved to: {partition_dir_for(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,81 @@
+"""
+Dashboard Entry Point
+=====================
+
+The Dash application with its pages and routes, and the `dashboard` command serving it.
+
+Importing the module loads no data and none of pandas, numpy or the Plotly figure
+modules: the pages import them in their callbacks. The app shell is therefore served
+as soon as Dash itself is imported, and the data is loaded after the server is
+listening, either by `preload()` or by `warm_up()`.
+
+`main()` serves `app.server` with gunicorn as a pre-fork deployment. Once the socket
+is bound, the master process loads the dataset, the results derived from it and the
+prediction model (see `preload()`), then forks the workers. The workers share those
+pages copy-on-write instead of each loading its own copy, so the memory of every
+further worker is mostly the requests it serves. `gc.freeze()` keeps the garbage
+collector of the workers from writing to the preloaded objects, which would copy
+their pages.
+
+Run it with:
+
+```bash
+pip install -e ".[server]"
+dashboard --workers 4 --port 8050
+dashboard --no-preload
+dashboard --dev
+```
+
+With `--no-preload` the workers answer at once and each loads its own copy of the
+data on a background thread (`warm_up()`), trading memory for the shortest start.
+`--dev` runs the single-process Dash development server with debugging and reloading
+instead, warming up the same way. Every worker logs its memory when ready, the
+private part is what it does not share with the master. The import cost of every
+module is reported by `python -m playstore.startup`.
+
+`/metrics` serves the request, callback, cache, data and model metrics of all
+workers, and `/profile` the samples of the optional profiler (see `playstore.metrics`).
+
+Modules and Dependencies
+------------------------
+- `gc`: Freezing the preloaded objects before forking.
+- `os`: Number of CPUs.
+- `logging`: Reporting the preload and the worker memory.
+- `argparse`: Command line interface.
+- `time`: Timing the preload.
+- `threading`: The background warm-up.
+- `dash`: Core framework for creating Dash apps.
+- `dash_bootstrap_components`: Bootstrap styling components for Dash.
+- `flask`: JSON routes of the server.
+- `gunicorn`: The pre-fork WSGI server, optional.
+- `playstore.aggregates`: Aggregate cube, preloaded.
+- `playstore.config`: Configuration for the application.
+- `playstore.data`: Dataset snapshots and their reloader, preloaded.
+- `playstore.figcache`: Shared cache of the callback results.
+- `playstore.histograms`: Rating histograms, preloaded.
+- `playstore.indexes`: Filter index, preloaded.
+- `playstore.metrics`: Metrics and profiler routes and their exporter.
+- `playstore.predict`: Prediction API and model.
+- `playstore.search`: App search index, preloaded.
+"""
+
+import gc
+import os
+import time
+import logging
+import argparse
+import threading
+
 from dash import Dash, html, page_container
 import dash_bootstrap_components as dbc
+from flask import jsonify
+
+from playstore.config import DATA_RELOAD_INTERVAL, METRICS_ENABLED, MODEL_WARM_UP, QUERY_BACKEND
+from playstore.figcache import figure_cache
+from playstore.metrics import api as metrics_api, exporter as metrics_exporter
+from playstore.predict import api as predict_api, model_manager
+
+logger = logging.getLogger(__name__)
 
 app = Dash(
     __name__,
@@ -9,6 +85,17 @@ app = Dash(
     external_stylesheets=[dbc.themes.BOOTSTRAP],
 )
 server = app.server
+server.register_blueprint(predict_api)
+if METRICS_ENABLED:
+    server.register_blueprint(metrics_api)
+
+
+@server.route("/figure-cache")
+def figure_cache_stats():
+    """
+    Hit and miss counters of the shared figure cache, summed over all workers.
+    """
+    return jsonify(figure_cache.stats())
 
 
 sidebar = html.Div(
@@ -61,6 +148,15 @@ sidebar = html.Div(
                     active="exact",
                     style={"color": "white"}
                 ),
+                dbc.NavLink(
+                    [
+                        html.Img(src="assets/3d_box.png", style={"height": "24px", "margin-right": "10px"}),
+                        "App Search"
+                    ],
+                    href="/search",
+                    active="exact",
+                    style={"color": "white"}
+                ),
             ],
             vertical=True,
             pills=True,
@@ -109,5 +205,165 @@ content = html.Div(
 
 app.layout = html.Div([sidebar, content])
 
+
+def load_data():
+    """
+    Loads the dataset and everything the pages derive from it, and starts the dataset reloader.
+
+    Returns:
+    --------
+    The loaded `Snapshot`.
+    """
+    from playstore.aggregates import get_cube
+    from playstore.data import current_snapshot, reloader
+    from playstore.histograms import get_histograms
+    from playstore.indexes import filter_index_for
+    from playstore.search import get_search_index
+
+    snapshot = current_snapshot()
+    get_cube()
+    get_histograms()
+    get_search_index()
+    if QUERY_BACKEND == "pandas":
+        filter_index_for(snapshot)
+    if DATA_RELOAD_INTERVAL:
+        reloader.start(DATA_RELOAD_INTERVAL)
+    return snapshot
+
+
+def preload():
+    """
+    Loads the data of `load_data()` and the prediction model.
+
+    Called in the master process before the workers are forked, so they all share
+    the loaded data instead of loading it again on their first requests.
+    """
+    start = time.perf_counter()
+    snapshot = load_data()
+    try:
+        model_manager.get()
+    except OSError as e:
+        logger.warning("Could not preload the prediction model: %s", e)
+    # move everything loaded so far out of reach of the collector, which would
+    # otherwise touch, and so copy, the shared pages in every worker
+    gc.freeze()
+    logger.info("Preloaded dataset version %s in %.2f s", snapshot.version, time.perf_counter() - start)
+
+
+def _warm_up_data():
+    start = time.perf_counter()
+    try:
+        snapshot = load_data()
+    except Exception:
+        # the pages load the data themselves on their first use
+        logger.exception("Dataset warm-up failed")
+        return
+    logger.info("Warmed up dataset version %s in %.2f s", snapshot.version, time.perf_counter() - start)
+
+
+def warm_up():
+    """
+    Starts loading the data of `load_data()` and, with `MODEL_WARM_UP`, the model on daemon threads.
+
+    The process keeps answering requests meanwhile; one that needs the data before
+    it is loaded waits for the load, as it would without the warm-up.
+    """
+    if MODEL_WARM_UP:
+        model_manager.warm_up()
+    threading.Thread(target=_warm_up_data, name="data-warm-up", daemon=True).start()
+
+
+def _memory():
+    """
+    Returns the resident and the private memory of this process in bytes, `None` where not available.
+    """
+    try:
+        with open("/proc/self/smaps_rollup", encoding="utf-8") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    kib = {name: int(value.split()[0]) * 1024 for name, value in fields.items() if value.strip().endswith("kB")}
+    return kib["Rss"], kib["Private_Clean"] + kib["Private_Dirty"]
+
+
+def start_metrics():
+    """
+    Discards the metrics of earlier runs and starts exporting the metrics of this process and its workers.
+    """
+    if METRICS_ENABLED:
+        metrics_exporter.clear()
+        metrics_exporter.start()
+
+
+def _when_ready(arbiter):
+    start_metrics()
+    # the socket is bound, so clients queue up while the master loads the data
+    if arbiter.cfg.preload_app:
+        preload()
+
+
+def _post_worker_init(worker):
+    memory = _memory()
+    if memory:
+        worker.log.info("Worker %s ready: RSS %.1f MiB, private %.1f MiB", worker.pid, *(size / 2 ** 20 for size in memory))
+    if not worker.cfg.preload_app:
+        warm_up()
+
+
+def _serve(options):
+    """
+    Serves `app.server` with gunicorn, configured by the gunicorn settings `options`.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            hooks = {"when_ready": _when_ready, "post_worker_init": _post_worker_init}
+            for name, value in {**options, **hooks}.items():
+                self.cfg.set(name, value)
+
+        def load(self):
+            return server
+
+    Server().run()
+
+
+def main(argv=None):
+    """
+    Command line entry point that serves the dashboard.
+    """
+    parser = argparse.ArgumentParser(description="Serve the Google Play Store dashboard.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8050, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes, one per CPU by default")
+    parser.add_argument("--threads", type=int, default=1, help="request threads per worker")
+    parser.add_argument("--timeout", type=int, default=60, help="seconds before a silent worker is restarted")
+    parser.add_argument("--no-preload", action="store_true", help="load the data in every worker instead of once before forking")
+    parser.add_argument("--dev", action="store_true", help="run the Dash development server instead")
+    args = parser.parse_args(argv)
+
+    if args.dev:
+        # the reloader serves from a child process, the watching parent needs no data
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            start_metrics()
+            warm_up()
+        app.run(host=args.host, port=args.port, debug=True)
+        return
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        parser.error('the pre-fork server needs gunicorn, install it with: pip install "playstore[server]"')
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(process)d] [%(levelname)s] %(message)s")
+    _serve({
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "threads": args.threads,
+        "timeout": args.timeout,
+        "preload_app": not args.no_preload,
+        "accesslog": None,
+    })
+
+
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    main()
@@ -0,0 +1,563 @@
+"""
+Metrics
+=======
+
+Prometheus metrics of the dashboard and an on-demand sampling profiler.
+
+The `api` blueprint times every request of the Flask server of the dashboard. Dash
+callback requests (`/_dash-update-component`) are also recorded per callback, keyed
+by their output as in the Dash dev tools, with the size of the response. Requests
+naming an output no callback of the app has are all recorded as `other`, so clients
+cannot add labels. The rest of the package records the figure cache lookups
+(`playstore.figcache`), the load of the dataset and of every result derived from it
+(`playstore.data`) and the load and prediction calls of the model
+(`playstore.predict`). All metrics are declared below.
+
+Every process keeps its metrics in memory. The `exporter` thread writes them to a
+file per process in `METRICS_DIR` every `METRICS_INTERVAL` seconds, and `GET /metrics`
+sums the files of all workers into the Prometheus text format, so a scrape reaching
+any worker reports the whole deployment. The files of exited workers are kept, so
+counters never go back; `exporter.clear()` empties the directory when the server starts.
+
+With `PROFILER_TOGGLE` enabled, `POST /profile/start` switches the `SamplingProfiler`
+of every worker on (within `METRICS_INTERVAL` seconds) and `POST /profile/stop` off.
+While on, it records every `PROFILER_INTERVAL` seconds the stacks of the threads
+answering a request, rooted at the route or callback they answer, so idle workers
+and background threads add nothing. `GET /profile` returns the samples of all
+workers as folded stacks, the input of `flamegraph.pl` and speedscope.
+
+Request times end when the response starts, a streamed response such as a large
+prediction batch is not included until its end.
+
+With `METRICS_ENABLED = False`, the blueprint is not registered and recording a
+metric returns at once, so the instrumentation costs nothing.
+
+```bash
+curl localhost:8050/metrics
+curl -X POST localhost:8050/profile/start; sleep 30; curl localhost:8050/profile > profile.folded
+```
+
+Modules and Dependencies
+------------------------
+- `os`: Metric files of the processes.
+- `sys`: Stacks of the running threads.
+- `glob`: Finding the files of all processes.
+- `json`: The metric and profile files.
+- `time`: Timing requests.
+- `bisect`: Histogram buckets.
+- `logging`: Reporting export failures.
+- `threading`: The export and sampling threads.
+- `contextlib`: Timing blocks of code.
+- `collections`: Counting profile samples.
+- `flask`: Request hooks and the metrics and profile routes.
+- `dash`: The registered callbacks, imported on first use.
+- `playstore.config`: Configuration for the application.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import bisect
+import logging
+import threading
+import contextlib
+from collections import Counter as SampleCounter
+
+from flask import Blueprint, Response, g, request
+
+from playstore.config import (
+    METRICS_DIR, METRICS_ENABLED, METRICS_INTERVAL, PROFILER_INTERVAL, PROFILER_TOGGLE,
+)
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOAD_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CALLBACK_PATH = "/_dash-update-component"
+PROFILING_FLAG = "profiling"
+
+
+class Metric:
+    """
+    A named metric with a value per combination of label values.
+
+    Parameters:
+    -----------
+    - `name`: Metric name of the exposition format.
+    - `documentation`: Help text of the metric.
+    - `labels`: Names of its labels.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Forgets all recorded values.
+        """
+        with self._lock:
+            self._values = {}
+
+    def _after_fork(self):
+        # the inherited lock may be held by a parent thread that does not exist in the child
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def state(self):
+        """
+        Returns the recorded values as a JSON-serializable list of `[label values, values]` pairs.
+        """
+        with self._lock:
+            return [[list(key), list(values)] for key, values in self._values.items()]
+
+    def _sample(self, name, labels, value):
+        pairs = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+        return f"{name}{{{pairs}}} {value}" if pairs else f"{name} {value}"
+
+
+class Counter(Metric):
+    """
+    A monotonically increasing count.
+    """
+
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        """
+        Adds `amount` to the count of the label values `labels`.
+        """
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            values = self._values.setdefault(labels, [0])
+            values[0] += amount
+
+    def lines(self, values):
+        """
+        Returns the sample lines of the merged `values` by label values.
+        """
+        return [self._sample(self.name, zip(self.labels, key), count) for key, (count,) in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """
+    Counts of observed values in cumulative buckets, with their sum.
+
+    Parameters:
+    -----------
+    - `buckets`: Sorted upper bounds of the buckets, an implicit `+Inf` bucket is added.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        """
+        Records `value` for the label values `labels`.
+        """
+        if not METRICS_ENABLED:
+            return
+        # buckets are upper bounds, a value equal to a bound belongs to its bucket
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                # one count per bucket, the +Inf bucket and the sum
+                values = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            values[index] += 1
+            values[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *labels):
+        """
+        Context manager observing the seconds its block took.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def lines(self, values):
+        """
+        Returns the sample lines of the merged `values` by label values.
+        """
+        lines = []
+        for key, counts in sorted(values.items()):
+            labels = list(zip(self.labels, key))
+            total = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts[:-1]):
+                total += count
+                lines.append(self._sample(f"{self.name}_bucket", [*labels, ("le", bound)], total))
+            lines.append(self._sample(f"{self.name}_sum", labels, counts[-1]))
+            lines.append(self._sample(f"{self.name}_count", labels, total))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    """
+    The metrics of the package, their state and their exposition.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, documentation, labels=()):
+        """
+        Declares a `Counter`.
+        """
+        return self._add(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Declares a `Histogram`.
+        """
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric '{metric.name}' is already declared")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def reset(self):
+        """
+        Forgets the recorded values of all metrics.
+        """
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def _after_fork(self):
+        for metric in self.metrics.values():
+            metric._after_fork()
+
+    def state(self):
+        """
+        Returns the recorded values of all metrics by name, see `Metric.state()`.
+        """
+        return {name: metric.state() for name, metric in self.metrics.items()}
+
+    def render(self, states):
+        """
+        Sums the `states` of several processes and returns them in the Prometheus text format.
+        """
+        lines = []
+        for name, metric in self.metrics.items():
+            merged = {}
+            for state in states:
+                for key, values in state.get(name, []):
+                    key = tuple(key)
+                    if key in merged:
+                        merged[key] = [a + b for a, b in zip(merged[key], values)]
+                    else:
+                        merged[key] = values
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.lines(merged))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "playstore_http_request_duration_seconds", "Time to answer HTTP requests, by route.", ["route"],
+)
+CALLBACK_SECONDS = registry.histogram(
+    "playstore_callback_duration_seconds", "Time to answer Dash callback requests, by callback output.", ["callback"],
+)
+CALLBACK_RESPONSE_BYTES = registry.histogram(
+    "playstore_callback_response_bytes", "Size of the Dash callback responses, by callback output.", ["callback"],
+    SIZE_BUCKETS,
+)
+FIGURE_CACHE_REQUESTS = registry.counter(
+    "playstore_figure_cache_requests_total", "Figure cache lookups, by callback and result (hit or miss).",
+    ["callback", "result"],
+)
+DATA_LOAD_SECONDS = registry.histogram(
+    "playstore_data_load_duration_seconds",
+    "Time to read the dataset frame and to build every result derived from it, by step.", ["step"], LOAD_BUCKETS,
+)
+MODEL_LOAD_SECONDS = registry.histogram(
+    "playstore_model_load_duration_seconds", "Time to load the prediction model.", buckets=LOAD_BUCKETS,
+)
+MODEL_INFERENCE_SECONDS = registry.histogram(
+    "playstore_model_inference_duration_seconds", "Time of the prediction calls of the model.",
+)
+MODEL_INFERENCE_ROWS = registry.counter(
+    "playstore_model_inference_rows_total", "Apps scored by the model.",
+)
+
+
+class SamplingProfiler:
+    """
+    Records the stacks of the threads answering a request every `interval` seconds on a daemon thread.
+
+    Attributes:
+    -----------
+    - `samples`: Number of samples of every stack, folded into `request;outer;...;inner`.
+    - `active`: Request label of every thread answering a request, by thread id.
+    """
+
+    def __init__(self, interval=PROFILER_INTERVAL):
+        self.interval = interval
+        self.samples = SampleCounter()
+        self.active = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        """
+        Whether the sampling thread is running.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Forgets the previous samples and starts sampling, unless it is already running.
+        """
+        if self.running:
+            return
+        self.samples = SampleCounter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops sampling, keeping the samples.
+        """
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, label in list(self.active.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    # co_qualname is new in Python 3.11
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}")
+                    frame = frame.f_back
+                stack.append(label)
+                self.samples[";".join(reversed(stack))] += 1
+
+
+class MetricsExporter:
+    """
+    Shares the metrics and profile samples of every process through files of one directory.
+
+    Parameters:
+    -----------
+    - `registry`: The metrics of the process.
+    - `profiler`: The `SamplingProfiler` of the process.
+    - `directory`: Directory of the files of all processes.
+    - `interval`: Seconds between writes of the files of this process.
+    """
+
+    def __init__(self, registry, profiler, directory=METRICS_DIR, interval=METRICS_INTERVAL):
+        self.registry = registry
+        self.profiler = profiler
+        self.directory = directory
+        self.interval = interval
+        self._started = False
+        self._stop = threading.Event()
+        self._thread = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # the child starts with the values of the parent, which the parent reports itself
+        self.registry._after_fork()
+        self.profiler.samples = SampleCounter()
+        self.profiler.active = {}
+        self.profiler._thread = None
+        self._thread = None
+        self._stop = threading.Event()
+        if self._started:
+            self.start()
+
+    def start(self):
+        """
+        Starts writing the files of this process every `interval` seconds, unless it is already running.
+        """
+        self._started = True
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning("Could not export the metrics: %s", e)
+
+    def _path(self, pid, kind):
+        return os.path.join(self.directory, f"{pid}.{kind}.json")
+
+    def _write(self, kind, value):
+        path = self._path(os.getpid(), kind)
+        partial = f"{path}.tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(partial, path)
+
+    def _read(self, kind):
+        values = []
+        for path in glob.glob(self._path("*", kind)):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    values.append(json.load(f))
+            except (OSError, ValueError):
+                # a process that exited while its file was being replaced
+                continue
+        return values
+
+    def flush(self):
+        """
+        Writes the metrics and profile samples of this process and follows the profiling toggle.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        profiling = os.path.exists(os.path.join(self.directory, PROFILING_FLAG))
+        if profiling and not self.profiler.running:
+            self.profiler.start()
+        elif not profiling and self.profiler.running:
+            self.profiler.stop()
+        self._write("metrics", self.registry.state())
+        if self.profiler.samples:
+            self._write("profile", dict(self.profiler.samples))
+
+    def render(self):
+        """
+        Returns the summed metrics of all processes in the Prometheus text format.
+        """
+        self.flush()
+        return self.registry.render(self._read("metrics"))
+
+    def profile(self):
+        """
+        Returns the summed profile samples of all processes as folded stacks, one `stack count` per line.
+        """
+        self.flush()
+        samples = SampleCounter()
+        for counts in self._read("profile"):
+            samples.update(counts)
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(samples.items()))
+
+    def set_profiling(self, enabled):
+        """
+        Switches the profilers of all processes on or off at their next write.
+
+        Switching on discards the samples of the previous profile.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        flag = os.path.join(self.directory, PROFILING_FLAG)
+        if enabled:
+            for path in glob.glob(self._path("*", "profile")):
+                os.remove(path)
+            open(flag, "w").close()
+        elif os.path.exists(flag):
+            os.remove(flag)
+
+    def clear(self):
+        """
+        Removes the files of all processes and the profiling toggle.
+        """
+        for path in glob.glob(os.path.join(self.directory, "*")):
+            os.remove(path)
+
+
+profiler = SamplingProfiler()
+exporter = MetricsExporter(registry, profiler)
+
+api = Blueprint("metrics", __name__)
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _callback_output():
+    from dash import get_app
+
+    # the parsed body is cached on the request, Dash reads the same one
+    body = request.get_json(silent=True)
+    output = body.get("output") if isinstance(body, dict) else None
+    # the client picks the output, so only registered callbacks get a label of their own
+    return output if isinstance(output, str) and output in get_app().callback_map else "other"
+
+
+@api.before_app_request
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+    if profiler.running:
+        label = _callback_output() if request.path.endswith(CALLBACK_PATH) else _route()
+        profiler.active[threading.get_ident()] = label
+
+
+@api.after_app_request
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    seconds = time.perf_counter() - start
+    REQUEST_SECONDS.observe(seconds, _route())
+    if request.path.endswith(CALLBACK_PATH):
+        output = _callback_output()
+        CALLBACK_SECONDS.observe(seconds, output)
+        size = response.calculate_content_length()
+        if size is not None:
+            CALLBACK_RESPONSE_BYTES.observe(size, output)
+    return response
+
+
+@api.teardown_app_request
+def _end_request(error):
+    profiler.active.pop(threading.get_ident(), None)
+
+
+@api.route("/metrics")
+def metrics_route():
+    """
+    Metrics of all workers in the Prometheus text format.
+    """
+    return Response(exporter.render(), mimetype="text/plain; version=0.0.4")
+
+
+@api.route("/profile")
+def profile_route():
+    """
+    Profile samples of all workers as folded stacks.
+    """
+    if not PROFILER_TOGGLE:
+        return Response("Profiling is disabled.\n", status=404, mimetype="text/plain")
+    return Response(exporter.profile(), mimetype="text/plain")
+
+
+@api.route("/profile/<action>", methods=["POST"])
+def profile_toggle_route(action):
+    """
+    Switches the profilers of all workers on (`start`) or off (`stop`).
+    """
+    if not PROFILER_TOGGLE or action not in ("start", "stop"):
+        return Response("Not found.\n", status=404, mimetype="text/plain")
+    exporter.set_profiling(action == "start")
+    return Response(f"Profiling {'started' if action == 'start' else 'stopped'}, workers follow within {exporter.interval} s.\n", mimetype="text/plain")
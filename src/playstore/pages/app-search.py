@@ -0,0 +1,83 @@
+"""
+App Search Dash Application
+===========================
+
+This Dash application lets users look up apps of the Google Play Store dataset by name.
+
+Results are updated while typing, from the prebuilt search index of the dataset, and
+tolerate typos. Every result links to the statistics of its category on the
+Average Distribution page. The index is loaded by the first search, not when the
+page is imported.
+
+Modules and Dependencies
+------------------------
+- `urllib.parse`: Category links.
+- `dash`: Core framework for creating Dash apps.
+- `dash_bootstrap_components`: Bootstrap styling components for Dash.
+- `playstore.search`: Prebuilt search index of the app names.
+"""
+
+from urllib.parse import urlencode
+
+from dash import html, dcc, callback, Output, Input, register_page
+import dash_bootstrap_components as dbc
+
+# Page Registration
+register_page(__name__, path="/search", name="App Search")
+
+MATCH_LABELS = {'prefix': 'Name', 'word': 'Word', 'similar': 'Similar'}
+
+# Layout Definition
+layout = html.Div(
+    [
+        html.H1("App Search", className="text-google-play text-center mb-4"),
+        html.Div([
+            dcc.Input(
+                id='app-search-query',
+                type='search',
+                placeholder="Type an app name",
+                autoComplete='off',
+                debounce=False,
+                className="form-control"
+            ),
+        ], className="card p-4 shadow-sm mb-4"),
+        html.Div(id='app-search-results'),
+    ],
+    className="container",
+)
+
+
+# Callback to Update the Results
+@callback(
+    Output('app-search-results', 'children'),
+    [Input('app-search-query', 'value')]
+)
+def update_search_results(query):
+    """
+    Lists the apps matching the typed `query`, each with a link to its category statistics.
+    """
+    from playstore.search import get_search_index
+
+    if not query or not query.strip():
+        return html.P("Start typing to search the apps.", className="text-muted")
+
+    results = get_search_index().search(query)
+    if not results:
+        return html.P(f"No apps match \"{query}\".", className="text-muted")
+
+    return dbc.ListGroup([
+        dbc.ListGroupItem(
+            html.Div([
+                html.Div([
+                    html.Span(result['App'], className="fw-bold me-2"),
+                    dbc.Badge(MATCH_LABELS[result['match']], color="light", text_color="secondary"),
+                ]),
+                dcc.Link(
+                    result['Category'],
+                    href=f"/average-distribution?{urlencode({'category': result['Category']})}",
+                    className="text-google-play"
+                ),
+            ], className="d-flex justify-content-between align-items-center")
+        )
+        for result in results
+    ], className="shadow-sm")
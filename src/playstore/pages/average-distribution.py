@@ -7,79 +7,120 @@ Users can filter by category and app type (Free or Paid) to analyze the rating d
 
 The application is built with Dash, Plotly, and Bootstrap, providing interactive filtering and visualization.
 
+Plotly and the precomputed data are imported on the first visit of the page, so it
+adds nothing to the startup of the dashboard.
+
 Modules and Dependencies
 ------------------------
-- `os`: File system operations.
-- `pandas`: Data manipulation and analysis.
-- `numpy`: Numerical operations and array manipulations.
+- `math`: Missing averages.
 - `dash`: Core framework for creating Dash apps.
 - `dash_bootstrap_components`: Bootstrap styling components for Dash.
-- `plotly.express`: Simplified interface for Plotly visualizations.
-- `playstore.config`: Configuration for the application.
+- `playstore.aggregates`: Precomputed aggregate cube for the stat cards and the category filter.
+- `playstore.histograms`: Precomputed rating histograms and density curves.
+- `playstore.figcache`: Shared cache of the callback results.
 - `plotly.graph_objects`: Low-level interface for creating Plotly visualizations.
 """
 
-import os
-import pandas as pd
-import numpy as np
+import math
+
 from dash import html, dcc, callback, Output, Input, register_page
 import dash_bootstrap_components as dbc
-import plotly.express as px
-from playstore.config import CLEAN_DATA_DIR
-import plotly.graph_objects as go
+from playstore.figcache import cached_figure
 
 # Page Registration
 register_page(__name__, path="/average-distribution", name="Success Prediction")
 
-# Load Data
-df = pd.read_csv(os.path.join(CLEAN_DATA_DIR, "cleaned_googleplaystore.csv"))
-
 # Layout Definition
-layout = html.Div(
-  [
-      html.H1("Average Distribution", className="text-google-play text-center mb-4"),
-      html.Div([
-          html.H3("Filters", className="h5 mb-3 fw-bold"),
-          dcc.Dropdown(
-              id='category-filter',
-              options=[{'label': cat, 'value': cat} for cat in sorted(df['Category'].unique())],
-              value=None,
-              placeholder="Select a category",
-              className="form-select mb-3"
-          ),
-          dcc.RadioItems(
-              id='app-type-filter',
-              options=[
-                  {'label': ' All', 'value': 'all'},
-                  {'label': ' Free', 'value': 'Free'},
-                  {'label': ' Paid', 'value': 'Paid'}
-              ],
-              value='all',
-              className="form-check-inline"
-          )
-      ], className="card p-4 shadow-sm mb-4"),
-
-      html.Div([
+def layout(category=None, **kwargs):
+    """
+    Builds the page for every visit, so the category filter lists the categories of the current dataset.
+
+    Parameters:
+    -----------
+    - `category`: Category selected initially, from the `?category=` query string of links to the page.
+    """
+    from playstore.aggregates import get_cube
+
+    categories = get_cube().rollup(['Category']).index
+    return html.Div(
+      [
+          html.H1("Average Distribution", className="text-google-play text-center mb-4"),
           html.Div([
-              html.H3("Total Apps", className="h5 text-muted"),
-              html.P(id='total-apps', className="display-6 text-primary fw-bold")
-          ], className="card p-2 shadow-sm col-md-3 m-2"),
+              html.H3("Filters", className="h5 mb-3 fw-bold"),
+              dcc.Dropdown(
+                  id='category-filter',
+                  options=[{'label': cat, 'value': cat} for cat in categories],
+                  value=category if category in categories else None,
+                  placeholder="Select a category",
+                  className="form-select mb-3"
+              ),
+              dcc.RadioItems(
+                  id='app-type-filter',
+                  options=[
+                      {'label': ' All', 'value': 'all'},
+                      {'label': ' Free', 'value': 'Free'},
+                      {'label': ' Paid', 'value': 'Paid'}
+                  ],
+                  value='all',
+                  className="form-check-inline"
+              )
+          ], className="card p-4 shadow-sm mb-4"),
+
           html.Div([
-              html.H3("Average Rating", className="h5 text-muted"),
-              html.P(id='avg-rating', className="display-6 text-success fw-bold")
-          ], className="card p-2 shadow-sm col-md-3 m-2"),
+              html.Div([
+                  html.H3("Total Apps", className="h5 text-muted"),
+                  html.P(id='distribution-total-apps', className="display-6 text-primary fw-bold")
+              ], className="card p-2 shadow-sm col-md-3 m-2"),
+              html.Div([
+                  html.H3("Average Rating", className="h5 text-muted"),
+                  html.P(id='distribution-avg-rating', className="display-6 text-success fw-bold")
+              ], className="card p-2 shadow-sm col-md-3 m-2"),
+              html.Div([
+                  html.H3("Free Apps", className="h5 text-muted"),
+                  html.P(id='distribution-free-apps-pct', className="display-6 text-info fw-bold")
+              ], className="card p-2 shadow-sm col-md-3 m-2")
+          ], className="row justify-content-center mb-4"),
+
           html.Div([
-              html.H3("Free Apps", className="h5 text-muted"),
-              html.P(id='free-apps-pct', className="display-6 text-info fw-bold")
-          ], className="card p-2 shadow-sm col-md-3 m-2")
-      ], className="row justify-content-center mb-4"),
-
-      html.Div([
-          dcc.Graph(id="user-ratings-distribution"),
-      ], className="mb-4")
-  ],
-  className="container",
+              dcc.Graph(id="user-ratings-distribution"),
+          ], className="mb-4")
+      ],
+      className="container",
+    )
+
+# Callback to Update Stat Cards
+@callback(
+  [Output('distribution-total-apps', 'children'),
+   Output('distribution-avg-rating', 'children'),
+   Output('distribution-free-apps-pct', 'children')],
+  [Input('category-filter', 'value'),
+   Input('app-type-filter', 'value')]
 )
+@cached_figure
+def update_stats(selected_category, app_type):
+    """
+    Updates the Total Apps count, Average Rating, and Free Apps percentage
+    based on the selected category and app type filter.
+    """
+    from playstore.aggregates import get_cube
+
+    where = {}
+    if selected_category:
+        where['Category'] = selected_category
+    if app_type != 'all':
+        where['Type'] = app_type
+    view = get_cube().slice(**where)
+
+    totals = view.totals()
+    total_apps = int(totals['apps'])
+    avg_rating = totals['avg_rating']
+    free_apps_pct = view.rollup(['Type'])['apps'].get('Free', 0) / total_apps * 100 if total_apps else math.nan
+
+    return (
+        html.Span(f"{total_apps:,}", style={"color": "#F65725"}),
+        html.Span(f"{avg_rating:.2f}" if not math.isnan(avg_rating) else "N/A", style={"color": "#197257"}),
+        html.Span(f"{free_apps_pct:.1f}%", style={"color": "#FCB6C9"})
+    )
 
 # Callback to Update Distribution Graph
 @callback(
@@ -87,6 +128,7 @@ layout = html.Div(
   [Input('category-filter', 'value'),
    Input('app-type-filter', 'value')]
 )
+@cached_figure
 def update_user_ratings_distribution(selected_category, app_type):
     """
      Updates the user rating distribution histogram and density plot based on the selected category and app type filter.
@@ -96,27 +138,31 @@ def update_user_ratings_distribution(selected_category, app_type):
      - `selected_category`: The selected category filter from the dropdown.
      - `app_type`: The selected app type filter (All, Free, Paid).
      """
-    filtered_df = df.copy()
-    if selected_category:
-        filtered_df = filtered_df[filtered_df['Category'] == selected_category]
-    if app_type != 'all':
-        filtered_df = filtered_df[filtered_df['Type'] == app_type]
+    import plotly.graph_objects as go
+    from playstore.histograms import DENSITY_GRID, get_histograms
 
-    fig = px.histogram(
-        filtered_df,
-        x='Rating',
-        title='The Distribution of User Ratings',
-        labels={'x': 'Rating', 'y': 'Count'},
-        nbins=20,
-        opacity=0.7
+    histograms = get_histograms()
+    counts, density = histograms.select(
+        category=selected_category or None,
+        app_type=None if app_type == 'all' else app_type
     )
-    fig.update_traces(marker_color='#197257', marker_line_width=0.5)
 
-    density = filtered_df['Rating'].value_counts(normalize=True).sort_index()
+    # Bars and density points are precomputed, their number does not depend on the data size
+    fig = go.Figure(
+        go.Bar(
+            x=histograms.bin_centers,
+            y=counts,
+            width=histograms.bin_width,
+            opacity=0.7,
+            marker_color='#197257',
+            marker_line_width=0.5,
+            name='Rating'
+        )
+    )
     fig.add_trace(
         go.Scatter(
-            x=density.index,
-            y=density.values * len(filtered_df),
+            x=DENSITY_GRID,
+            y=density,
             mode='lines',
             line=dict(color='blue', width=2),
             name='Density'
@@ -124,6 +170,7 @@ def update_user_ratings_distribution(selected_category, app_type):
     )
 
     fig.update_layout(
+        title='The Distribution of User Ratings',
         xaxis_title='Rating',
         yaxis_title='Count',
         margin=dict(l=40, r=40, t=40, b=80),
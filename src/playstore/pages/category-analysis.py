@@ -10,40 +10,30 @@ The application is built with Dash and Plotly and includes the following feature
 - Total Apps count, Average Rating, and Free Apps percentage displayed dynamically.
 - Interactive visualizations for category distributions, ratings, and prices.
 
+Plotly and the aggregates are imported by the callbacks, the first time they run,
+so the page adds nothing to the startup of the dashboard.
+
 Modules and Dependencies
 ------------------------
-- `os`: File system operations.
-- `pandas`: Data manipulation and analysis.
+- `math`: Missing averages.
 - `dash`: Core framework for creating Dash apps.
 - `dash_bootstrap_components`: Bootstrap styling components for Dash.
 - `plotly.express`: Simplified interface for Plotly visualizations.
-- `numpy`: Numerical operations and array manipulations.
-- `playstore.config`: Configuration for the application.
+- `plotly.graph_objects`: Box plots from precomputed quartiles.
+- `playstore.aggregates`: Precomputed aggregate cube the callbacks answer from.
+- `playstore.figcache`: Shared cache of the callback results.
 
 """
 
-import os
-import pandas as pd
+import math
+
 from dash import html, dcc, callback, Output, Input, register_page
 import dash_bootstrap_components as dbc
-import plotly.express as px
-import numpy as np
-from playstore.config import CLEAN_DATA_DIR
+from playstore.figcache import cached_figure
 
 # Page Registration
 register_page(__name__, path="/category-analysis", name="Category Analysis")
 
-# Load Data
-try:
-    df = pd.read_csv(os.path.join(CLEAN_DATA_DIR, "cleaned_googleplaystore.csv"))
-except Exception:
-    df = pd.DataFrame({
-        'Category': ['Game', 'Education', 'Business'],
-        'Rating': [4.5, 4.0, 3.8],
-        'Type': ['Free', 'Free', 'Paid'],
-        'Installs': [1000000, 500000, 100000],
-    })
-
 layout = html.Div(
     [
         html.H1("Category Analysis", className="text-google-play text-center mb-4"),
@@ -84,41 +74,72 @@ layout = html.Div(
     ],
     className="container",
 )
-# Layout Definition
+
+
+def type_filter(app_type):
+    """
+    Translates the app type radio value into a filter of the aggregate cube.
+    """
+    return {} if app_type == 'all' else {'Type': app_type}
+
 
 # Callbacks for Dynamic Updates
 @callback(
     [Output('total-apps', 'children'),
      Output('avg-rating', 'children'),
-     Output('free-apps-pct', 'children')],
+     Output('free-apps-pct', 'children'),
+     Output('category-distribution', 'figure'),
+     Output('rating-distribution', 'figure'),
+     Output('content-rating-boxplot', 'figure'),
+     Output('average-price-category', 'figure')],
     [Input('app-type-filter', 'value')]
 )
-def update_stats(app_type):
+@cached_figure
+def update_category_analysis(app_type):
+    """
+    Updates the stat cards and all graphs of the page in a single request.
+
+    The filtered view of the aggregate cube is computed once and shared
+    by all outputs, instead of every output filtering the data again.
+    """
+    from playstore.aggregates import get_cube
+
+    view = get_cube().slice(**type_filter(app_type))
+
+    return (
+        *update_stats(view),
+        update_category_distribution(view),
+        update_rating_distribution_side_by_side(view),
+        update_content_rating_boxplot(view),
+        update_average_price_category(type_filter(app_type)),
+    )
+
+
+def update_stats(view):
     """
     Updates the Total Apps count, Average Rating, and Free Apps percentage
-    based on the selected app type filter.
+    from the `view` of the aggregate cube filtered by app type.
     """
-    filtered_df = df if app_type == 'all' else df[df['Type'] == app_type]
-    total_apps = len(filtered_df)
-    avg_rating = filtered_df['Rating'].mean()
-    free_apps_pct = (filtered_df['Type'] == 'Free').mean() * 100
+    totals = view.totals()
+    apps_by_type = view.rollup(['Type'])['apps']
+    total_apps = int(totals['apps'])
+    avg_rating = totals['avg_rating']
+    free_apps_pct = apps_by_type.get('Free', 0) / total_apps * 100 if total_apps else math.nan
 
     return (
         html.Span(f"{total_apps:,}", style={"color": "#F65725"}),
-        html.Span(f"{avg_rating:.2f}" if not np.isnan(avg_rating) else "N/A", style={"color": "#197257"}),
+        html.Span(f"{avg_rating:.2f}" if not math.isnan(avg_rating) else "N/A", style={"color": "#197257"}),
         html.Span(f"{free_apps_pct:.1f}%", style={"color": "#FCB6C9"})
     )
 
-@callback(
-    Output('category-distribution', 'figure'),
-    [Input('app-type-filter', 'value')]
-)
-def update_category_distribution(app_type):
+def update_category_distribution(view):
     """
-    Updates the Category Distribution graph based on the selected app type filter.
+    Updates the Category Distribution graph from the `view` filtered by app type.
     """
-    filtered_df = df if app_type == 'all' else df[df['Type'] == app_type]
-    category_counts = filtered_df['Category'].value_counts()
+    import plotly.express as px
+
+    category_counts = view.rollup(['Category'])['apps']
+    category_counts = category_counts.sort_values(ascending=False, kind='stable')
 
     colors = ['#197257', '#F65725', '#C0DFBF', '#FCB6C9', '#F8E9A1', '#A8D0E6', '#F4A259', '#F9D4D4']
     bar_colors = [colors[i % len(colors)] for i in range(len(category_counts))]
@@ -141,19 +162,15 @@ def update_category_distribution(app_type):
     )
     return fig
 
-@callback(
-    Output('rating-distribution', 'figure'),
-    [Input('app-type-filter', 'value')]
-)
-def update_rating_distribution_side_by_side(app_type):
+def update_rating_distribution_side_by_side(view):
     """
-    Updates the Average Rating by Category graph based on the selected app type filter,
+    Updates the Average Rating by Category graph from the `view` filtered by app type,
     using grouped bars side-by-side for different app types.
     """
-    # Apply the filter if a specific app type is selected
-    filtered_df = df if app_type == 'all' else df[df['Type'] == app_type]
+    import plotly.express as px
 
-    grouped_ratings = filtered_df.groupby(['Category', 'Type'])['Rating'].mean().reset_index()
+    grouped_ratings = view.rollup(['Category', 'Type'])
+    grouped_ratings = grouped_ratings['avg_rating'].rename('Rating').reset_index()
 
     type_colors = {
         'Free': '#197257',
@@ -181,24 +198,19 @@ def update_rating_distribution_side_by_side(app_type):
     return fig
 
 
-@callback(
-    Output('average-price-category', 'figure'),
-    [Input('app-type-filter', 'value')]
-)
-def update_average_price_category(app_type):
+def update_average_price_category(where):
     """
-    Updates the Average Price by Category graph based on the selected app type filter.
+    Updates the Average Price by Category graph for the app type filter `where`.
     """
-    filtered_df = df if app_type == 'all' else df[df['Type'] == app_type]
-    filtered_df['Price'] = np.where(filtered_df['Price'] == 0, 'Free apps', filtered_df['Price'])
+    import plotly.express as px
+    from playstore.aggregates import paid_price_by_category
 
-    avg_prices = filtered_df.groupby('Category')['Price'].apply(
-        lambda x: x[x != 'Free apps'].astype(float).mean() if len(x[x != 'Free apps']) > 0 else 'Free apps'
-    )
+    # Mean of the paid prices per category, 0 for categories with only free apps
+    avg_prices = paid_price_by_category(**where)
 
     fig = px.bar(
         x=avg_prices.index,
-        y=[float(val) if val != 'Free apps' else 0 for val in avg_prices.values],
+        y=avg_prices.values,
         title='Average Price by Category',
         labels={'x': 'Category', 'y': 'Average Price (USD)'}
     )
@@ -213,17 +225,14 @@ def update_average_price_category(app_type):
     return fig
 
 
-@callback(
-    Output('content-rating-boxplot', 'figure'),
-    [Input('app-type-filter', 'value')]
-)
-def update_content_rating_boxplot(app_type):
+def update_content_rating_boxplot(view):
     """
     Updates the box plot visualizing the distribution of ratings
-    across different content ratings, filtered by app type, with custom colors.
+    across different content ratings from the `view` filtered by app type, with custom colors.
     """
-    # Filter the data based on the selected app type
-    filtered_df = df if app_type == 'all' else df.loc[df['Type'] == app_type]
+    import plotly.graph_objects as go
+
+    rating_stats = view.rating_quantiles('Content_Rating')
 
     # Define custom colors for each Content Rating category
     content_rating_colors = {
@@ -235,19 +244,38 @@ def update_content_rating_boxplot(app_type):
         'Unrated': '#A8D0E6'
     }
 
-    # Create the box plot
-    fig = px.box(
-        filtered_df,
-        x='Content_Rating',
-        y='Rating',
-        color='Content_Rating',
-        title='The Content Rating & Rating Distribution',
-        labels={'Content_Rating': 'Content Rating', 'Rating': 'Rating'},
-        color_discrete_map=content_rating_colors  # Apply the custom color mapping
-    )
+    # Keep the boxes in the order of the color mapping
+    rating_stats = rating_stats.loc[
+        [name for name in content_rating_colors if name in rating_stats.index]
+        + [name for name in rating_stats.index if name not in content_rating_colors]
+    ]
+
+    # Create the box plot from precomputed quartiles, outliers are drawn as separate points
+    fig = go.Figure()
+    for content_rating, stats in rating_stats.iterrows():
+        color = content_rating_colors.get(content_rating)
+        fig.add_trace(go.Box(
+            x=[content_rating],
+            q1=[stats['q1']],
+            median=[stats['median']],
+            q3=[stats['q3']],
+            lowerfence=[stats['lowerfence']],
+            upperfence=[stats['upperfence']],
+            name=content_rating,
+            marker_color=color
+        ))
+        fig.add_trace(go.Scatter(
+            x=[content_rating] * len(stats['outliers']),
+            y=stats['outliers'],
+            mode='markers',
+            marker_color=color,
+            name=content_rating,
+            hoverinfo='y'
+        ))
 
     # Customize the layout for better visualization
     fig.update_layout(
+        title='The Content Rating & Rating Distribution',
         xaxis_title='Content Rating',
         yaxis_title='Rating',
         margin=dict(l=40, r=40, t=40, b=80),
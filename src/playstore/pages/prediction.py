@@ -8,21 +8,22 @@ model for predictions and processes input data with transformations and scaling.
 
 Modules and Dependencies
 ------------------------
-- `os`: File system operations.
-- `pandas`: Data manipulation and analysis.
-- `joblib`: Model persistence and loading.
 - `dash`: Core framework for creating Dash apps.
 - `dash_bootstrap_components`: Bootstrap styling components for Dash.
-- `playstore.config`: Configuration for the application.
+- `playstore.predict`: Model loading and batch prediction shared with the HTTP API.
+
+The model is not loaded when the page is imported. Opening the page starts loading it
+in the background if the app's warm-up has not already done so, and a status line
+polls `model_manager` until the model is ready.
 
 Category Mapping and Options
 ============================
 
-The `category_mapping` dictionary maps app categories to unique numerical codes, essential for:
+The `playstore.predict.CATEGORY_MAPPING` dictionary maps app categories to unique numerical codes, essential for:
 - **Encoding Categorical Data:** Converts categories like `"GAME"` into numbers (`17`) for machine learning models.
 - **Maintaining Consistency:** Ensures predictions align with the encoding used during model training.
 
-The `category_options` list is derived from `category_mapping` to populate the Dash dropdown:
+The `category_options` list is derived from `CATEGORY_MAPPING` to populate the Dash dropdown:
 - `label`: User-friendly category names (e.g., `"GAME"`).
 - `value`: Corresponding numerical codes (e.g., `17`).
 
@@ -32,45 +33,15 @@ The `category_options` list is derived from `category_mapping` to populate the D
 - Ensures seamless integration between the app's UI and the machine learning model.
 """
 
-import os
-import pandas as pd
-import joblib
 import dash_bootstrap_components as dbc
 from dash import html, dcc, callback, Output, Input, State, register_page
-from playstore.config import CLEAN_DATA_DIR
+from playstore.predict import CATEGORY_MAPPING, model_manager, predict_batch
 
 # Register the page
 register_page(__name__, path="/prediction", name="Prediction Page")
 
-print(CLEAN_DATA_DIR)
-
-
-# Load the model
-try:
-
-    print("Model loaded successfully.")
-    expected_features = ["Reviews", "Installs", "Category_encoded"]
-    df = pd.read_csv(os.path.join(CLEAN_DATA_DIR, "cleaned_googleplaystore.csv"))
-    model = joblib.load(os.path.join(CLEAN_DATA_DIR, "rf_model_category.pkl"))
-
-    # Define the category mapping
-    category_mapping = {
-        'ART_AND_DESIGN': 0, 'AUTO_AND_VEHICLES': 1, 'BEAUTY': 2, 'BOOKS_AND_REFERENCE': 3,
-        'BUSINESS': 4, 'COMICS': 5, 'COMMUNICATION': 6, 'DATING': 7, 'EDUCATION': 8,
-        'ENTERTAINMENT': 9, 'EVENTS': 10, 'FINANCE': 11, 'FOOD_AND_DRINK': 12,
-        'HEALTH_AND_FITNESS': 13, 'HOUSE_AND_HOME': 14, 'LIBRARIES_AND_DEMO': 15,
-        'LIFESTYLE': 16, 'GAME': 17, 'FAMILY': 18, 'MEDICAL': 19, 'SOCIAL': 20,
-        'SHOPPING': 21, 'PHOTOGRAPHY': 22, 'SPORTS': 23, 'TRAVEL_AND_LOCAL': 24,
-        'TOOLS': 25, 'PERSONALIZATION': 26, 'PRODUCTIVITY': 27, 'PARENTING': 28,
-        'WEATHER': 29, 'VIDEO_PLAYERS': 30, 'NEWS_AND_MAGAZINES': 31, 'MAPS_AND_NAVIGATION': 32
-    }
-    category_options = [{"label": name, "value": code} for name, code in category_mapping.items()]
-except Exception as e:
-    model = None
-    expected_features = []
-    category_mapping = {}
-    category_options = []
-    print(f"Error loading the model: {e}")
+# Category dropdown options, labels are the category names and values the codes the model was trained on
+category_options = [{"label": name, "value": code} for name, code in CATEGORY_MAPPING.items()]
 
 
 # Layout Definition
@@ -125,6 +96,12 @@ layout = html.Div([
                 dbc.Button("Predict", id="predict_button", color="primary", className="mt-3")
             ], width=12, className="text-center")
         ]),
+        dbc.Row([
+            dbc.Col([
+                html.Div(id="model_status", className="mt-2 text-center small text-muted"),
+                dcc.Interval(id="model_status_interval", interval=1000)
+            ], width=12)
+        ]),
         html.Hr(),
         dbc.Row([
             dbc.Col([
@@ -134,6 +111,35 @@ layout = html.Div([
     ])
 ])
 
+
+# Callback for the model status line
+@callback(
+    Output("model_status", "children"),
+    Output("model_status_interval", "disabled"),
+    Input("model_status_interval", "n_intervals")
+)
+def update_model_status(n_intervals):
+    """
+    Shows whether the model is ready, starting its background load if nothing has yet.
+
+    Parameters:
+    -----------
+    - `n_intervals`: Number of polls since the page was opened.
+
+    Returns:
+    --------
+    The status text, and whether polling stops because the model is ready or failed to load.
+    """
+    if model_manager.state == "idle":
+        model_manager.warm_up()
+
+    status = model_manager.status()
+    if status["state"] == "ready":
+        return f"Model ready (loaded in {status['seconds']:.2f} s).", True
+    if status["state"] == "failed":
+        return dbc.Alert(f"Model is not available: {status['error']}", color="danger"), True
+    return [dbc.Spinner(size="sm", spinner_class_name="me-2"), "Loading the model..."], False
+
 # Callback for Prediction
 @callback(
     Output("prediction_output", "children"),
@@ -160,35 +166,13 @@ def make_prediction(n_clicks, reviews, installs, category_encoded):
     if n_clicks is None:
         return "Enter values and click Predict."
 
-    if model is None:
-        return "Model is not loaded. Check if the model file exists at the specified path."
-
     try:
-        # Input validation
-        if not isinstance(reviews, (int, float)) or reviews <= 0:
-            return dbc.Alert("Reviews must be a positive number.", color="warning")
-        if not isinstance(installs, (int, float)) or installs <= 0:
-            return dbc.Alert("Installs must be a positive number.", color="warning")
-        if category_encoded not in category_mapping.values():
-            return dbc.Alert("Invalid category selected.", color="warning")
-
-        # Prepare input data
-        input_data = pd.DataFrame([{
-            "Reviews": reviews,
-            "Installs": installs,
-            "Category_encoded": category_encoded
-        }], columns=expected_features)
-
-        # Feature alignment
-        input_data = input_data[model.feature_names_in_]
-
-        # Make prediction
-        prediction_encoded = model.predict(input_data)
-
-        # Decode the prediction
-        categories = ["Low", "Medium", "High"]
-        prediction_decoded = categories[int(prediction_encoded[0])]
-
-        return dbc.Alert(f"Prediction: {prediction_decoded}", color="success")
+        prediction_decoded = predict_batch([reviews], [installs], [category_encoded])[0]
+    except ValueError as e:
+        return dbc.Alert(str(e), color="warning")
+    except OSError:
+        return "Model is not loaded. Check if the model file exists at the specified path."
     except Exception as e:
         return dbc.Alert(f"Error during prediction: {e}", color="danger")
+
+    return dbc.Alert(f"Prediction: {prediction_decoded}", color="success")
@@ -0,0 +1,333 @@
+"""
+Partitioned Dataset
+===================
+
+Columnar copy of the cleaned dataset split by `Category` and `Type`, read with
+partition pruning.
+
+Almost every dashboard query filters on the category or the app type, yet the
+columnar cache (see `playstore.cache`) holds a single set of column files, so every
+filtered read maps all rows. `write_partitions()` stores the rows of every
+(Category, Type) pair in its own directory, in the format of the columnar cache:
+
+```
+data/cache/cleaned_googleplaystore.parts/
+    manifest.json
+    Category=GAME/Type=Free/Rating.npy
+    Category=GAME/Type=Free/App.codes.npy
+    ...
+```
+
+`read_partitions()` takes filters on the partition columns, selects the matching
+partitions from the manifest and only maps their files, optionally only the wanted
+columns. A single-category read therefore touches about `1 / n_categories` of the
+data, independent of the total number of rows. Rows keep the order of the source
+within every partition, and partitions follow in sorted (Category, Type) order.
+
+The CSV is read in chunks of `CHUNK_ROWS` rows. The rows of every chunk are spooled
+per partition and every partition is then compacted into one set of column files,
+so memory use is bounded by the largest partition. Like the cache, the manifest
+records the size and modification time of the CSV, taken before it is read, and
+its dataset version (`playstore.data.source_version()`, which includes the
+ingestion version). A copy whose signature or version does not match is ignored.
+`playstore.etl` and `playstore.ingest` rebuild the copy after writing the CSV.
+
+Build it and compare full and pruned reads with:
+
+```bash
+python -m playstore.partitions
+python -m playstore.partitions --benchmark GAME
+```
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `json`: Reading the manifest.
+- `time`: Timing the benchmark.
+- `shutil`: Replacing the previous copy.
+- `argparse`: Command line interface.
+- `tempfile`: Spool directory of the chunk fragments.
+- `urllib.parse`: Partition directory names.
+- `numpy`: Checking the benchmark results.
+- `pandas`: Chunked CSV reading and categorical unions.
+- `playstore.cache`: Column file format and signatures.
+- `playstore.config`: Configuration for the application.
+- `playstore.data`: Location and parsing of the cleaned dataset.
+- `playstore.etl`: Chunk size.
+- `playstore.schema`: Declared column types of the dataset.
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from playstore import cache
+from playstore.cache import MANIFEST_FILE, read_columns, save_json, source_signature, write_columns
+from playstore.config import CACHE_DIR
+from playstore.data import CLEAN_DATA_FILE, read_csv_dataset, source_version
+from playstore.etl import CHUNK_ROWS
+from playstore.schema import CSV_DTYPES, SCHEMA, apply_schema
+
+FORMAT_VERSION = 3
+PARTITION_COLUMNS = ("Category", "Type")
+
+
+def partition_dir_for(source):
+    """
+    Returns the directory of the partitioned copy of the CSV file `source`.
+    """
+    return os.path.join(CACHE_DIR, f"{os.path.splitext(os.path.basename(source))[0]}.parts")
+
+
+def _partition_path(key):
+    return os.path.join(*(f"{name}={quote(str(value), safe='')}" for name, value in zip(PARTITION_COLUMNS, key)))
+
+
+def _concat(frames):
+    """
+    Concatenates frames of the same columns, merging the categories of categorical columns.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    data = {}
+    for name in frames[0].columns:
+        if isinstance(frames[0][name].dtype, pd.CategoricalDtype):
+            data[name] = union_categoricals([frame[name] for frame in frames], sort_categories=True)
+        else:
+            data[name] = pd.concat([frame[name] for frame in frames], ignore_index=True)
+    return pd.DataFrame(data, copy=False)
+
+
+def write_partitions(source=CLEAN_DATA_FILE, partition_dir=None, chunk_rows=CHUNK_ROWS):
+    """
+    Writes the cleaned CSV `source` partitioned by `PARTITION_COLUMNS`.
+
+    Parameters:
+    -----------
+    - `source`: Cleaned CSV file.
+    - `partition_dir`: Target directory, defaults to `partition_dir_for(source)`.
+    - `chunk_rows`: Number of CSV rows read at a time.
+
+    Returns:
+    --------
+    The manifest of the written copy.
+    """
+    partition_dir = partition_dir or partition_dir_for(source)
+    parent = os.path.dirname(os.path.abspath(partition_dir))
+    os.makedirs(parent, exist_ok=True)
+    signature = source_signature(source)
+    version = source_version(source)
+
+    building = tempfile.mkdtemp(prefix=".parts-", dir=parent)
+    try:
+        fragments = {}
+        with tempfile.TemporaryDirectory(prefix=".spool-", dir=parent) as spool:
+            for index, chunk in enumerate(pd.read_csv(source, dtype=CSV_DTYPES, chunksize=chunk_rows)):
+                groups = apply_schema(chunk).groupby(list(PARTITION_COLUMNS), observed=True, sort=False)
+                for key, rows in groups:
+                    directory = os.path.join(spool, str(index), _partition_path(key))
+                    fragments.setdefault(key, []).append((directory, write_columns(rows, directory)))
+
+            columns, partitions = None, []
+            for key in sorted(fragments):
+                rows = _concat([read_columns(directory, spec) for directory, spec in fragments[key]])
+                path = _partition_path(key)
+                columns = write_columns(rows.reset_index(drop=True), os.path.join(building, path))
+                partitions.append({**dict(zip(PARTITION_COLUMNS, key)), "path": path, "rows": len(rows)})
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "source": os.path.abspath(source),
+            "signature": signature,
+            "version": version,
+            "rows": sum(partition["rows"] for partition in partitions),
+            "columns": columns or [],
+            "partitions": partitions,
+        }
+        save_json(os.path.join(building, MANIFEST_FILE), manifest)
+
+        # readers that mapped files of the previous copy keep their inodes
+        previous = f"{building}.old"
+        if os.path.exists(partition_dir):
+            os.replace(partition_dir, previous)
+        os.replace(building, partition_dir)
+        shutil.rmtree(previous, ignore_errors=True)
+    finally:
+        shutil.rmtree(building, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(source=CLEAN_DATA_FILE, partition_dir=None, signature=None, version=None):
+    """
+    Returns the manifest of the partitioned copy of `source`, or `None` if it is missing or stale.
+
+    Parameters:
+    -----------
+    - `source`: Cleaned CSV file the copy was written from.
+    - `partition_dir`: Directory of the copy, defaults to `partition_dir_for(source)`.
+    - `signature`: Signature the copy must have been written from, defaults to the current one of `source`.
+    - `version`: Dataset version the copy must have been written from, defaults to the current one of `source`.
+    """
+    path = os.path.join(partition_dir or partition_dir_for(source), MANIFEST_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_VERSION:
+            return None
+        if manifest.get("signature") != (signature or source_signature(source)):
+            return None
+        if manifest.get("version") != (version or source_version(source)):
+            return None
+    except (OSError, ValueError):
+        return None
+    return manifest
+
+
+def select_partitions(manifest, where):
+    """
+    Returns the partitions of `manifest` matching the filters `where` on the partition columns.
+
+    A filter value can be a single value or a list of accepted values.
+    Raises `KeyError` for a filter on any other column.
+    """
+    for name in where:
+        if name not in PARTITION_COLUMNS:
+            raise KeyError(f"'{name}' is not a partition column")
+    accepted = {
+        name: set(value) if isinstance(value, (list, tuple, set)) else {value}
+        for name, value in where.items()
+    }
+    return [
+        partition for partition in manifest["partitions"]
+        if all(partition[name] in values for name, values in accepted.items())
+    ]
+
+
+def read_partitions(source=CLEAN_DATA_FILE, columns=None, partition_dir=None, signature=None, version=None, **where):
+    """
+    Reads the rows of the partitions matching `where`, mapping only their files.
+
+    Parameters:
+    -----------
+    - `source`: Cleaned CSV file the copy was written from.
+    - `columns`: Names of the columns to read, all of them by default.
+    - `partition_dir`: Directory of the copy, defaults to `partition_dir_for(source)`.
+    - `signature`: Signature the copy must match, see `read_manifest()`.
+    - `version`: Dataset version the copy must match, see `read_manifest()`.
+    - `where`: Filters on the partition columns, `name=value` or `name=[values]`.
+
+    Returns:
+    --------
+    A DataFrame of the matching rows, or `None` if there is no fresh partitioned copy.
+    """
+    partition_dir = partition_dir or partition_dir_for(source)
+    manifest = read_manifest(source, partition_dir, signature, version)
+    if manifest is None:
+        return None
+
+    spec = manifest["columns"]
+    frames = [
+        read_columns(os.path.join(partition_dir, partition["path"]), spec, columns)
+        for partition in select_partitions(manifest, where)
+    ]
+    if not frames:
+        names = [column["name"] for column in spec if columns is None or column["name"] in columns]
+        return pd.DataFrame({name: pd.Series(dtype=SCHEMA[name]) for name in names})
+    return _concat(frames)
+
+
+def _touched_bytes(directory, columns=None):
+    return sum(
+        entry.stat().st_size for entry in os.scandir(directory)
+        if entry.name.endswith(".npy") and (columns is None or entry.name.split(".")[0] in columns)
+    )
+
+
+def benchmark(category, source=CLEAN_DATA_FILE, columns=("Category", "Rating", "Price"), repeat=5):
+    """
+    Times a full scan of the columnar cache against a pruned read of one category.
+
+    Both reads map only the `columns`, keep the rows of `category` and sum their ratings
+    and prices, so the mapped pages are actually read.
+
+    Returns:
+    --------
+    A dict with the best time in seconds and the bytes of column files behind each read.
+    """
+    columns = list(columns)
+    if cache.read_manifest(source) is None:
+        signature = cache.source_signature(source)
+        cache.write_cache(read_csv_dataset(source), source, signature=signature)
+    if read_manifest(source) is None:
+        write_partitions(source)
+    cache_dir, cache_columns = cache.cache_dir_for(source), cache.read_manifest(source)["columns"]
+    manifest = read_manifest(source)
+
+    def full_scan():
+        df = read_columns(cache_dir, cache_columns, columns)
+        rows = df[df["Category"] == category]
+        return rows["Rating"].sum() + rows["Price"].sum(), len(rows)
+
+    def pruned():
+        rows = read_partitions(source, columns, Category=category)
+        return rows["Rating"].sum() + rows["Price"].sum(), len(rows)
+
+    results = {}
+    for name, read in (("full_scan", full_scan), ("pruned", pruned)):
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            total, rows = read()
+            seconds.append(time.perf_counter() - start)
+        results[name] = {"seconds": min(seconds), "rows": rows, "total": total}
+
+    if not np.isclose(results["full_scan"]["total"], results["pruned"]["total"]):
+        raise AssertionError("Pruned read does not match the full scan.")
+    results["full_scan"]["bytes"] = _touched_bytes(cache_dir, columns)
+    results["pruned"]["bytes"] = sum(
+        _touched_bytes(os.path.join(partition_dir_for(source), partition["path"]), columns)
+        for partition in select_partitions(manifest, {"Category": category})
+    )
+    return results
+
+
+def main(argv=None):
+    """
+    Command line entry point that writes the partitioned copy of the cleaned dataset.
+    """
+    parser = argparse.ArgumentParser(description="Write the cleaned dataset partitioned by Category and Type.")
+    parser.add_argument("--source", default=CLEAN_DATA_FILE, help="cleaned CSV file")
+    parser.add_argument("--force", action="store_true", help="rewrite even if the copy is fresh")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="CSV rows read at a time")
+    parser.add_argument("--benchmark", metavar="CATEGORY", help="compare a full scan and a pruned read")
+    args = parser.parse_args(argv)
+
+    if args.force or read_manifest(args.source) is None:
+        start = time.perf_counter()
+        manifest = write_partitions(args.source, chunk_rows=args.chunk_rows)
+        print(
+            f"Wrote {manifest['rows']} rows in {len(manifest['partitions'])} partitions "
+            f"in {time.perf_counter() - start:.2f} s to: {partition_dir_for(args.source)}"
+        )
+    else:
+        print(f"Partitions of {args.source} are up to date.")
+
+    if args.benchmark:
+        results = benchmark(args.benchmark, args.source)
+        for name, result in results.items():
+            print(
+                f"{name:>9}: {result['rows']} rows in {result['seconds'] * 1000:.1f} ms, "
+                f"{result['bytes'] / 2 ** 20:.1f} MiB of column files"
+            )
+
+
+if __name__ == "__main__":
+    main()
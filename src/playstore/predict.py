@@ -0,0 +1,377 @@
+"""
+Rating Prediction
+=================
+
+Batch scoring of apps with the pre-trained RandomForestClassifier.
+
+`predict_batch()` takes whole arrays of reviews, installs and categories, validates
+them at once and runs a single `model.predict` call, so the per-call overhead of
+building the input frame and of the model's validation is paid once per batch
+instead of once per app. The prediction page and the HTTP API both use it.
+
+The model is served from the NumPy-only `playstore.forest.CompiledForest`. When its
+export is missing or older than the pickled model, the pickle is loaded once with
+joblib (importing sklearn) and exported for the next start.
+
+The compiled forest answers single apps and small batches far faster than sklearn,
+but its level by level walk in NumPy is several times slower on large batches.
+Batches of more than `FOREST_MAX_ROWS` apps are therefore scored by the pickled
+forest, loaded by `estimator_manager` on the first such batch. If it cannot be
+loaded (e.g. sklearn is not installed), the compiled forest scores them as well.
+
+Nothing is loaded at import, not even numpy and pandas, so the dashboard starts
+without them. `model_manager` loads the model on first use, or ahead of it on a
+background thread started by `model_manager.warm_up()`, and reports its state
+(`idle`, `loading`, `ready` or `failed`) for the prediction page. The node arrays
+are memory-mapped read-only, so all workers share one copy in the page cache.
+
+The `api` blueprint adds `POST /api/predict` to the Flask server of the dashboard.
+It accepts either JSON,
+
+```json
+{"reviews": [1500, 20], "installs": [50000, 100], "categories": ["GAME", 8]}
+```
+
+or a CSV body (`Content-Type: text/csv`) with the `Reviews`, `Installs` and `Category`
+columns. Categories are given by name or by their code in `CATEGORY_MAPPING`.
+The Low/Medium/High labels are streamed back in the same format, in chunks of
+`CHUNK_SIZE` rows. The whole batch is validated before the stream starts: fields
+that are not lists of the same length, non-finite or non-positive numbers and
+unknown categories are answered with status 400 and an error message.
+
+Modules and Dependencies
+------------------------
+- `io`: Reading CSV request bodies.
+- `os`: Resetting the load state in forked workers.
+- `json`: Streaming JSON responses.
+- `time`: Measuring the model load.
+- `logging`: Reporting model loads and export failures.
+- `threading`: Guarding the one-time model load and the warm-up thread.
+- `numpy`: Numerical operations and array manipulations.
+- `pandas`: Building the model input frame and parsing CSV batches.
+- `joblib`: Loading the pickled model when no export exists.
+- `flask`: The HTTP API blueprint.
+- `playstore.config`: Configuration for the application.
+- `playstore.forest`: NumPy-only evaluation of the exported forest.
+- `playstore.metrics`: Load and inference metrics of the model.
+"""
+
+import io
+import os
+import json
+import time
+import logging
+import threading
+
+from flask import Blueprint, Response, jsonify, request
+
+from playstore.config import FOREST_MAX_ROWS
+from playstore.metrics import MODEL_INFERENCE_ROWS, MODEL_INFERENCE_SECONDS, MODEL_LOAD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ["Reviews", "Installs", "Category_encoded"]
+LABELS = ("Low", "Medium", "High")
+CHUNK_SIZE = 10_000
+
+# Category codes used when the model was trained
+CATEGORY_MAPPING = {
+    'ART_AND_DESIGN': 0, 'AUTO_AND_VEHICLES': 1, 'BEAUTY': 2, 'BOOKS_AND_REFERENCE': 3,
+    'BUSINESS': 4, 'COMICS': 5, 'COMMUNICATION': 6, 'DATING': 7, 'EDUCATION': 8,
+    'ENTERTAINMENT': 9, 'EVENTS': 10, 'FINANCE': 11, 'FOOD_AND_DRINK': 12,
+    'HEALTH_AND_FITNESS': 13, 'HOUSE_AND_HOME': 14, 'LIBRARIES_AND_DEMO': 15,
+    'LIFESTYLE': 16, 'GAME': 17, 'FAMILY': 18, 'MEDICAL': 19, 'SOCIAL': 20,
+    'SHOPPING': 21, 'PHOTOGRAPHY': 22, 'SPORTS': 23, 'TRAVEL_AND_LOCAL': 24,
+    'TOOLS': 25, 'PERSONALIZATION': 26, 'PRODUCTIVITY': 27, 'PARENTING': 28,
+    'WEATHER': 29, 'VIDEO_PLAYERS': 30, 'NEWS_AND_MAGAZINES': 31, 'MAPS_AND_NAVIGATION': 32
+}
+
+def load_model():
+    """
+    Loads the classifier, preferring the memory-mapped export of `MODEL_FILE`.
+
+    When the export is missing or stale, the pickled model is loaded and exported.
+    Raises `OSError` if the model file cannot be read.
+    """
+    from playstore.forest import MODEL_FILE, export_forest, load_forest
+
+    model = load_forest(mmap_mode="r")
+    if model is not None:
+        return model
+
+    import joblib
+
+    model = joblib.load(MODEL_FILE)
+    try:
+        export_forest(model)
+    except OSError as e:
+        logger.warning("Could not export the forest, serving the pickled model: %s", e)
+        return model
+    return load_forest(mmap_mode="r") or model
+
+
+def load_estimator():
+    """
+    Loads the pickled sklearn forest of `MODEL_FILE`.
+
+    Raises `OSError` if the model file cannot be read or sklearn is not installed.
+    """
+    import joblib
+
+    from playstore.forest import MODEL_FILE
+
+    try:
+        return joblib.load(MODEL_FILE)
+    except ImportError as e:
+        raise OSError(f"Cannot load {MODEL_FILE}: {e}") from e
+
+
+class ModelManager:
+    """
+    Loads a model once, on first use or on a background warm-up thread.
+
+    Parameters:
+    -----------
+    - `loader`: Function returning the model, raising `OSError` if it is not available.
+    """
+
+    def __init__(self, loader=load_model):
+        self.loader = loader
+        self.state = "idle"
+        self.error = None
+        self.seconds = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._thread = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # a load in progress in the parent does not continue in the child, nor does its lock
+        self._lock = threading.Lock()
+        self._thread = None
+        if self._model is None:
+            self.state = "idle"
+
+    def get(self):
+        """
+        Returns the model, loading it first if needed.
+
+        A failed load is retried on the next call. Raises `OSError` if it fails again.
+        """
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._load()
+        return self._model
+
+    def _load(self):
+        self.state = "loading"
+        start = time.perf_counter()
+        try:
+            model = self.loader()
+        except OSError as e:
+            self.state, self.error = "failed", str(e)
+            raise
+        self.seconds = time.perf_counter() - start
+        MODEL_LOAD_SECONDS.observe(self.seconds)
+        self._model, self.state, self.error = model, "ready", None
+        logger.info("Loaded %s in %.2f s", type(model).__name__, self.seconds)
+
+    def warm_up(self):
+        """
+        Starts loading the model on a daemon thread, unless it is loaded or loading.
+        """
+        with self._lock:
+            if self._model is not None or (self._thread is not None and self._thread.is_alive()):
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._warm_up, name="model-warm-up", daemon=True)
+            self._thread.start()
+
+    def _warm_up(self):
+        try:
+            self.get()
+        except OSError as e:
+            logger.warning("Model warm-up failed: %s", e)
+
+    def status(self):
+        """
+        Returns the load state, the load time in seconds and the last error.
+        """
+        return {"state": self.state, "seconds": self.seconds, "error": self.error}
+
+
+model_manager = ModelManager()
+# the sklearn forest, only loaded for batches of more than FOREST_MAX_ROWS apps
+estimator_manager = ModelManager(load_estimator)
+
+
+def get_model():
+    """
+    Returns the shared model of `model_manager`, loading it on first use.
+    """
+    return model_manager.get()
+
+
+def _vector(values, name):
+    """
+    `values` as a 1-d object array; raises `ValueError` for scalars and nested lists.
+    """
+    import numpy as np
+
+    values = np.asarray(values, dtype=object)
+    if np.ndim(values) != 1 or any(isinstance(value, (list, tuple, dict)) for value in values):
+        raise ValueError(f"{name} must be a list of values.")
+    return values
+
+
+def encode_categories(categories):
+    """
+    Converts category names or codes into the codes of `CATEGORY_MAPPING`.
+
+    Raises `ValueError` if `categories` is not a list or any category is unknown.
+    """
+    import pandas as pd
+
+    categories = pd.Series(_vector(categories, "Category"))
+    codes = categories.map(lambda value: CATEGORY_MAPPING.get(value, value))
+    codes = pd.to_numeric(codes, errors="coerce")
+    if not codes.isin(CATEGORY_MAPPING.values()).all():
+        raise ValueError("Invalid category selected.")
+    return codes.to_numpy(dtype="int64")
+
+
+def _positive(values, name):
+    import numpy as np
+    import pandas as pd
+
+    values = pd.to_numeric(pd.Series(_vector(values, name)), errors="coerce").to_numpy(dtype="float64")
+    if not (np.isfinite(values) & (values > 0)).all():
+        raise ValueError(f"{name} must be a positive number.")
+    return values
+
+
+def validate_batch(reviews, installs, categories):
+    """
+    Checks and converts the model inputs of a batch.
+
+    Returns:
+    --------
+    A tuple of float reviews, float installs and integer category codes.
+    Raises `ValueError` if an input is not a list, any value is invalid (e.g. not
+    a finite positive number) or the lengths differ.
+    """
+    reviews = _positive(reviews, "Reviews")
+    installs = _positive(installs, "Installs")
+    categories = encode_categories(categories)
+    if not len(reviews) == len(installs) == len(categories):
+        raise ValueError("Reviews, Installs and Category must have the same length.")
+    return reviews, installs, categories
+
+
+def predict_batch(reviews, installs, categories):
+    """
+    Predicts the rating class of many apps with a single model call.
+
+    Parameters:
+    -----------
+    - `reviews`: Numbers of reviews, array-like.
+    - `installs`: Numbers of installs, array-like of the same length.
+    - `categories`: Category names or codes, array-like of the same length.
+
+    Returns:
+    --------
+    A numpy array of "Low", "Medium" or "High" labels, one per app.
+    Raises `ValueError` for invalid input and `OSError` if the model cannot be loaded.
+    """
+    return _predict(*validate_batch(reviews, installs, categories))
+
+
+def _predict(reviews, installs, categories):
+    import numpy as np
+    import pandas as pd
+
+    from playstore.forest import CompiledForest
+
+    labels = np.array(LABELS)
+    if len(reviews) == 0:
+        return labels[:0]
+
+    model = get_model()
+    if isinstance(model, CompiledForest) and len(reviews) > FOREST_MAX_ROWS and estimator_manager.state != "failed":
+        try:
+            model = estimator_manager.get()
+        except OSError as e:
+            logger.warning("Scoring large batches with the compiled forest: %s", e)
+    columns = {"Reviews": reviews, "Installs": installs, "Category_encoded": categories}
+    if isinstance(model, CompiledForest):
+        # the float32 array the forest walks, without an input frame
+        input_data = np.empty((len(reviews), len(FEATURES)), dtype=np.float32)
+        for position, name in enumerate(model.feature_names_in_):
+            input_data[:, position] = columns[name]
+    else:
+        input_data = pd.DataFrame(columns, columns=FEATURES)[model.feature_names_in_]
+    with MODEL_INFERENCE_SECONDS.time():
+        prediction_encoded = model.predict(input_data)
+    MODEL_INFERENCE_ROWS.inc(amount=len(input_data))
+    return labels[prediction_encoded.astype("int64")]
+
+
+api = Blueprint("predict", __name__)
+
+
+def _read_batch():
+    """
+    Reads the reviews, installs and categories of the current request.
+    """
+    import pandas as pd
+
+    if request.mimetype == "text/csv":
+        batch = pd.read_csv(io.BytesIO(request.get_data()))
+        missing = {"Reviews", "Installs", "Category"} - set(batch.columns)
+        if missing:
+            raise ValueError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+        return batch["Reviews"], batch["Installs"], batch["Category"]
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object or a text/csv body.")
+    try:
+        return body["reviews"], body["installs"], body["categories"]
+    except KeyError as e:
+        raise ValueError(f"Missing JSON field: {e.args[0]}") from e
+
+
+@api.route("/api/predict", methods=["POST"])
+def predict_route():
+    """
+    Scores a JSON or CSV batch of apps and streams the labels back in the same format.
+    """
+    try:
+        reviews, installs, categories = validate_batch(*_read_batch())
+        get_model()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except OSError as e:
+        return jsonify(error=f"Model is not available: {e}"), 503
+
+    def chunks():
+        for start in range(0, len(reviews), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            yield _predict(reviews[start:end], installs[start:end], categories[start:end])
+
+    if request.mimetype == "text/csv":
+        def generate_csv():
+            yield "Prediction\n"
+            for labels in chunks():
+                yield "\n".join(labels) + "\n"
+        return Response(generate_csv(), mimetype="text/csv")
+
+    def generate_json():
+        yield '{"predictions": ['
+        separator = ""
+        for labels in chunks():
+            yield separator + json.dumps(labels.tolist())[1:-1]
+            separator = ","
+        yield "]}"
+    return Response(generate_json(), mimetype="application/json")
@@ -0,0 +1,174 @@
+"""
+Dataset Schema
+==============
+
+Declared column types of the cleaned dataset, applied wherever it is loaded.
+
+The cleaned CSV (see `playstore.etl`) only holds text and 64 bit numbers. Held in
+memory like that, every row pays eight bytes per count and per date part and a
+Python string per version. `SCHEMA` declares the narrowest type of every column of
+the loaded frame instead:
+
+- repeated text (categories, genres, content ratings, app and Android versions) as
+  `category`, an integer code per row plus one copy of every distinct value,
+- `Reviews` and `Installs` as unsigned 64 bit integers, since the install counts
+  of the largest apps already pass the 4.3 billion of 32 bits,
+- `Updated_Day`, `Updated_Month` and `Updated_Year` combined into the `Updated` date,
+  keeping `Updated_Year` as a small integer since the aggregations group by it.
+
+The packed versions (see `playstore.etl.pack_version()`) need all 64 bits.
+`Rating`, `Size` and `Price` stay `float64`: prices in cents and one-decimal ratings
+are not exact in `float32`, so averages and figures would change.
+
+The CSV is parsed with `CSV_DTYPES` and converted by `apply_schema()`. Narrowing is
+checked, a value that does not fit its declared type raises a `ValueError` instead
+of wrapping around. Compare the memory of every column with the inferred types of a
+plain `pd.read_csv` with:
+
+```bash
+python -m playstore.schema
+```
+
+Modules and Dependencies
+------------------------
+- `argparse`: Command line interface.
+- `numpy`: Integer ranges.
+- `pandas`: Data manipulation and analysis.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Types of the columns of the loaded frame
+SCHEMA = {
+    "App": "str",
+    "Category": "category",
+    "Rating": "float64",
+    "Reviews": "uint64",
+    "Size": "float64",
+    "Installs": "uint64",
+    "Type": "category",
+    "Price": "float64",
+    "Content_Rating": "category",
+    "Genres": "category",
+    "Current_Ver": "category",
+    "Android_Ver": "category",
+    "Updated": "datetime64[s]",
+    "Updated_Year": "uint16",
+    "Android_Ver_Min": "int64",
+    "Android_Ver_Max": "int64",
+    "Android_Ver_Flag": "category",
+    "Current_Ver_Num": "int64",
+    "Current_Ver_Flag": "category",
+}
+# Columns of the CSV combined into the `Updated` date, by date component
+DATE_PARTS = {"year": "Updated_Year", "month": "Updated_Month", "day": "Updated_Day"}
+DATE_COLUMN = "Updated"
+
+# Types the CSV is parsed with, in its column order; integers are narrowed once their range is checked
+CSV_DTYPES = {
+    "App": "str",
+    "Category": "category",
+    "Rating": "float64",
+    "Reviews": "int64",
+    "Size": "float64",
+    "Installs": "int64",
+    "Type": "category",
+    "Price": "float64",
+    "Content_Rating": "category",
+    "Genres": "category",
+    "Current_Ver": "category",
+    "Android_Ver": "category",
+    "Updated_Day": "int64",
+    "Updated_Month": "int64",
+    "Updated_Year": "int64",
+    "Android_Ver_Min": "int64",
+    "Android_Ver_Max": "int64",
+    "Android_Ver_Flag": "category",
+    "Current_Ver_Num": "int64",
+    "Current_Ver_Flag": "category",
+}
+
+
+def _narrow(series, dtype):
+    """
+    Casts the integer `series` to `dtype`, raising `ValueError` if a value does not fit.
+    """
+    limits = np.iinfo(dtype)
+    if len(series) and (series.min() < limits.min or series.max() > limits.max):
+        raise ValueError(
+            f"Column '{series.name}' holds values in [{series.min()}, {series.max()}], "
+            f"which do not fit its declared type {dtype}."
+        )
+    return series.astype(dtype)
+
+
+def apply_schema(df):
+    """
+    Converts a frame parsed with `CSV_DTYPES` to the declared `SCHEMA`.
+
+    Parameters:
+    -----------
+    - `df`: DataFrame of cleaned rows, all columns of the CSV or a chunk of them.
+
+    Returns:
+    --------
+    A DataFrame with the columns of `SCHEMA`, in its order.
+    """
+    data = {}
+    for name, dtype in SCHEMA.items():
+        if name == DATE_COLUMN:
+            parts = pd.DataFrame({part: df[column] for part, column in DATE_PARTS.items()})
+            data[name] = pd.to_datetime(parts).astype(dtype)
+        elif dtype.startswith("uint"):
+            data[name] = _narrow(df[name], dtype)
+        else:
+            data[name] = df[name].astype(dtype)
+    return pd.DataFrame(data, copy=False)
+
+
+def memory_report(path):
+    """
+    Compares the memory of every column of the CSV at `path` parsed with inferred types and with `SCHEMA`.
+
+    Returns:
+    --------
+    A DataFrame indexed by column with the bytes of both frames (0 for a column
+    only one of them has), its `inferred` and `declared` types and a `total` row.
+    """
+    inferred = pd.read_csv(path)
+    declared = apply_schema(pd.read_csv(path, dtype=CSV_DTYPES))
+    report = pd.DataFrame({
+        "inferred_type": inferred.dtypes.astype(str),
+        "inferred_bytes": inferred.memory_usage(index=False, deep=True),
+        "declared_type": declared.dtypes.astype(str),
+        "declared_bytes": declared.memory_usage(index=False, deep=True),
+    }).reindex([*inferred.columns, *(name for name in declared.columns if name not in inferred)])
+    report[["inferred_type", "declared_type"]] = report[["inferred_type", "declared_type"]].fillna("")
+    report[["inferred_bytes", "declared_bytes"]] = report[["inferred_bytes", "declared_bytes"]].fillna(0).astype("int64")
+    report.loc["total"] = ["", report["inferred_bytes"].sum(), "", report["declared_bytes"].sum()]
+    return report
+
+
+def main(argv=None):
+    """
+    Command line entry point that prints the memory of every column before and after the schema.
+    """
+    from playstore.data import CLEAN_DATA_FILE
+
+    parser = argparse.ArgumentParser(description="Compare the memory of the cleaned dataset with inferred and declared types.")
+    parser.add_argument("--source", default=CLEAN_DATA_FILE, help="cleaned CSV file")
+    args = parser.parse_args(argv)
+
+    report = memory_report(args.source)
+    saved = 1 - report["declared_bytes"] / report["inferred_bytes"].where(report["inferred_bytes"] > 0)
+    report["saved"] = saved.map(lambda share: "" if pd.isna(share) else f"{share:.0%}")
+    report["inferred_bytes"] = report["inferred_bytes"].map(lambda size: f"{size / 2 ** 20:.2f} MiB")
+    report["declared_bytes"] = report["declared_bytes"].map(lambda size: f"{size / 2 ** 20:.2f} MiB")
+    print(report.to_string())
+
+
+if __name__ == "__main__":
+    main()
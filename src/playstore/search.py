@@ -0,0 +1,384 @@
+"""
+App Search
+==========
+
+Type-ahead search over the app names of the cleaned dataset, tolerant to typos.
+
+Scanning millions of names on every keystroke is far too slow for type-ahead, so
+`SearchIndex` is built once from the distinct (App, Category) pairs and holds:
+
+- the normalized names (case folded, runs of punctuation and spaces replaced by one
+  space) in sorted order, so the names starting with the query are one binary
+  search away,
+- every further word start of every name, sorted by the rest of the name from
+  there, so `candy` finds "Photo Editor & Candy Camera",
+- a sorted posting list of names per trigram of the space padded names. The names
+  sharing trigrams with the query are ranked by their Dice similarity, so
+  `instagarm` still finds "Instagram".
+
+`SearchIndex.search()` returns the name prefix matches first, then the word prefix
+matches, then the similar names. The cost of the prefix matches grows with the
+logarithm of the number of names, that of the similar names with the number of
+names sharing a trigram with the query.
+
+The ETL (see `playstore.etl`) writes the index next to the columnar cache after
+every run, with the size and modification time of the CSV it was built from.
+`search_index_for()` loads it with the dataset, or builds it if there is no fresh
+copy, from the loaded frame or from the SQLite copy (see `playstore.sqlstore`).
+Build it and try a query with:
+
+```bash
+python -m playstore.search instagarm
+```
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `re`: Word starts of the names.
+- `json`: Reading the manifest and the name lists.
+- `time`: Timing the command line queries.
+- `bisect`: Binary search of the sorted names and word starts.
+- `shutil`: Replacing the previous copy.
+- `logging`: Reporting an unwritable index directory.
+- `argparse`: Command line interface.
+- `tempfile`: Directory the index is written to before it is swapped in.
+- `itertools`: Flattening the posting lists.
+- `numpy`: Posting lists and similarity ranking.
+- `pandas`: Normalizing the names.
+- `playstore.cache`: File format and signatures.
+- `playstore.config`: Configuration for the application.
+- `playstore.data`: The cleaned dataset and its snapshots.
+"""
+
+import os
+import re
+import json
+import time
+import bisect
+import shutil
+import logging
+import argparse
+import tempfile
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from playstore.cache import MANIFEST_FILE, save_array, save_json, source_signature
+from playstore.config import CACHE_DIR, QUERY_BACKEND
+from playstore.data import CLEAN_DATA_FILE, current_snapshot
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+NGRAM = 3
+MAX_RESULTS = 10
+# Lowest Dice similarity of the trigrams of a similar name and of the query
+MIN_SIMILARITY = 0.4
+# Sorts after every character, so `prefix + _LAST` bounds the keys starting with `prefix`
+_LAST = chr(0x10FFFF)
+_ARRAYS = ("category_codes", "word_entries", "word_offsets", "gram_offsets", "gram_entries", "gram_counts")
+
+
+def normalize(names):
+    """
+    Case folds the Series `names` and replaces runs of punctuation and spaces by one space.
+    """
+    return names.str.casefold().str.replace(r"[\W_]+", " ", regex=True).str.strip()
+
+
+def _grams(key):
+    padded = f" {key} "
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+
+class SearchIndex:
+    """
+    Prefix and trigram index of the distinct (App, Category) pairs of the dataset.
+
+    Build it with `from_frame()` or load it with `read_search_index()`.
+
+    Attributes:
+    -----------
+    - `names`: App name of every entry, in the order of `keys`.
+    - `categories`: Category of every entry, as a `Categorical`.
+    - `keys`: Sorted normalized names, a list for the binary search.
+    - `word_entries`, `word_offsets`: Entry and offset of every word start after the
+      first, sorted by the rest of the key from there.
+    - `grams`: Sorted distinct trigrams of the padded keys.
+    - `gram_offsets`, `gram_entries`: Sorted entries of every trigram, stored as one
+      array ordered by trigram with the offset of every trigram.
+    - `gram_counts`: Number of distinct trigrams of every entry.
+    """
+
+    def __init__(self, names, categories, keys, word_entries, word_offsets, grams, gram_offsets, gram_entries, gram_counts):
+        self.names = names
+        self.categories = categories
+        self.keys = keys
+        self.word_entries = word_entries
+        self.word_offsets = word_offsets
+        self.grams = grams
+        self.gram_ids = {gram: i for i, gram in enumerate(grams)}
+        self.gram_offsets = gram_offsets
+        self.gram_entries = gram_entries
+        self.gram_counts = gram_counts
+
+    @classmethod
+    def from_frame(cls, frame):
+        """
+        Builds the index of the distinct (App, Category) pairs of `frame`.
+        """
+        pairs = frame[["App", "Category"]].drop_duplicates()
+        keys = normalize(pairs["App"].astype("str")).to_numpy(dtype=object)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order].tolist()
+
+        words = [(entry, match.end()) for entry, key in enumerate(keys) for match in re.finditer(" ", key)]
+        words.sort(key=lambda word: keys[word[0]][word[1]:])
+
+        postings = {}
+        gram_counts = np.empty(len(keys), dtype=np.int32)
+        for entry, key in enumerate(keys):
+            grams = _grams(key)
+            gram_counts[entry] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(entry)
+        grams = sorted(postings)
+
+        return cls(
+            names=pairs["App"].to_numpy(dtype=object)[order],
+            categories=pd.Categorical(pairs["Category"].to_numpy()[order]),
+            keys=keys,
+            word_entries=np.array([entry for entry, _ in words], dtype=np.int32),
+            word_offsets=np.array([offset for _, offset in words], dtype=np.int32),
+            grams=grams,
+            gram_offsets=np.concatenate([[0], np.cumsum([len(postings[gram]) for gram in grams])]).astype(np.int64),
+            gram_entries=np.fromiter(chain.from_iterable(postings[gram] for gram in grams), dtype=np.int32),
+            gram_counts=gram_counts,
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _prefixed(self, key):
+        start = bisect.bisect_left(self.keys, key)
+        return range(start, bisect.bisect_left(self.keys, key + _LAST, lo=start))
+
+    def _word_prefixed(self, key):
+        def rest(word):
+            return self.keys[self.word_entries[word]][self.word_offsets[word]:]
+
+        words = range(len(self.word_entries))
+        start = bisect.bisect_left(words, key, key=rest)
+        stop = bisect.bisect_left(words, key + _LAST, lo=start, key=rest)
+        return (int(self.word_entries[word]) for word in range(start, stop))
+
+    def similar(self, key, limit=MAX_RESULTS):
+        """
+        Returns up to `limit` entries whose trigrams are most similar to those of the normalized `key`.
+
+        Returns:
+        --------
+        A list of (entry, similarity) tuples, most similar first, all at least `MIN_SIMILARITY`.
+        """
+        grams = _grams(key)
+        ids = [self.gram_ids[gram] for gram in grams if gram in self.gram_ids]
+        if not ids:
+            return []
+        postings = np.concatenate([self.gram_entries[self.gram_offsets[i]:self.gram_offsets[i + 1]] for i in ids])
+        shared = np.bincount(postings, minlength=len(self))
+        # a name of n >= s trigrams sharing s of the q of the query has a similarity of at
+        # most 2s / (q + s), so names sharing fewer than this can never reach the minimum
+        candidates = np.flatnonzero(shared >= max(1, np.ceil(MIN_SIMILARITY * len(grams) / (2 - MIN_SIMILARITY))))
+        scores = 2 * shared[candidates] / (len(grams) + self.gram_counts[candidates])
+        keep = scores >= MIN_SIMILARITY
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > limit:
+            best = np.argpartition(-scores, limit)[:limit]
+            candidates, scores = candidates[best], scores[best]
+        # stable, so equally similar entries stay in name order
+        ranked = np.argsort(-scores, kind="stable")
+        return [(int(candidates[i]), float(scores[i])) for i in ranked]
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Finds the apps matching `query` as a name prefix, a word prefix or a similar name.
+
+        Parameters:
+        -----------
+        - `query`: Text typed by the user.
+        - `limit`: Maximum number of results.
+
+        Returns:
+        --------
+        A list of up to `limit` dicts with the `App`, its `Category` and the `match`:
+        `prefix`, `word` or `similar`. Prefix and word matches are in name order.
+        """
+        key = normalize(pd.Series([query], dtype="str"))[0]
+        if not key:
+            return []
+
+        results, seen = [], set()
+
+        def add(entries, match):
+            for entry in entries:
+                if len(results) >= limit:
+                    return
+                if entry not in seen:
+                    seen.add(entry)
+                    results.append({"App": self.names[entry], "Category": self.categories[entry], "match": match})
+
+        add(self._prefixed(key), "prefix")
+        add(self._word_prefixed(key), "word")
+        if len(results) < limit:
+            add((entry for entry, _ in self.similar(key, limit + len(results))), "similar")
+        return results
+
+    def write(self, directory, signature):
+        """
+        Writes the index to `directory`, replacing a previous copy, with the `signature` of its source CSV.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        building = tempfile.mkdtemp(prefix=".search-", dir=parent)
+        try:
+            save_json(os.path.join(building, "names.json"), self.names.tolist())
+            save_json(os.path.join(building, "categories.json"), self.categories.categories.tolist())
+            save_json(os.path.join(building, "keys.json"), self.keys)
+            save_json(os.path.join(building, "grams.json"), self.grams)
+            for name in _ARRAYS:
+                array = self.categories.codes if name == "category_codes" else getattr(self, name)
+                save_array(os.path.join(building, f"{name}.npy"), array)
+            save_json(os.path.join(building, MANIFEST_FILE), {
+                "format": FORMAT_VERSION,
+                "signature": signature,
+                "entries": len(self),
+            })
+
+            previous = f"{building}.old"
+            if os.path.exists(directory):
+                os.replace(directory, previous)
+            os.replace(building, directory)
+            shutil.rmtree(previous, ignore_errors=True)
+        finally:
+            shutil.rmtree(building, ignore_errors=True)
+
+
+def search_dir_for(source):
+    """
+    Returns the directory of the search index of the CSV file `source`.
+    """
+    return os.path.join(CACHE_DIR, f"{os.path.splitext(os.path.basename(source))[0]}.search")
+
+
+def read_search_index(source=CLEAN_DATA_FILE, directory=None, signature=None):
+    """
+    Loads the search index of `source`, or returns `None` if it is missing or stale.
+
+    Parameters:
+    -----------
+    - `source`: Cleaned CSV file the index was built from.
+    - `directory`: Directory of the index, defaults to `search_dir_for(source)`.
+    - `signature`: Signature the index must have been built from, defaults to the current one of `source`.
+    """
+    directory = directory or search_dir_for(source)
+
+    def load_json(name):
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            return json.load(f)
+
+    try:
+        manifest = load_json(MANIFEST_FILE)
+        if manifest.get("format") != FORMAT_VERSION:
+            return None
+        if manifest.get("signature") != (signature or source_signature(source)):
+            return None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r").view(np.ndarray) for name in _ARRAYS}
+        categories = pd.Index(load_json("categories.json"), dtype="str")
+        return SearchIndex(
+            names=np.array(load_json("names.json"), dtype=object),
+            categories=pd.Categorical.from_codes(arrays.pop("category_codes"), categories=categories),
+            keys=load_json("keys.json"),
+            grams=load_json("grams.json"),
+            **arrays,
+        )
+    except (OSError, ValueError):
+        return None
+
+
+def write_search_index(source=CLEAN_DATA_FILE, directory=None):
+    """
+    Builds the search index of the cleaned CSV `source` and writes it to `directory`.
+
+    Returns:
+    --------
+    The written `SearchIndex`.
+    """
+    signature = source_signature(source)
+    frame = pd.read_csv(source, usecols=["App", "Category"], dtype={"App": "str", "Category": "category"})
+    index = SearchIndex.from_frame(frame)
+    index.write(directory or search_dir_for(source), signature)
+    return index
+
+
+def search_index_for(snapshot):
+    """
+    Returns the `SearchIndex` of the dataset `snapshot`, loading or building it on first use.
+
+    A missing or stale index is built from the loaded frame, or from the SQLite copy
+    with `QUERY_BACKEND = "sqlite"` so the rows are not loaded into memory. It is
+    written for the next process, unless the cache directory is not writable.
+    """
+    def build(snapshot):
+        directory = search_dir_for(snapshot.path)
+        index = read_search_index(snapshot.path, directory, snapshot.signature)
+        if index is None:
+            if QUERY_BACKEND == "sqlite":
+                from playstore.sqlstore import app_pairs
+                index = SearchIndex.from_frame(app_pairs(snapshot))
+            else:
+                index = SearchIndex.from_frame(snapshot.frame)
+            try:
+                index.write(directory, snapshot.signature)
+            except OSError as e:
+                logger.warning("Could not write the search index: %s", e)
+        return index
+    return snapshot.derived("search", build)
+
+
+def get_search_index():
+    """
+    Returns the `SearchIndex` of the current dataset snapshot.
+    """
+    return search_index_for(current_snapshot())
+
+
+def main(argv=None):
+    """
+    Command line entry point that writes the search index and runs a query on it.
+    """
+    parser = argparse.ArgumentParser(description="Build the app search index and query it.")
+    parser.add_argument("query", nargs="?", help="text to search for")
+    parser.add_argument("--source", default=CLEAN_DATA_FILE, help="cleaned CSV file")
+    parser.add_argument("--force", action="store_true", help="rewrite even if the index is fresh")
+    parser.add_argument("--limit", type=int, default=MAX_RESULTS, help="maximum number of results")
+    args = parser.parse_args(argv)
+
+    index = None if args.force else read_search_index(args.source)
+    if index is None:
+        start = time.perf_counter()
+        index = write_search_index(args.source)
+        print(f"Indexed {len(index)} apps in {time.perf_counter() - start:.2f} s to: {search_dir_for(args.source)}")
+    else:
+        print(f"Search index of {args.source} is up to date.")
+
+    if args.query:
+        start = time.perf_counter()
+        results = index.search(args.query, args.limit)
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.2f} ms")
+        for result in results:
+            print(f"{result['match']:>8}  {result['App']}  ({result['Category']})")
+
+
+if __name__ == "__main__":
+    main()
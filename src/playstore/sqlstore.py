@@ -0,0 +1,231 @@
+"""
+SQLite Query Backend
+====================
+
+Out-of-core aggregation of the cleaned dataset in an indexed SQLite copy.
+
+With the default `QUERY_BACKEND = "pandas"` in `playstore.config`, the aggregate cube
+the dashboard callbacks answer from is built from the rows held in memory. With
+`QUERY_BACKEND = "sqlite"` it is built by a single `GROUP BY` query on an SQLite
+copy of the CSV instead, so the rows never have to fit into the memory of a worker:
+
+- `write_database()` streams the CSV in chunks of `CHUNK_ROWS` rows into the `apps`
+  table and indexes it. The `apps_cube` index holds the cube dimensions, `Rating`
+  and `Price`, so the aggregation reads the index in group order without sorting
+  and without touching the table.
+- `cube_cells()` returns the cells of `playstore.aggregates.AggregateCube`, which
+  then answers all filters and groupings of the callbacks as with pandas.
+- `app_pairs()` returns the distinct (App, Category) pairs the app search index
+  (see `playstore.search`) is built from.
+
+The measures are summed by SQLite, so averages can differ from the pandas backend
+in the last bits of a float, far below what the figures show.
+
+The copy lives in `CACHE_DIR` and records the size and modification time of the CSV.
+It is rebuilt on first use when stale, or ahead of deployment with:
+
+```bash
+python -m playstore.sqlstore
+```
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `json`: Storing the source signature.
+- `time`: Timing the build and the aggregation.
+- `sqlite3`: The embedded query engine.
+- `argparse`: Command line interface.
+- `contextlib`: Closing connections.
+- `pandas`: Chunked CSV reading and query results.
+- `playstore.aggregates`: Dimensions and measures of the cube.
+- `playstore.cache`: Source signatures.
+- `playstore.config`: Configuration for the application.
+- `playstore.data`: Snapshots of the cleaned dataset.
+- `playstore.etl`: Chunk size.
+- `playstore.schema`: Column types of the CSV and of the loaded frame.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+from contextlib import closing
+
+import pandas as pd
+
+from playstore.aggregates import DIMENSIONS, MEASURES, RATING
+from playstore.cache import source_signature
+from playstore.config import CACHE_DIR
+from playstore.data import CLEAN_DATA_FILE, take_snapshot
+from playstore.etl import CHUNK_ROWS
+from playstore.schema import CSV_DTYPES, SCHEMA
+
+FORMAT_VERSION = 1
+TABLE = "apps"
+SQL_TYPES = {"float64": "REAL", "int64": "INTEGER", "str": "TEXT", "category": "TEXT"}
+# Covering index of the cube query, in its GROUP BY order
+CUBE_INDEX = (*DIMENSIONS, RATING, "Price")
+
+
+def database_file_for(source):
+    """
+    Returns the SQLite file holding the copy of the CSV file `source`.
+    """
+    return os.path.join(CACHE_DIR, f"{os.path.splitext(os.path.basename(source))[0]}.sqlite")
+
+
+def _connect(path, readonly=True):
+    if readonly:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=5)
+    return sqlite3.connect(path)
+
+
+def write_database(source=CLEAN_DATA_FILE, path=None, chunk_rows=CHUNK_ROWS):
+    """
+    Copies the cleaned CSV `source` into an indexed SQLite database.
+
+    Parameters:
+    -----------
+    - `source`: Cleaned CSV file.
+    - `path`: Target SQLite file, defaults to `database_file_for(source)`.
+    - `chunk_rows`: Number of CSV rows inserted at a time.
+
+    Returns:
+    --------
+    The number of rows copied.
+    """
+    path = path or database_file_for(source)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    signature = source_signature(source)
+    partial = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(partial):
+        os.remove(partial)
+
+    columns = ", ".join(f'"{name}" {SQL_TYPES[dtype]}' for name, dtype in CSV_DTYPES.items())
+    insert = f"INSERT INTO {TABLE} VALUES ({', '.join('?' * len(CSV_DTYPES))})"
+    dtypes = {name: "str" if dtype == "category" else dtype for name, dtype in CSV_DTYPES.items()}
+    rows = 0
+    try:
+        with closing(_connect(partial, readonly=False)) as conn:
+            # a half written file is discarded anyway, so skip the journal
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(f"CREATE TABLE {TABLE} ({columns})")
+            for chunk in pd.read_csv(source, dtype=dtypes, chunksize=chunk_rows):
+                # plain Python values, NaN is stored as NULL
+                conn.executemany(insert, chunk[list(CSV_DTYPES)].astype(object).to_numpy().tolist())
+                rows += len(chunk)
+            conn.execute(f"CREATE INDEX apps_cube ON {TABLE} ({', '.join(CUBE_INDEX)})")
+            conn.execute(f"CREATE INDEX apps_type_category ON {TABLE} (Type, Category)")
+            conn.execute("ANALYZE")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("format", str(FORMAT_VERSION)),
+                ("signature", json.dumps(signature, sort_keys=True)),
+                ("rows", str(rows)),
+            ])
+            conn.commit()
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return rows
+
+
+def read_signature(path):
+    """
+    Returns the signature of the CSV the database at `path` was copied from, or `None`.
+    """
+    try:
+        with closing(_connect(path)) as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+    except sqlite3.Error:
+        return None
+    if meta.get("format") != str(FORMAT_VERSION):
+        return None
+    return json.loads(meta["signature"])
+
+
+def database_for(snapshot):
+    """
+    Returns the SQLite copy of the dataset `snapshot`, writing it on first use if it is missing or stale.
+    """
+    def build(snapshot):
+        path = database_file_for(snapshot.path)
+        if read_signature(path) != snapshot.signature:
+            write_database(snapshot.path, path)
+        return path
+    return snapshot.derived("sqlite", build)
+
+
+def cube_cells(snapshot, dimensions=DIMENSIONS):
+    """
+    Aggregates the rows of the dataset `snapshot` into the cells of an `AggregateCube` in SQLite.
+
+    Returns:
+    --------
+    A DataFrame with the `dimensions`, `Rating` and the `MEASURES`, one row per cell.
+    """
+    keys = ", ".join([*dimensions, RATING])
+    query = f"""
+        SELECT {keys},
+               COUNT(*) AS apps,
+               COUNT(Rating) AS rating_count,
+               TOTAL(Rating) AS rating_sum,
+               TOTAL(Price) AS price_sum,
+               TOTAL(Price > 0) AS paid_apps,
+               TOTAL(CASE WHEN Price > 0 THEN Price ELSE 0 END) AS paid_price_sum
+        FROM {TABLE}
+        GROUP BY {keys}
+    """
+    with closing(_connect(database_for(snapshot))) as conn:
+        cells = pd.read_sql_query(query, conn)
+
+    types = {name: SCHEMA[name] for name in dimensions}
+    types.update({RATING: "float64", "apps": "int64", "rating_count": "int64", "paid_apps": "int64"})
+    return cells.astype(types)[[*dimensions, RATING, *MEASURES]]
+
+
+def app_pairs(snapshot):
+    """
+    Returns the distinct (App, Category) pairs of the dataset `snapshot`, read from SQLite.
+
+    The pairs come in the order of their first row, as `drop_duplicates()` keeps them.
+    """
+    query = f"""
+        SELECT App, Category
+        FROM {TABLE}
+        GROUP BY App, Category
+        ORDER BY MIN(rowid)
+    """
+    with closing(_connect(database_for(snapshot))) as conn:
+        pairs = pd.read_sql_query(query, conn)
+    return pairs.astype({"App": "str", "Category": SCHEMA["Category"]})
+
+
+def main(argv=None):
+    """
+    Command line entry point that writes the SQLite copy of the cleaned dataset.
+    """
+    parser = argparse.ArgumentParser(description="Copy the cleaned dataset into an indexed SQLite database.")
+    parser.add_argument("--source", default=CLEAN_DATA_FILE, help="cleaned CSV file")
+    parser.add_argument("--force", action="store_true", help="rewrite even if the copy is fresh")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="CSV rows inserted at a time")
+    args = parser.parse_args(argv)
+
+    path = database_file_for(args.source)
+    if args.force or read_signature(path) != source_signature(args.source):
+        start = time.perf_counter()
+        rows = write_database(args.source, path, args.chunk_rows)
+        print(f"Copied {rows} rows in {time.perf_counter() - start:.2f} s to: {path}")
+    else:
+        print(f"SQLite copy of {args.source} is up to date.")
+
+    start = time.perf_counter()
+    cells = cube_cells(take_snapshot(args.source))
+    print(f"Aggregated {len(cells)} cube cells in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
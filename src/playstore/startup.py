@@ -0,0 +1,195 @@
+"""
+Startup Report
+==============
+
+Import cost of the dashboard per module and its time to first response.
+
+The import cost is measured by importing `playstore.main` in a fresh interpreter
+with `python -X importtime`, which logs the time spent on every imported module,
+by itself (`self`) and including the modules it imported (`cumulative`). The report
+lists:
+
+- the time per top-level package, the sum of the `self` times of its modules, so
+  the packages add up to the whole import,
+- the most expensive modules by `cumulative` time, what deferring their import
+  would save.
+
+With `--serve`, the `dashboard` command is started on a free port, once preloading
+the data before forking and once with `--no-preload`, and the time until it first
+answers `/` and `/_dash-layout` is measured. Print the report, or write it as JSON
+to track it over time, with:
+
+```bash
+python -m playstore.startup
+python -m playstore.startup --serve --json > startup.json
+```
+
+Modules and Dependencies
+------------------------
+- `os`: Stopping the server process group.
+- `sys`: The running interpreter.
+- `json`: JSON output.
+- `time`: Timing the first response.
+- `signal`: Stopping the server.
+- `socket`: Finding a free port.
+- `argparse`: Command line interface.
+- `subprocess`: Fresh interpreters and the server process.
+- `urllib.request`: Polling the server.
+- `collections`: Summing the times per package.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import subprocess
+import urllib.request
+from collections import Counter
+
+PATHS = ("/", "/_dash-layout")
+
+
+def import_times(module="playstore.main"):
+    """
+    Imports `module` in a fresh interpreter and returns the import time of every module it loaded.
+
+    Returns:
+    --------
+    A list of dicts with the `module` name, its nesting `depth` (0 for `module` and
+    its parent packages) and its `self` and `cumulative` seconds, in the order the
+    imports finished. Modules the interpreter imports at startup are left out.
+    """
+    startup = {entry["module"] for entry in _importtime("pass")}
+    return [entry for entry in _importtime(f"import {module}") if entry["module"] not in startup]
+
+
+def _importtime(code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, check=True,
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("| imported package"):
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        entries.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self": int(own) / 1e6,
+            "cumulative": int(cumulative) / 1e6,
+        })
+    return entries
+
+
+def package_times(entries):
+    """
+    Sums the `self` times of the `entries` of `import_times()` per top-level package, most expensive first.
+    """
+    totals = Counter()
+    for entry in entries:
+        totals[entry["module"].split(".")[0]] += entry["self"]
+    return dict(totals.most_common())
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            response.read()
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def first_response(args=(), timeout=120):
+    """
+    Starts the `dashboard` with the extra command line `args` and times its first answers.
+
+    Returns:
+    --------
+    A dict with the seconds from starting the process until every path of `PATHS`
+    first answered, `None` for paths that did not answer within `timeout` seconds.
+    """
+    port = _free_port()
+    command = [sys.executable, "-m", "playstore.main", "--port", str(port), "--workers", "1", *args]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    seconds = dict.fromkeys(PATHS)
+    try:
+        for path in PATHS:
+            while time.perf_counter() - start < timeout and process.poll() is None:
+                if _get(f"http://127.0.0.1:{port}{path}"):
+                    seconds[path] = time.perf_counter() - start
+                    break
+                time.sleep(0.01)
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait()
+    return seconds
+
+
+def startup_report(module="playstore.main", serve=False):
+    """
+    Measures the import of `module` and, with `serve`, the first responses of the dashboard.
+
+    Returns:
+    --------
+    A dict with the `total` import seconds, the `packages` of `package_times()`, the
+    `modules` of `import_times()` and, with `serve`, the `first_response` seconds
+    per path with the data preloaded (`preload`) and without (`no_preload`).
+    """
+    entries = import_times(module)
+    report = {
+        "module": module,
+        "total": sum(entry["cumulative"] for entry in entries if entry["depth"] == 0),
+        "packages": package_times(entries),
+        "modules": entries,
+    }
+    if serve:
+        report["first_response"] = {
+            "preload": first_response(),
+            "no_preload": first_response(["--no-preload"]),
+        }
+    return report
+
+
+def main(argv=None):
+    """
+    Command line entry point that prints the startup report.
+    """
+    parser = argparse.ArgumentParser(description="Report the import cost and the first response time of the dashboard.")
+    parser.add_argument("--module", default="playstore.main", help="module whose import is measured")
+    parser.add_argument("--top", type=int, default=15, help="number of packages and modules listed")
+    parser.add_argument("--serve", action="store_true", help="also time the first responses of the dashboard")
+    parser.add_argument("--json", action="store_true", help="print the whole report as JSON")
+    args = parser.parse_args(argv)
+
+    report = startup_report(args.module, args.serve)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Importing {report['module']} takes {report['total'] * 1000:.0f} ms")
+    print("\nBy package (self time):")
+    for name, seconds in list(report["packages"].items())[:args.top]:
+        print(f"{seconds * 1000:9.1f} ms  {name}")
+    print("\nBy module (cumulative time):")
+    modules = sorted((entry for entry in report["modules"] if entry["depth"]), key=lambda entry: entry["cumulative"], reverse=True)
+    for entry in modules[:args.top]:
+        print(f"{entry['cumulative'] * 1000:9.1f} ms  {entry['module']}")
+    for mode, seconds in report.get("first_response", {}).items():
+        answers = ", ".join(f"{path} {'-' if value is None else f'{value:.2f} s'}" for path, value in seconds.items())
+        print(f"\nFirst response ({mode.replace('_', '-')}): {answers}")
+
+
+if __name__ == "__main__":
+    main()
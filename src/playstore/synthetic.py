@@ -0,0 +1,451 @@
+"""
+Synthetic Data Generator
+========================
+
+Streams synthetic Play Store datasets of any size for load and scale testing.
+
+The generator is a smoothed bootstrap of the cleaned dataset: every synthetic app
+starts from an app of the dataset drawn at random, which keeps the joint
+distribution of its discrete columns (category, type, content rating, genre,
+installs, price, size and versions) exactly as observed. Its continuous columns
+are then moved by a random amount, so the output does not just repeat the rows of
+the dataset:
+
+- `Rating` by a normal step, rounded to a tenth and kept within 1 to 5,
+- `Reviews` by a log-normal factor, capped by the installs unless the drawn app
+  already had more reviews than installs,
+- the update date by a normal number of days, reflected into the observed date range.
+
+The widths of the steps are learned from the dataset with Silverman's rule, the
+reviews relative to the mean of their installs bucket. App names are combinations
+of the words of the real names of the same category, with the word counts of
+those names, from a pool of `NAMES_PER_CATEGORY` names per category.
+
+Rows are generated in chunks of `playstore.etl.CHUNK_ROWS` rows by a process pool,
+each chunk from its own random stream derived from the seed and the chunk number,
+so the same source, seed, size and format always give the same bytes, whatever
+the number of workers. Every chunk is formatted as CSV in its worker from
+pre-formatted pieces of the drawn apps, and the chunks are written in order while
+at most two per worker are in flight. Datasets larger than memory are streamed.
+
+Two formats are written:
+
+- `cleaned`: the columns of the cleaned dataset (`playstore.etl.COLUMNS`),
+- `raw`: the columns of the raw dumps, e.g. `19M`, `10,000+`, `$4.99` and
+  `January 7, 2018`, which `playstore.etl` cleans back into the same values.
+  The raw genre is the first genre only.
+
+```bash
+python -m playstore.synthetic --rows 100m --output data/raw/synthetic.csv --format raw
+python -m playstore.synthetic --rows 1m --seed 7 | head
+```
+
+Modules and Dependencies
+------------------------
+- `os`: File system operations.
+- `sys`: Writing to standard output.
+- `time`: Measuring the run time.
+- `argparse`: Command line interface.
+- `collections`: The chunks in flight.
+- `concurrent.futures`: The worker process pool.
+- `dataclasses`: The fitted model.
+- `itertools`: The first chunks in flight.
+- `numpy`: Random streams and drawing the apps.
+- `pandas`: Reading the dataset and formatting the dates.
+- `playstore.data`: Path of the cleaned dataset.
+- `playstore.etl`: Columns and chunk size of the cleaned dataset.
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from playstore.data import CLEAN_DATA_FILE
+from playstore.etl import CHUNK_ROWS, COLUMNS
+
+SEED = 42
+FORMATS = ("cleaned", "raw")
+UNITS = {"k": 10 ** 3, "m": 10 ** 6, "b": 10 ** 9}
+NAMES_PER_CATEGORY = 4096
+# Columns of the raw dumps, in their order
+RAW_COLUMNS = [
+    "App", "Category", "Rating", "Reviews", "Size", "Installs", "Type", "Price", "Content Rating",
+    "Genres", "Last Updated", "Current Ver", "Android Ver",
+]
+# Columns of the drawn app between `Reviews` and the date, and after the date
+CLEANED_MIDDLE = ["Size", "Installs", "Type", "Price", "Content_Rating", "Genres", "Current_Ver", "Android_Ver"]
+CLEANED_TAIL = ["Android_Ver_Min", "Android_Ver_Max", "Android_Ver_Flag", "Current_Ver_Num", "Current_Ver_Flag"]
+RAW_MIDDLE = ["Size", "Installs", "Type", "Price", "Content_Rating", "Genres"]
+RAW_TAIL = ["Current_Ver", "Android_Ver"]
+
+
+@dataclass(frozen=True)
+class SyntheticModel:
+    """
+    Distributions of the cleaned dataset learned by `fit_model()`.
+
+    Attributes:
+    -----------
+    - `rows`: The apps of the dataset as their CSV text.
+    - `rating`: Rating of every app.
+    - `reviews`: Reviews of every app.
+    - `installs`: Installs of every app.
+    - `days`: Update date of every app, in days since 1970-01-01.
+    - `categories`: The distinct categories.
+    - `category_codes`: Position of the category of every app in `categories`.
+    - `words`: Words of the app names of every category, once per occurrence.
+    - `word_counts`: Number of words of the app names of every category.
+    - `rating_width`: Standard deviation of the rating step.
+    - `reviews_width`: Standard deviation of the step of the logarithm of the reviews.
+    - `days_width`: Standard deviation of the date step in days.
+    """
+    rows: pd.DataFrame
+    rating: np.ndarray
+    reviews: np.ndarray
+    installs: np.ndarray
+    days: np.ndarray
+    categories: tuple
+    category_codes: np.ndarray
+    words: dict
+    word_counts: dict
+    rating_width: float
+    reviews_width: float
+    days_width: float
+
+
+def parse_rows(rows):
+    """
+    Converts a number of rows like `10k`, `1m` or `2.5b` into an integer.
+    """
+    rows = rows.strip().lower().replace("_", "")
+    if rows[-1:] in UNITS:
+        return int(float(rows[:-1]) * UNITS[rows[-1]])
+    return int(rows)
+
+
+def _silverman(values):
+    """
+    Kernel width of Silverman's rule of thumb for the sample `values`.
+    """
+    quartiles = np.percentile(values, [25, 75])
+    spread = min(np.std(values, ddof=1), (quartiles[1] - quartiles[0]) / 1.34)
+    return float(1.06 * spread * len(values) ** -0.2)
+
+
+def fit_model(source=CLEAN_DATA_FILE):
+    """
+    Learns the distributions of the cleaned CSV `source` for generating synthetic data.
+
+    Returns:
+    --------
+    A `SyntheticModel`.
+    """
+    # plain text columns, so the drawn values are written back exactly as read
+    rows = pd.read_csv(source, dtype=str, keep_default_na=False)
+    rating = rows["Rating"].astype("float64").to_numpy()
+    reviews = rows["Reviews"].astype("int64").to_numpy()
+    installs = rows["Installs"].astype("int64").to_numpy()
+    updated = pd.to_datetime(
+        rows[["Updated_Year", "Updated_Month", "Updated_Day"]].astype("int64")
+        .set_axis(["year", "month", "day"], axis=1)
+    )
+    days = ((updated - pd.Timestamp(0)) // pd.Timedelta(days=1)).to_numpy()
+
+    log_reviews = pd.Series(np.log1p(reviews))
+    codes, categories = pd.factorize(rows["Category"])
+    names = rows["App"].str.split()
+    words, word_counts = {}, {}
+    for code, category in enumerate(categories):
+        category_names = names[codes == code]
+        # without stray separators like "-" or "&", which look odd at the start of a name
+        words[category] = tuple(word for name in category_names for word in name if any(map(str.isalnum, word))) or ("App",)
+        word_counts[category] = category_names.str.len().clip(lower=1).to_numpy()
+
+    return SyntheticModel(
+        rows=rows,
+        rating=rating,
+        reviews=reviews,
+        installs=installs,
+        days=days,
+        categories=tuple(categories),
+        category_codes=codes,
+        words=words,
+        word_counts=word_counts,
+        rating_width=_silverman(rating),
+        reviews_width=_silverman(log_reviews - log_reviews.groupby(installs).transform("mean")),
+        days_width=_silverman(days),
+    )
+
+
+def draw(model, rows, rng):
+    """
+    Draws `rows` synthetic apps from `model` with the random generator `rng`.
+
+    Returns:
+    --------
+    A dict of arrays: the position of the drawn app of the dataset (`app`), the
+    rating in tenths (`rating`), the `reviews`, the update date in days since
+    1970-01-01 (`days`) and the number of the name within the names of its
+    category (`name`).
+    """
+    app = rng.integers(0, len(model.rows), rows)
+
+    rating = np.rint((model.rating[app] + rng.normal(0, model.rating_width, rows)) * 10)
+    rating = rating.clip(10, 50).astype("int64")
+
+    reviews = np.rint(np.expm1(np.log1p(model.reviews[app]) + rng.normal(0, model.reviews_width, rows)))
+    reviews = np.minimum(reviews, np.maximum(model.reviews[app], model.installs[app])).astype("int64")
+
+    first, last = int(model.days.min()), int(model.days.max())
+    days = np.rint(model.days[app] + rng.normal(0, model.days_width, rows)).astype("int64")
+    days = np.where(days > last, 2 * last - days, days)
+    days = np.where(days < first, 2 * first - days, days).clip(first, last)
+
+    return {
+        "app": app,
+        "rating": rating,
+        "reviews": reviews,
+        "days": days,
+        "name": rng.integers(0, NAMES_PER_CATEGORY, rows),
+    }
+
+
+def _quote(text):
+    """
+    `text` as a CSV field, quoted only if needed.
+    """
+    if any(char in text for char in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def _fields(frame):
+    """
+    The CSV text of the columns of every row of `frame`, without line ends.
+    """
+    return np.array([",".join(map(_quote, row)) for row in frame.itertuples(index=False)], dtype=object)
+
+
+def _encode(texts):
+    """
+    The `texts` encoded as UTF-8, as an array for taking the pieces of the drawn apps.
+    """
+    return np.array([text.encode("utf-8") for text in texts], dtype=object)
+
+
+def _raw_size(size):
+    size = float(size)
+    return f"{size / 1e6:g}M" if size >= 1e6 else f"{size / 1e3:g}k"
+
+
+def _raw_price(price):
+    price = float(price)
+    return f"${price:g}" if price else "0"
+
+
+class _Formatter:
+    """
+    Formats the apps drawn from a model as CSV lines of one format.
+
+    Every line is joined from pre-formatted, UTF-8 encoded pieces: the name with
+    the category of the drawn app, the rating, the reviews, the columns of the
+    drawn app up to the date, the date and the columns after it. Only the reviews
+    are formatted per row.
+    """
+
+    def __init__(self, model, format, seed):
+        rows = model.rows
+        if format == "raw":
+            rows = rows.assign(
+                Size=rows["Size"].map(_raw_size),
+                Installs=rows["Installs"].astype("int64").map("{:,}+".format),
+                Price=rows["Price"].map(_raw_price),
+            )
+            middle, tail = RAW_MIDDLE, RAW_TAIL
+        else:
+            middle, tail = CLEANED_MIDDLE, CLEANED_TAIL
+
+        self.middle = _encode("," + _fields(rows[middle]) + ",")
+        self.tail = _encode("," + _fields(rows[tail]) + "\n")
+        self.rating = _encode([f"{tenths / 10:.1f}," for tenths in range(51)])
+
+        first, last = int(model.days.min()), int(model.days.max())
+        dates = pd.to_datetime(np.arange(first, last + 1), unit="D")
+        if format == "raw":
+            # "January 7, 2018", without the zero padding of %d
+            dates = '"' + dates.strftime("%B ") + dates.day.astype(str) + dates.strftime(', %Y"')
+        else:
+            dates = dates.day.astype(str) + "," + dates.month.astype(str) + "," + dates.year.astype(str)
+        self.first_day = first
+        self.dates = _encode(dates)
+
+        # the same names in every worker, as they depend on the seed only
+        rng = np.random.default_rng([seed, 2 ** 32])
+        names = []
+        for category in model.categories:
+            words = model.words[category]
+            ends = np.cumsum(rng.choice(model.word_counts[category], NAMES_PER_CATEGORY)).tolist()
+            picks = [words[pick] for pick in rng.integers(0, len(words), ends[-1]).tolist()]
+            suffix = "," + _quote(category) + ","
+            names.extend(
+                _quote(" ".join(picks[start:end])) + suffix for start, end in zip([0, *ends[:-1]], ends)
+            )
+        self.names = _encode(names)
+        self.name_offsets = model.category_codes * NAMES_PER_CATEGORY
+
+    def format(self, drawn):
+        """
+        The UTF-8 encoded CSV lines of the apps `drawn` by `draw()`.
+        """
+        app = drawn["app"]
+        columns = (
+            self.names[self.name_offsets[app] + drawn["name"]].tolist(),
+            self.rating[drawn["rating"]].tolist(),
+            map(b"%d".__mod__, drawn["reviews"].tolist()),
+            self.middle[app].tolist(),
+            self.dates[drawn["days"] - self.first_day].tolist(),
+            self.tail[app].tolist(),
+        )
+        # the pieces of all lines interleaved, so they are joined at once
+        pieces = [None] * (len(columns) * len(app))
+        for position, column in enumerate(columns):
+            pieces[position::len(columns)] = column
+        return b"".join(pieces)
+
+
+def header(format):
+    """
+    The CSV header line of `format`, encoded as UTF-8.
+    """
+    return (",".join(RAW_COLUMNS if format == "raw" else COLUMNS) + "\n").encode("utf-8")
+
+
+# State of a generating process, set by `_start_worker()`
+_worker = {}
+
+
+def _start_worker(model, format, seed):
+    _worker.update(model=model, formatter=_Formatter(model, format, seed), seed=seed)
+
+
+def _generate_chunk(index, rows):
+    """
+    Draws and formats chunk `index` of `rows` rows; runs in a worker.
+    """
+    rng = np.random.default_rng([_worker["seed"], index])
+    return _worker["formatter"].format(draw(_worker["model"], rows, rng))
+
+
+def generate(rows, model=None, seed=SEED, format="cleaned", workers=None):
+    """
+    Generates a synthetic dataset of `rows` rows as a stream of CSV bytes.
+
+    Parameters:
+    -----------
+    - `rows`: Number of rows to generate.
+    - `model`: `SyntheticModel` to draw from, fitted to the cleaned dataset by default.
+    - `seed`: Seed of the random streams.
+    - `format`: `cleaned` or `raw`, see the module documentation.
+    - `workers`: Number of worker processes, by default one per CPU; with 1, the
+      rows are generated in the calling process.
+
+    Returns:
+    --------
+    An iterator of `bytes`, the header followed by the chunks in order.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}, expected one of {', '.join(FORMATS)}")
+    chunks = [(index, min(CHUNK_ROWS, rows - start)) for index, start in enumerate(range(0, rows, CHUNK_ROWS))]
+    return _generate(chunks, model or fit_model(), seed, format, workers or os.cpu_count() or 1)
+
+
+def _generate(chunks, model, seed, format, workers):
+    """
+    Yields the header and the `(index, rows)` `chunks` of `generate()` in order.
+    """
+    yield header(format)
+    if workers == 1:
+        _start_worker(model, format, seed)
+        for chunk in chunks:
+            yield _generate_chunk(*chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(model, format, seed)) as pool:
+        # at most two chunks per worker in flight, so memory does not grow with `rows`
+        pending = iter(chunks)
+        in_flight = deque(pool.submit(_generate_chunk, *chunk) for chunk in islice(pending, 2 * workers))
+        while in_flight:
+            data = in_flight.popleft().result()
+            chunk = next(pending, None)
+            if chunk:
+                in_flight.append(pool.submit(_generate_chunk, *chunk))
+            yield data
+
+
+def write_dataset(output, rows, source=CLEAN_DATA_FILE, seed=SEED, format="cleaned", workers=None):
+    """
+    Writes a synthetic dataset of `rows` rows learned from the cleaned CSV `source` to `output`.
+
+    The dataset is written to a temporary file next to `output`, which is moved into
+    place at the end so readers never see a half-written dataset. With `output` `-`,
+    it is written to standard output.
+
+    Returns:
+    --------
+    The seconds spent.
+    """
+    start = time.perf_counter()
+    chunks = generate(rows, fit_model(source), seed, format, workers)
+    if output == "-":
+        try:
+            for data in chunks:
+                sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+        except BrokenPipeError:
+            # the reader, e.g. `head`, has read all it wanted; nothing is left to flush at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return time.perf_counter() - start
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    partial = f"{output}.{os.getpid()}.tmp"
+    try:
+        with open(partial, "wb") as f:
+            for data in chunks:
+                f.write(data)
+        os.replace(partial, output)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    """
+    Command line entry point that writes a synthetic dataset.
+    """
+    parser = argparse.ArgumentParser(description="Generate a synthetic Google Play Store dataset.")
+    parser.add_argument("--rows", default="1m", help="number of rows, e.g. 10k, 1m or 100m")
+    parser.add_argument("--source", default=CLEAN_DATA_FILE, help="cleaned CSV file whose distributions are learned")
+    parser.add_argument("--seed", type=int, default=SEED, help="seed of the random streams")
+    parser.add_argument("--format", choices=FORMATS, default="cleaned", help="columns and values of the cleaned or the raw dataset")
+    parser.add_argument("--output", default="-", help="CSV file to write, - for standard output")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per CPU by default")
+    args = parser.parse_args(argv)
+
+    rows = parse_rows(args.rows)
+    seconds = write_dataset(args.output, rows, args.source, args.seed, args.format, args.workers)
+    if args.output != "-":
+        print(f"Generated {rows} rows in {seconds:.2f} s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+        print(f"Synthetic data saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
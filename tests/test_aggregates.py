@@ -0,0 +1,55 @@
+"""
+Tests of the paid-price averages against the original per-group lambda of the
+Category Analysis page.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from playstore.aggregates import average_paid_price, paid_price_by_category
+from playstore.data import CLEAN_DATA_FILE
+
+
+def original_average_prices(df, app_type):
+    """
+    The Average Price by Category values as computed before the vectorization.
+    """
+    filtered_df = df if app_type == 'all' else df[df['Type'] == app_type]
+    filtered_df = filtered_df.copy()
+    filtered_df['Price'] = np.where(filtered_df['Price'] == 0, 'Free apps', filtered_df['Price'])
+    avg_prices = filtered_df.groupby('Category')['Price'].apply(
+        lambda x: x[x != 'Free apps'].astype(float).mean() if len(x[x != 'Free apps']) > 0 else 'Free apps'
+    )
+    return pd.Series(
+        [float(val) if val != 'Free apps' else 0 for val in avg_prices.values],
+        index=pd.Index(avg_prices.index.astype(str), name="Category"),
+        name="Price",
+        dtype="float64",
+    )
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return pd.read_csv(CLEAN_DATA_FILE)
+
+
+@pytest.mark.parametrize("app_type", ["all", "Free", "Paid"])
+def test_average_paid_price_matches_original(rows, app_type):
+    filtered = rows if app_type == "all" else rows[rows["Type"] == app_type]
+    averages = average_paid_price(filtered)
+    averages.index = averages.index.astype(str)
+    pd.testing.assert_series_equal(averages, original_average_prices(rows, app_type), rtol=1e-12)
+
+
+@pytest.mark.parametrize("app_type", ["all", "Free", "Paid"])
+def test_paid_price_by_category_matches_original(rows, app_type):
+    averages = paid_price_by_category(**({} if app_type == "all" else {"Type": app_type}))
+    averages.index = pd.Index(averages.index.astype(str), name="Category")
+    pd.testing.assert_series_equal(averages, original_average_prices(rows, app_type), rtol=1e-12)
+
+
+def test_average_paid_price_does_not_modify_rows(rows):
+    before = rows.copy()
+    average_paid_price(rows)
+    pd.testing.assert_frame_equal(rows, before)
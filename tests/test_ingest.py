@@ -0,0 +1,81 @@
+"""
+Tests of the incremental ingestion on top of the committed cleaned dataset.
+"""
+
+import shutil
+
+import pandas as pd
+import pytest
+
+from playstore.data import CLEAN_DATA_FILE
+from playstore.etl import RAW_DATA_FILE, clean_dataset
+from playstore.ingest import KEY, ingest, read_state
+
+
+@pytest.fixture
+def store(tmp_path):
+    output = tmp_path / "cleaned.csv"
+    shutil.copy(CLEAN_DATA_FILE, output)
+    return str(output)
+
+
+@pytest.fixture
+def daily_file(tmp_path):
+    """
+    A daily dump of 200 known apps, one with more reviews, and 3 new apps.
+    """
+    raw = pd.read_csv(RAW_DATA_FILE, dtype=str)
+    day = raw.iloc[:200].copy()
+    day.loc[5, "Reviews"] = "999999"
+    new = day.iloc[:3].assign(App=day["App"].iloc[:3] + " Plus")
+    path = tmp_path / "day1.csv"
+    pd.concat([day, new]).to_csv(path, index=False)
+    return str(path), day.loc[5, "App"]
+
+
+def test_first_ingest_keeps_the_existing_rows(store, daily_file):
+    path, updated_app = daily_file
+    before = pd.read_csv(store)
+
+    stats = ingest(path, store)
+
+    after = pd.read_csv(store)
+    assert stats.rows_added == 3
+    assert len(after) == stats.rows
+    missing = before[KEY].merge(after[KEY], how="left", indicator=True)["_merge"] == "left_only"
+    assert not missing.any()
+    assert not after.duplicated(KEY).any()
+    assert stats.rows == before[KEY].drop_duplicates().shape[0] + 3
+    assert (after.loc[after["App"] == updated_app, "Reviews"] == 999999).sum() == 1
+    assert read_state(store)["rows"] == len(after)
+
+
+def test_reingesting_the_etl_input_changes_nothing(tmp_path):
+    # exact repeats are dropped by the ETL keeping the first, by the ingestion keeping the last
+    raw = tmp_path / "raw.csv"
+    pd.read_csv(RAW_DATA_FILE, dtype=str).drop_duplicates().to_csv(raw, index=False)
+    output = str(tmp_path / "cleaned.csv")
+    clean_dataset(str(raw), output, workers=1)
+
+    stats = ingest(str(raw), output)
+
+    assert stats.rows_updated == stats.rows_added == 0
+    assert stats.version == 0
+    stored = pd.read_csv(output)
+    assert len(stored) == stats.rows_unchanged == stats.rows
+    assert not stored.duplicated(KEY).any()
+
+
+def test_unindexable_store_is_left_untouched(store, daily_file):
+    path, _ = daily_file
+    pd.read_csv(store, nrows=1).assign(App="Broken\nApp").to_csv(store, mode="a", header=False, index=False)
+    with open(store, "rb") as f:
+        content = f.read()
+
+    with pytest.raises(ValueError, match="line breaks"):
+        ingest(path, store)
+    with open(store, "rb") as f:
+        assert f.read() == content
+
+    stats = ingest(path, store, rebuild=True)
+    assert stats.rows == stats.rows_added == len(pd.read_csv(store))
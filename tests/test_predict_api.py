@@ -0,0 +1,83 @@
+"""
+Tests of the validation of `POST /api/predict`.
+"""
+
+import json
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from playstore.config import FOREST_MAX_ROWS
+from playstore.predict import CATEGORY_MAPPING, LABELS, api, estimator_manager, get_model, predict_batch
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    return app.test_client()
+
+
+def post_json(client, body):
+    return client.post("/api/predict", data=json.dumps(body), content_type="application/json")
+
+
+@pytest.mark.parametrize("body", [
+    {"reviews": 5, "installs": [100], "categories": ["GAME"]},
+    {"reviews": [5], "installs": 100, "categories": ["GAME"]},
+    {"reviews": [5], "installs": [100], "categories": "GAME"},
+    {"reviews": [[5]], "installs": [100], "categories": ["GAME"]},
+])
+def test_scalar_or_nested_field_is_rejected(client, body):
+    response = post_json(client, body)
+    assert response.status_code == 400
+    assert "must be a list" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("value", [float("inf"), float("-inf"), float("nan")])
+def test_non_finite_number_is_rejected(client, value):
+    # json.dumps writes Infinity and NaN, which the endpoint parses back into floats
+    response = post_json(client, {"reviews": [5, value], "installs": [100, 100], "categories": ["GAME", "GAME"]})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Reviews must be a positive number."
+
+
+def test_length_mismatch_is_rejected(client):
+    response = post_json(client, {"reviews": [5, 6], "installs": [100], "categories": ["GAME", "GAME"]})
+    assert response.status_code == 400
+    assert "same length" in response.get_json()["error"]
+
+
+def test_csv_missing_column_is_rejected(client):
+    response = client.post("/api/predict", data="Reviews,Installs\n5,100\n", content_type="text/csv")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Missing CSV columns: Category"
+
+
+def test_valid_batch_is_scored(client):
+    response = post_json(client, {"reviews": [1500, 20], "installs": [50000, 100], "categories": ["GAME", 8]})
+    if response.status_code == 503:
+        pytest.skip("the prediction model is not available")
+    assert response.status_code == 200
+    predictions = json.loads(response.get_data(as_text=True))["predictions"]
+    assert len(predictions) == 2 and set(predictions) <= {"Low", "Medium", "High"}
+
+
+def test_large_batch_is_scored_like_the_compiled_forest():
+    try:
+        forest = get_model()
+        estimator_manager.get()
+    except OSError:
+        pytest.skip("the prediction model is not available")
+    rng = np.random.default_rng(0)
+    rows = FOREST_MAX_ROWS + 500
+    reviews = rng.integers(1, 10 ** 7, rows)
+    installs = rng.integers(1, 10 ** 9, rows)
+    categories = rng.integers(0, len(CATEGORY_MAPPING), rows)
+
+    predictions = predict_batch(reviews.tolist(), installs.tolist(), categories.tolist())
+
+    features = {"Reviews": reviews, "Installs": installs, "Category_encoded": categories}
+    expected = forest.predict(np.column_stack([features[name] for name in forest.feature_names_in_]).astype("float32"))
+    assert predictions.tolist() == np.array(LABELS)[expected.astype("int64")].tolist()
@@ -0,0 +1,34 @@
+"""
+Tests of the declared column types applied by `apply_schema()`.
+"""
+
+import pandas as pd
+import pytest
+
+from playstore.data import CLEAN_DATA_FILE
+from playstore.schema import CSV_DTYPES, apply_schema
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return pd.read_csv(CLEAN_DATA_FILE, dtype=CSV_DTYPES, nrows=100)
+
+
+def test_counts_past_32_bits_are_kept(rows):
+    rows = rows.copy()
+    rows.loc[0, "Installs"] = 5_000_000_000
+    rows.loc[1, "Reviews"] = 2**40
+
+    frame = apply_schema(rows)
+
+    assert frame.loc[0, "Installs"] == 5_000_000_000
+    assert frame.loc[1, "Reviews"] == 2**40
+    assert (frame["Installs"].astype("int64") == rows["Installs"]).all()
+
+
+def test_negative_counts_are_rejected(rows):
+    rows = rows.copy()
+    rows.loc[0, "Reviews"] = -1
+
+    with pytest.raises(ValueError, match="Reviews"):
+        apply_schema(rows)